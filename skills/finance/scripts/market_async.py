@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+market_async.py
+
+asyncio quote fetcher over one pooled HTTP client (httpx, keep-alive).
+
+Same pipeline as market_quote.fetch_quotes (cache, stale-while-revalidate,
+single-flight locks, spark batches, ranked providers with failover,
+enrichment), so --async returns what the default path would. HTTP providers
+(the stub, Yahoo chart/spark, ExchangeRate-API) are awaited on the event
+loop; yfinance, lock waits and cache file I/O run in worker threads.
+
+Usage:
+  python scripts/market_async.py AAPL MSFT ^GSPC USD/ZAR --concurrency 16
+  python scripts/market_quote.py AAPL MSFT USD/ZAR --async
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from urllib.parse import quote as urlquote
+
+import httpx
+
+import market_providers
+import market_quote as mq
+import market_ratelimit
+import market_replay
+from market_locks import FileLock
+
+YAHOO_CHART_URL = mq.YAHOO_CHART_URL
+USER_AGENT = mq.USER_AGENT
+quote_from_chart = mq.quote_from_chart
+DEFAULT_CONCURRENCY = 8
+
+
+def new_client(concurrency: int = DEFAULT_CONCURRENCY) -> httpx.AsyncClient:
+    """One pooled keep-alive client; connection limits follow the concurrency limit."""
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    return httpx.AsyncClient(
+        headers={"User-Agent": USER_AGENT},
+        limits=limits,
+        timeout=mq.HTTP_TIMEOUT_SECONDS,
+        transport=market_replay.httpx_transport(limits) if market_replay.active() else None,
+    )
+
+
+async def _get_json(
+    client: httpx.AsyncClient,
+    sem: asyncio.Semaphore,
+    provider: str,
+    url: str,
+    timeout: float = mq.HTTP_TIMEOUT_SECONDS,
+    retries: int = market_ratelimit.DEFAULT_RETRIES,
+    **params: Any,
+) -> Dict[str, Any]:
+    async def once() -> Dict[str, Any]:
+        async with sem:
+            r = await client.get(url, params=params or None, timeout=timeout)
+        # Yahoo answers unknown symbols with 404 and a JSON error body.
+        if r.status_code != 404:
+            r.raise_for_status()
+        return r.json()
+
+    return await market_ratelimit.call_async(provider, once, retries=retries)
+
+
+Fetcher = Callable[[str, float], Awaitable[Any]]
+
+
+def _fetchers(client: httpx.AsyncClient, sem: asyncio.Semaphore) -> Dict[str, Dict[str, Fetcher]]:
+    """
+    kind -> provider name -> coroutine fetch over the pooled client, for the
+    providers that are plain HTTP. The rest (yfinance) keep their blocking
+    fetch, which market_providers.call_async runs in a worker thread.
+    """
+
+    def chart(url: str, provider: str) -> Fetcher:
+        async def fetch(symbol: str, timeout: float) -> mq.Quote:
+            data = await _get_json(
+                client,
+                sem,
+                provider,
+                url.format(symbol=urlquote(symbol, safe="")),
+                timeout,
+                mq._provider_retries("stock"),
+                range="1d",
+                interval="1d",
+            )
+            q = quote_from_chart(symbol, data)
+            if provider == "stub":
+                q.source = "market_stub.py (local test data)"
+            return q
+
+        return fetch
+
+    def book(url: str, provider: str) -> Fetcher:
+        async def fetch(base: str, timeout: float) -> Dict[str, Any]:
+            data = await _get_json(client, sem, provider, url.format(base=base), timeout, mq._provider_retries("fx"))
+            return mq._parse_fx_book(base, data, provider)
+
+        return fetch
+
+    return {
+        "stock": {
+            "stub": chart(f"{mq.STUB_URL}/v8/finance/chart/{{symbol}}", "stub"),
+            "yahoo-chart": chart(YAHOO_CHART_URL, "yahoo"),
+        },
+        "fx": {"stub": book(f"{mq.STUB_URL}/v6/latest/{{base}}", "stub"), "er-api": book(mq.FX_LATEST_URL, "er-api")},
+    }
+
+
+async def _fetch_stock(fetchers: Dict[str, Dict[str, Fetcher]], symbol: str) -> mq.Quote:
+    """mq._fetch_stock_live over the async fetchers: ranked providers with failover, then cached."""
+    try:
+        q, _ = await market_providers.call_async(
+            "stock", symbol, mq.HTTP_TIMEOUT_SECONDS, answered=(mq.SymbolError,), fetchers=fetchers["stock"]
+        )
+    except mq.SymbolError as e:
+        error = await asyncio.to_thread(mq._symbol_error, symbol, str(e))
+        raise error from None
+    await asyncio.to_thread(mq._cache_stock, q)
+    return q
+
+
+async def _spark(
+    client: httpx.AsyncClient, sem: asyncio.Semaphore, url: str, provider: str, symbols: List[str]
+) -> Dict[str, mq.Quote]:
+    data = await _get_json(
+        client,
+        sem,
+        provider,
+        url,
+        retries=mq._provider_retries("stock"),
+        symbols=",".join(symbols),
+        range="1d",
+        interval="1d",
+    )
+    return await asyncio.to_thread(mq._quotes_from_spark, provider, symbols, data)
+
+
+async def _download_stocks(
+    client: httpx.AsyncClient,
+    sem: asyncio.Semaphore,
+    fetchers: Dict[str, Dict[str, Fetcher]],
+    symbols: List[str],
+    errors: Dict[str, str],
+) -> Dict[str, mq.Quote]:
+    """mq._download_stocks with every request in flight at once: spark chunks, then the ranked providers."""
+    out: Dict[str, mq.Quote] = {}
+    endpoint = mq._spark_endpoint() if len(symbols) > 1 else None
+    if endpoint:
+        chunks = [symbols[i : i + mq.SPARK_CHUNK] for i in range(0, len(symbols), mq.SPARK_CHUNK)]
+        batches = await asyncio.gather(*(_spark(client, sem, *endpoint, c) for c in chunks), return_exceptions=True)
+        for batch in batches:
+            # A failed chunk's symbols take the per-symbol path.
+            if not isinstance(batch, BaseException):
+                out.update(batch)
+
+    rest = [s for s in symbols if s not in out]
+    fetched = await asyncio.gather(*(_fetch_stock(fetchers, s) for s in rest), return_exceptions=True)
+    for symbol, res in zip(rest, fetched):
+        if isinstance(res, BaseException):
+            errors[symbol] = str(res)
+        else:
+            out[symbol] = res
+    return out
+
+
+def _release_all(locks: List[FileLock]) -> None:
+    for lock in locks:
+        lock.release()
+
+
+async def _fetch_stocks_many(
+    client: httpx.AsyncClient,
+    sem: asyncio.Semaphore,
+    fetchers: Dict[str, Dict[str, Fetcher]],
+    symbols: List[str],
+    errors: Dict[str, str],
+) -> Dict[str, mq.Quote]:
+    """mq._fetch_stocks_many: same cache, stale-while-revalidate and single-flight locks."""
+    out, misses = await asyncio.to_thread(mq._cached_stocks, symbols)
+    held, waiting, landed = await asyncio.to_thread(mq._claim_fetches, misses)
+    out.update(landed)
+    try:
+        out.update(await _download_stocks(client, sem, fetchers, [s for s in held if s not in out], errors))
+    finally:
+        await asyncio.to_thread(_release_all, list(held.values()))
+
+    # Symbols another process is fetching: wait on its lock in a thread, then read the cache.
+    refreshed = await asyncio.gather(
+        *(asyncio.to_thread(mq._refresh_stock, s) for s in waiting), return_exceptions=True
+    )
+    for symbol, res in zip(waiting, refreshed):
+        if isinstance(res, BaseException):
+            errors[symbol] = str(res)
+        else:
+            out[symbol] = res
+    return out
+
+
+async def _fetch_fx_book(fetchers: Dict[str, Dict[str, Fetcher]], base: str) -> Dict[str, Any]:
+    """mq._refresh_fx_book over the async fetchers, under the same single-flight lock."""
+    cache_key = f"fxbook_{base}"
+    lock = mq._flight_lock(cache_key)
+    if not await asyncio.to_thread(lock.acquire, False):
+        # Someone else is fetching this book: wait for it in a thread and read it back.
+        return await asyncio.to_thread(mq._refresh_fx_book, base)
+    try:
+        cached = await asyncio.to_thread(mq._cache_get, cache_key, mq.DEFAULT_TTL_SECONDS_FX)
+        if cached:
+            return cached
+        book, _ = await market_providers.call_async(
+            "fx", base, mq.HTTP_TIMEOUT_SECONDS, answered=(mq.SymbolError,), fetchers=fetchers["fx"]
+        )
+        await asyncio.to_thread(mq._cache_fx_book, base, book)
+        return book
+    finally:
+        await asyncio.to_thread(lock.release)
+
+
+async def _resolve_fx_books(
+    fetchers: Dict[str, Dict[str, Fetcher]], pairs: List[Tuple[str, str]], errors: Dict[str, str]
+) -> None:
+    """Make sure every pair can be served from cached books: the pivot first, then any base it lacks."""
+    ttl = mq.DEFAULT_TTL_SECONDS_FX + (mq.STALE_GRACE_SECONDS_FX if mq.STALE_WHILE_REVALIDATE else 0)
+    keys = [f"fxbook_{b}" for b, _ in pairs] + [f"fxbook_{mq.FX_PIVOT}"]
+    books = await asyncio.to_thread(mq._cache_get_many, keys, ttl)
+    pivot = books.get(f"fxbook_{mq.FX_PIVOT}")
+    if pivot is None and any(f"fxbook_{b}" not in books for b, _ in pairs):
+        try:
+            pivot = await _fetch_fx_book(fetchers, mq.FX_PIVOT)
+        except Exception as e:
+            for base, quote in pairs:
+                errors[f"{base}/{quote}"] = str(e)
+            return
+
+    rates = (pivot or {}).get("rates") or {}
+    direct = sorted({b for b, q in pairs if f"fxbook_{b}" not in books and not (rates.get(b) and q in rates)})
+    fetched = await asyncio.gather(*(_fetch_fx_book(fetchers, b) for b in direct), return_exceptions=True)
+    for base, res in zip(direct, fetched):
+        if isinstance(res, Exception):
+            for b, quote in pairs:
+                if b != base:
+                    continue
+                key = f"{b}/{quote}"
+                if isinstance(res, mq.SymbolError):
+                    # Remembered in the negative cache, as mq._fx_rate does.
+                    err = await asyncio.to_thread(mq._symbol_error, key, f"FX pair not supported by provider: {key}")
+                    errors[key] = str(err)
+                else:
+                    errors[key] = str(res)
+
+
+async def fetch_quotes(
+    symbols: List[str],
+    errors: Optional[Dict[str, str]] = None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    client: Optional[httpx.AsyncClient] = None,
+    cached_errors: Optional[Set[str]] = None,
+    enrich: Optional[bool] = None,
+) -> List[mq.Quote]:
+    """
+    Async counterpart of market_quote.fetch_quotes (same ordering/error contract).
+
+    At most `concurrency` provider requests are in flight at once, all over
+    one pooled client (pass `client` to reuse it across calls).
+    """
+    order: List[str] = []
+    seen = set()
+    stocks: List[str] = []
+    pairs: Dict[str, Tuple[str, str]] = {}
+    for raw in symbols:
+        s = raw.strip()
+        if not s or s in seen:
+            continue
+        seen.add(s)
+        order.append(s)
+        fx = mq._parse_fx_pair(s)
+        if fx:
+            pairs[s] = fx
+        else:
+            stocks.append(s)
+
+    failed = await asyncio.to_thread(mq._negative_hits, stocks + ["/".join(p) for p in pairs.values()])
+    remembered = set(failed)
+    stocks = [s for s in stocks if s not in remembered]
+    fx_pairs = [p for p in dict.fromkeys(pairs.values()) if "/".join(p) not in remembered]
+
+    sem = asyncio.Semaphore(max(1, concurrency))
+    owned = client is None
+    client = client or new_client(concurrency)
+    fetchers = _fetchers(client, sem)
+    try:
+        fx_errors: Dict[str, str] = {}
+        quotes, _ = await asyncio.gather(
+            _fetch_stocks_many(client, sem, fetchers, stocks, failed),
+            _resolve_fx_books(fetchers, fx_pairs, fx_errors),
+        )
+    finally:
+        if owned:
+            await client.aclose()
+
+    # Metadata and the pair quotes themselves come from the cache; the sync helpers do the rest.
+    resolved = await asyncio.to_thread(mq._enrich_many, quotes, mq.ENRICH if enrich is None else enrich)
+    failed.update(fx_errors)
+    fx_pairs = [p for p in fx_pairs if "/".join(p) not in fx_errors]
+    if fx_pairs:
+        resolved.update(await asyncio.to_thread(mq._fetch_fx_many, fx_pairs, failed))
+
+    out: List[mq.Quote] = []
+    for s in order:
+        key = "/".join(pairs[s]) if s in pairs else s
+        if key in resolved:
+            out.append(resolved[key])
+        elif key in remembered and errors is None:
+            raise mq.SymbolError(failed[key], cached=True)
+        elif errors is not None:
+            errors[s] = failed.get(key, "No quote returned")
+            if key in remembered and cached_errors is not None:
+                cached_errors.add(s)
+        else:
+            raise RuntimeError(failed.get(key, f"No quote returned for symbol: {s}"))
+    return out
+
+
+def fetch_quotes_sync(
+    symbols: List[str],
+    errors: Optional[Dict[str, str]] = None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    cached_errors: Optional[Set[str]] = None,
+    enrich: Optional[bool] = None,
+) -> List[mq.Quote]:
+    """Blocking wrapper for callers without an event loop (the CLIs)."""
+    return asyncio.run(
+        fetch_quotes(symbols, errors=errors, concurrency=concurrency, cached_errors=cached_errors, enrich=enrich)
+    )
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("symbols", nargs="+", metavar="symbol", help="Tickers and/or FX pairs")
+    ap.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Max in-flight provider requests")
+    ap.add_argument(
+        "--enrich",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="Fetch name/exchange metadata the quote lacks (off by default: only cached metadata is used)",
+    )
+    args = ap.parse_args()
+
+    errors: Dict[str, str] = {}
+    cached_errors: Set[str] = set()
+    quotes = fetch_quotes_sync(
+        args.symbols, errors=errors, concurrency=args.concurrency, cached_errors=cached_errors, enrich=args.enrich
+    )
+    print(json.dumps(mq.quote_results(args.symbols, quotes, errors, cached_errors), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
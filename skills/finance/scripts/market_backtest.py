@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+market_backtest.py
+
+Vectorized backtests of simple signals across a whole watchlist and a grid
+of parameters.
+
+Strategies (parameters are grid axes; every combination is run):
+  sma        long a symbol while its SMA(fast) is above its SMA(slow)
+             (--fast, --slow); capital is split equally across the symbols
+             with prices, a symbol's sleeve is in cash while its signal is off
+  momentum   every --rebalance bars, hold the --top symbols by trailing
+             --lookback-bar return, equally weighted
+
+Prices come from market_series.load_panel (the local store), aligned on
+date into one (bars x symbols) close matrix; a symbol's missing days carry
+its last close. Signals use closes up to the previous bar, so a position
+earns the bar after the signal. Portfolios are rebalanced to their target
+weights every bar (no drift); --cost-bps is charged on turnover.
+
+Every grid combination is one slice of a (combos x bars x symbols) weight
+array evaluated with NumPy; the grid is split into chunks run on --workers
+processes.
+
+Reported per combination, over the last --days (earlier history is warmup
+for the signals): total and annualized return, annualized volatility,
+Sharpe ratio (zero risk-free rate), max drawdown, annualized turnover and
+average exposure, plus an equal-weight buy-and-hold benchmark. JSON output.
+
+Usage:
+  python scripts/market_backtest.py AAPL MSFT NVDA AMZN --strategy sma --fast 10 20 50 --slow 100 200
+  python scripts/market_backtest.py AAPL MSFT NVDA AMZN GOOGL META --strategy momentum --lookback 63 126 252 --top 2 3
+  python scripts/market_backtest.py AAPL MSFT --days 3650 --cost-bps 5 --workers 4 --output bt.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import market_indicators
+import market_series
+
+STRATEGIES = ["sma", "momentum"]
+DEFAULT_GRID: Dict[str, Dict[str, List[int]]] = {
+    "sma": {"fast": [10, 20, 50], "slow": [50, 100, 200]},
+    "momentum": {"lookback": [63, 126, 252], "top": [1, 3, 5], "rebalance": [21]},
+}
+BARS_PER_YEAR = 252
+# Grid combinations evaluated together as one weight array (bounds memory per chunk).
+CHUNK_COMBOS = 16
+
+Combo = Dict[str, int]
+
+# Set in each worker by _init (and in-process when running serially).
+_PANEL: Dict[str, Any] = {}
+
+
+def panel(frames: Dict[str, pd.DataFrame]) -> Tuple[pd.DatetimeIndex, List[str], np.ndarray]:
+    """(dates, symbols, close matrix): rows = union of dates, NaN before a symbol's first bar."""
+    close = market_series.wide(frames, ["close"]).ffill()
+    return close.index, [c[: -len("_close")] for c in close.columns], close.to_numpy(dtype=float)
+
+
+def grid(strategy: str, params: Dict[str, List[int]]) -> List[Combo]:
+    """Every combination of the parameter lists; sma drops combinations with fast >= slow."""
+    names = list(DEFAULT_GRID[strategy])
+    combos = [dict(zip(names, values)) for values in itertools.product(*(params[n] for n in names))]
+    if strategy == "sma":
+        combos = [c for c in combos if c["fast"] < c["slow"]]
+    return combos
+
+
+def _shift(x: np.ndarray, fill: float = np.nan) -> np.ndarray:
+    out = np.full(x.shape, fill, dtype=x.dtype)
+    out[1:] = x[:-1]
+    return out
+
+
+def _per_available(signal: np.ndarray, available: np.ndarray) -> np.ndarray:
+    # Equal split of capital over the symbols that have a return this bar.
+    n = available.sum(axis=-1, keepdims=True)
+    return np.where(available, signal, 0.0) / np.maximum(n, 1)
+
+
+def _sma_weights(close: np.ndarray, available: np.ndarray, combos: List[Combo]) -> np.ndarray:
+    windows = sorted({c["fast"] for c in combos} | {c["slow"] for c in combos})
+    means = {n: market_indicators.sma(close, n) for n in windows}
+    # Signal known at the previous close; NaN comparisons (too little history) are False.
+    signal = np.stack([_shift(means[c["fast"]]) > _shift(means[c["slow"]]) for c in combos])
+    return _per_available(signal.astype(float), available[None])
+
+
+def _momentum_weights(close: np.ndarray, available: np.ndarray, combos: List[Combo]) -> np.ndarray:
+    rows = np.arange(len(close))
+    out = np.zeros((len(combos), *close.shape))
+    ranks: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+    for i, c in enumerate(combos):
+        lookback, top, every = c["lookback"], c["top"], max(c["rebalance"], 1)
+        if lookback not in ranks:
+            past = np.full(close.shape, np.nan)
+            if lookback < len(close):
+                past[lookback:] = close[:-lookback]
+            score = _shift(close / past - 1.0)
+            # Rank 0 = best trailing return; symbols without a score rank last.
+            order = np.argsort(np.where(np.isnan(score), np.inf, -score), axis=1, kind="stable")
+            ranks[lookback] = (np.argsort(order, axis=1, kind="stable"), score)
+        rank, score = ranks[lookback]
+        # Unscored symbols are never held, even when top exceeds the number of symbols.
+        held = (rank < top) & ~np.isnan(score)
+        # Hold what was picked at the latest rebalance bar.
+        held = held[rows // every * every]
+        out[i] = held / np.maximum(held.sum(axis=1, keepdims=True), 1)
+    return np.where(available[None], out, 0.0)
+
+
+def _init(close: np.ndarray, start_row: int, cost: float) -> None:
+    _PANEL.update(close=close, start_row=start_row, cost=cost)
+
+
+def _metrics(weights: np.ndarray, returns: np.ndarray, start_row: int, cost: float) -> Dict[str, np.ndarray]:
+    """Per-combination statistics over rows start_row.. for weights (combos x bars x symbols)."""
+    previous = np.zeros_like(weights)
+    previous[:, 1:] = weights[:, :-1]
+    turnover = np.abs(weights - previous).sum(axis=2)[:, start_row:]
+    daily = (weights * returns[None]).sum(axis=2)[:, start_row:] - cost * turnover
+    equity = np.cumprod(1.0 + daily, axis=1)
+    total = equity[:, -1] - 1.0
+    years = daily.shape[1] / BARS_PER_YEAR
+    with np.errstate(divide="ignore", invalid="ignore"):
+        vol = daily.std(axis=1, ddof=1) * np.sqrt(BARS_PER_YEAR)
+        sharpe = np.where(vol > 0, daily.mean(axis=1) * BARS_PER_YEAR / vol, np.nan)
+    return {
+        "total_return": total,
+        "annual_return": (1.0 + total) ** (1.0 / years) - 1.0,
+        "annual_volatility": vol,
+        "sharpe": sharpe,
+        "max_drawdown": (equity / np.maximum.accumulate(equity, axis=1) - 1.0).min(axis=1),
+        "annual_turnover": turnover.mean(axis=1) * BARS_PER_YEAR,
+        "exposure": weights[:, start_row:].sum(axis=2).mean(axis=1),
+    }
+
+
+def _returns(close: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    prev = _shift(close)
+    available = ~np.isnan(close) & ~np.isnan(prev)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = np.where(available, close / prev - 1.0, 0.0)
+    return returns, available
+
+
+def _run_chunk(strategy: str, combos: List[Combo]) -> List[Dict[str, Optional[float]]]:
+    close, start_row, cost = _PANEL["close"], _PANEL["start_row"], _PANEL["cost"]
+    returns, available = _returns(close)
+    build = _sma_weights if strategy == "sma" else _momentum_weights
+    stats = _metrics(build(close, available, combos), returns, start_row, cost)
+    return [{k: _value(v[i]) for k, v in stats.items()} for i in range(len(combos))]
+
+
+def _value(x: float) -> Optional[float]:
+    return None if not np.isfinite(x) else round(float(x), 6)
+
+
+def backtest(
+    close: np.ndarray, start_row: int, strategy: str, combos: List[Combo], cost_bps: float = 0.0, workers: int = 1
+) -> List[Dict[str, Any]]:
+    """Statistics for every combo (in order), each {**combo, total_return, ...}."""
+    cost = cost_bps / 10_000.0
+    chunks = [combos[i : i + CHUNK_COMBOS] for i in range(0, len(combos), CHUNK_COMBOS)]
+    if workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(chunks)), initializer=_init, initargs=(close, start_row, cost)
+        ) as pool:
+            parts = list(pool.map(_run_chunk, [strategy] * len(chunks), chunks))
+    else:
+        _init(close, start_row, cost)
+        parts = [_run_chunk(strategy, chunk) for chunk in chunks]
+    return [{**combo, **stats} for combo, stats in zip(combos, itertools.chain.from_iterable(parts))]
+
+
+def benchmark(close: np.ndarray, start_row: int) -> Dict[str, Optional[float]]:
+    """Equal-weight buy-and-hold of every symbol with prices (rebalanced daily)."""
+    returns, available = _returns(close)
+    weights = _per_available(np.ones_like(close), available)[None]
+    stats = _metrics(weights, returns, start_row, 0.0)
+    return {k: _value(v[0]) for k, v in stats.items()}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("symbols", nargs="+", metavar="symbol", help="Ticker(s)")
+    ap.add_argument("--strategy", choices=STRATEGIES, default="sma")
+    ap.add_argument("--days", type=int, default=1825, help="Evaluation window in days (signals warm up before it)")
+    ap.add_argument("--fast", type=int, nargs="+", help=f"sma: fast windows (default {DEFAULT_GRID['sma']['fast']})")
+    ap.add_argument("--slow", type=int, nargs="+", help=f"sma: slow windows (default {DEFAULT_GRID['sma']['slow']})")
+    ap.add_argument("--lookback", type=int, nargs="+", help="momentum: trailing-return bars")
+    ap.add_argument("--top", type=int, nargs="+", help="momentum: symbols held")
+    ap.add_argument("--rebalance", type=int, nargs="+", help="momentum: bars between rebalances")
+    ap.add_argument("--cost-bps", type=float, default=0.0, help="Trading cost per unit of turnover, in basis points")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processes for the parameter sweep")
+    ap.add_argument("--output", "-o", metavar="PATH", help="Also write the JSON report to PATH")
+    args = ap.parse_args()
+
+    params = {k: getattr(args, k) or v for k, v in DEFAULT_GRID[args.strategy].items()}
+    if any(n < 1 for values in params.values() for n in values):
+        raise SystemExit("Grid parameters must be positive bar counts")
+    combos = grid(args.strategy, params)
+    if not combos:
+        raise SystemExit("Empty parameter grid (sma needs some --fast below some --slow)")
+
+    # Enough calendar days before the window for the longest lookback (5 bars a week, plus holidays).
+    longest = max(max(v) for v in params.values())
+    warmup = longest * 7 // 5 + 14
+    frames, errors = market_series.load_panel(args.symbols, args.days + warmup)
+    for sym, error in errors.items():
+        print(f"{sym}: {error}", file=sys.stderr)
+    if not frames:
+        raise SystemExit(1)
+
+    dates, symbols, close = panel(frames)
+    cutoff = pd.Timestamp(datetime.utcnow().date() - timedelta(days=args.days))
+    start_row = int(np.searchsorted(dates.values, cutoff.to_datetime64()))
+    if start_row >= len(dates):
+        raise SystemExit("No bars inside the evaluation window")
+
+    results = backtest(close, start_row, args.strategy, combos, args.cost_bps, args.workers)
+    results.sort(key=lambda r: -np.inf if r["sharpe"] is None else r["sharpe"], reverse=True)
+    report = {
+        "strategy": args.strategy,
+        "symbols": symbols,
+        "start": dates[start_row].strftime(market_series.DATE_FORMAT),
+        "end": dates[-1].strftime(market_series.DATE_FORMAT),
+        "bars": len(dates) - start_row,
+        "cost_bps": args.cost_bps,
+        "benchmark": benchmark(close, start_row),
+        "results": results,
+        "errors": errors,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
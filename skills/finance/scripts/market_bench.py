@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+market_bench.py
+
+Benchmark the market-tracker CLIs against a local stub market-data server.
+
+Starts market_stub.py in-process (configurable latency / error rate), then
+runs the real scripts as subprocesses in a scratch directory, exactly as a
+user would, with MARKET_STUB_URL pointing at the stub:
+
+  quote      market_quote.py SYM... --no-daemon
+  watchlist  market_watchlist.py summary (watchlist of SYM...)
+  series     market_series.py SYM... --days N --layout long (stock symbols only)
+
+Workloads, each for every watchlist size:
+  cold   empty .cache: every quote goes upstream
+  warm   the same run repeated straight away: served from the cache
+  mixed  half the list cached, half new, plus unknown symbols (negative cache)
+
+Each cell is run --repeat times. Reported per cell: wall-clock p50/p99 per
+invocation, symbols/sec, peak RSS of the child process, upstream requests
+seen by the stub, and error rows. "startup" is the cost of starting each
+script with nothing to fetch (interpreter + imports + argparse).
+
+Usage:
+  python scripts/market_bench.py
+  python scripts/market_bench.py --sizes 10 100 --latency 0.05 --error-rate 0.05 --repeat 5
+  python scripts/market_bench.py --targets quote --workloads cold warm --providers yfinance
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import market_stub
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_SIZES = (10, 100, 1000)
+TARGETS = ("quote", "watchlist", "series")
+WORKLOADS = ("cold", "warm", "mixed")
+SERIES_DAYS = 90
+# Share of generated symbols that are FX pairs, and of mixed-workload extras that are unknown.
+FX_SHARE = 0.1
+UNKNOWN_SHARE = 0.05
+
+
+def symbols_for(size: int, offset: int = 0) -> List[str]:
+    """`size` deterministic symbols: mostly SYMnnnn tickers, every 1/FX_SHARE-th an FX pair."""
+    currencies = sorted(market_stub.USD_RATES)
+    pairs = [f"{b}/{q}" for b in currencies for q in currencies if b != q]
+    every = max(1, int(round(1 / FX_SHARE)))
+    out = []
+    for i in range(offset, offset + size):
+        out.append(pairs[(i // every) % len(pairs)] if i % every == every - 1 else f"SYM{i:04d}")
+    return out
+
+
+def _percentile(values: Sequence[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))]
+
+
+def _run(argv: List[str], cwd: str, env: Dict[str, str]) -> Dict[str, Any]:
+    """Run one script; wall time, peak RSS (via wait4, per child) and parsed stdout."""
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, *argv], cwd=cwd, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+    )
+    out = proc.stdout.read() if proc.stdout else ""
+    _, status, usage = os.wait4(proc.pid, 0)
+    elapsed = time.perf_counter() - t0
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.stdout:
+        proc.stdout.close()
+    # ru_maxrss is KiB on Linux, bytes on macOS.
+    rss_mb = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    return {"seconds": elapsed, "rss_mb": rss_mb, "returncode": proc.returncode, "stdout": out}
+
+
+def _error_rows(target: str, stdout: str, returncode: int) -> int:
+    if target == "series":
+        return 0 if returncode == 0 else 1  # failed symbols only show on stderr
+    try:
+        data = json.loads(stdout)
+    except ValueError:
+        return 1
+    # A single-symbol quote prints its one row (quote or error) as an object.
+    rows = data.get("summary", [data]) if isinstance(data, dict) else data
+    return sum(1 for r in rows if "error" in r)
+
+
+class Bench:
+    def __init__(self, server: Any, providers: Optional[str], workers: int) -> None:
+        self.server = server
+        self.workers = workers
+        self.env = dict(os.environ, MARKET_STUB_URL=server.url, PYTHONDONTWRITEBYTECODE="1")
+        if providers:
+            self.env["MARKET_PROVIDERS"] = providers
+
+    def _invocations(self, target: str, symbols: List[str], cwd: str) -> List[List[str]]:
+        if target == "quote":
+            return [[os.path.join(SCRIPTS_DIR, "market_quote.py"), *symbols, "--no-daemon"]]
+        if target == "watchlist":
+            path = os.path.join(cwd, ".cache", "market-tracker", "watchlist.json")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"items": symbols}, f)
+            return [[os.path.join(SCRIPTS_DIR, "market_watchlist.py"), "summary", "--workers", str(self.workers)]]
+        stocks = [s for s in symbols if "/" not in s]
+        return [[os.path.join(SCRIPTS_DIR, "market_series.py"), *stocks, "--days", str(SERIES_DAYS), "--layout", "long"]]
+
+    def _workdir(self, target: str, workload: str, symbols: List[str]) -> str:
+        cwd = tempfile.mkdtemp(prefix="market-bench-")
+        if workload in ("warm", "mixed"):
+            # Prime the cache; for mixed only the first half of the list.
+            primed = symbols if workload == "warm" else symbols[: len(symbols) // 2]
+            for argv in self._invocations(target, primed, cwd):
+                _run(argv, cwd, self.env)
+        return cwd
+
+    def cell(self, target: str, workload: str, size: int, repeat: int) -> Dict[str, Any]:
+        symbols = symbols_for(size)
+        if workload == "mixed":
+            # Second half replaced by symbols the cache has never seen, some of them unknown upstream.
+            unknown = max(1, int(size * UNKNOWN_SHARE))
+            fresh = symbols_for(size - size // 2 - unknown, offset=size)
+            symbols = symbols[: size // 2] + fresh + [f"BAD{i:04d}" for i in range(unknown)]
+
+        walls: List[float] = []
+        rss: List[float] = []
+        upstream: List[int] = []
+        errors: List[int] = []
+        symbols_done = 0
+        for _ in range(repeat):
+            cwd = self._workdir(target, workload, symbols)
+            try:
+                invocations = self._invocations(target, symbols, cwd)
+                before = self.server.requests
+                for argv in invocations:
+                    r = _run(argv, cwd, self.env)
+                    walls.append(r["seconds"])
+                    rss.append(r["rss_mb"])
+                    errors.append(_error_rows(target, r["stdout"], r["returncode"]))
+                symbols_done += size
+                upstream.append(self.server.requests - before)
+            finally:
+                shutil.rmtree(cwd, ignore_errors=True)
+
+        total = sum(walls)
+        return {
+            "target": target,
+            "workload": workload,
+            "size": size,
+            "runs": len(walls),
+            "wall_p50_s": _round(_percentile(walls, 50)),
+            "wall_p99_s": _round(_percentile(walls, 99)),
+            "symbols_per_s": _round(symbols_done / total if total else None),
+            "peak_rss_mb": _round(max(rss) if rss else None, 1),
+            "upstream_requests": _round(sum(upstream) / len(upstream) if upstream else None, 1),
+            "error_rows": _round(sum(errors) / repeat, 1),
+        }
+
+    def startup(self, repeat: int) -> Dict[str, Any]:
+        out: Dict[str, Any] = {}
+        cwd = tempfile.mkdtemp(prefix="market-bench-")
+        try:
+            scripts = {
+                "quote": ["market_quote.py", "--help"],
+                "watchlist": ["market_watchlist.py", "list"],
+                "series": ["market_series.py", "--help"],
+            }
+            for name, (script, *rest) in scripts.items():
+                runs = [_run([os.path.join(SCRIPTS_DIR, script), *rest], cwd, self.env) for _ in range(repeat)]
+                secs = [r["seconds"] for r in runs]
+                out[name] = {
+                    "p50_s": _round(_percentile(secs, 50)),
+                    "p99_s": _round(_percentile(secs, 99)),
+                    "peak_rss_mb": _round(max(r["rss_mb"] for r in runs), 1),
+                }
+        finally:
+            shutil.rmtree(cwd, ignore_errors=True)
+        return out
+
+
+def _round(x: Optional[float], digits: int = 4) -> Optional[float]:
+    return None if x is None else round(x, digits)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="Watchlist sizes")
+    ap.add_argument("--targets", nargs="+", choices=TARGETS, default=list(TARGETS))
+    ap.add_argument("--workloads", nargs="+", choices=WORKLOADS, default=list(WORKLOADS))
+    ap.add_argument("--repeat", type=int, default=3, help="Runs per cell (and per startup measurement)")
+    ap.add_argument("--latency", type=float, default=0.02, help="Stub mean response delay in seconds")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="Fraction of stub responses that are 503s")
+    ap.add_argument(
+        "--providers", default="stub", help="MARKET_PROVIDERS for the children ('yfinance' exercises yfinance via the stub)"
+    )
+    ap.add_argument("--workers", type=int, default=8, help="watchlist summary --workers")
+    ap.add_argument("--output", help="Also write the JSON report to this file")
+    args = ap.parse_args()
+
+    server = market_stub.start(latency=args.latency, error_rate=args.error_rate)
+    bench = Bench(server, args.providers, args.workers)
+    try:
+        report: Dict[str, Any] = {
+            "config": {
+                "sizes": args.sizes,
+                "repeat": args.repeat,
+                "latency_s": args.latency,
+                "error_rate": args.error_rate,
+                "providers": args.providers,
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+            },
+            "startup": bench.startup(args.repeat),
+            "results": [],
+        }
+        for target in args.targets:
+            for workload in args.workloads:
+                for size in args.sizes:
+                    report["results"].append(bench.cell(target, workload, size, args.repeat))
+                    print(json.dumps(report["results"][-1]), file=sys.stderr, flush=True)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
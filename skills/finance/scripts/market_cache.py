@@ -0,0 +1,241 @@
+"""
+market_cache.py
+
+Single-file SQLite cache store shared by the market-tracker scripts.
+
+Replaces the one-JSON-file-per-key cache: entries live in one table keyed by
+cache key, with an index on the write time so TTL lookups, bulk lookups and
+eviction are indexed queries instead of a stat + open + json.load per key.
+WAL mode and a busy timeout make it safe to share between processes.
+
+Entries may carry an absolute expiry ("_expires_at" in the payload, stored
+in its own column) that keeps them fresh past the caller's TTL, e.g. quotes
+for a market that is closed until a known time.
+
+TieredCache puts an in-process LRU in front of the store so repeat lookups
+in long-lived callers (watchlist summary, daemons) never touch SQLite.
+"""
+
+from __future__ import annotations
+
+import json
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+# Anything older than every TTL we use is dead weight.
+DEFAULT_MAX_AGE_SECONDS = 30 * 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 100_000
+DEFAULT_MEMORY_ENTRIES = 4096
+# Writes run eviction with this probability, so no process has to own it.
+EVICT_PROBABILITY = 0.01
+
+# Stay well below SQLITE_MAX_VARIABLE_NUMBER on old builds (999).
+_BULK_CHUNK = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    payload TEXT NOT NULL,
+    cached_at INTEGER NOT NULL,
+    expires_at INTEGER
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_cached_at ON entries (cached_at);
+"""
+
+
+class CacheStore:
+    """
+    Key -> JSON payload store with TTL-aware reads.
+
+    Payloads come back with "_cached_at" set, like the old JSON-file cache.
+    Connections are per thread; the file can be shared by several processes.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_age: int = DEFAULT_MAX_AGE_SECONDS,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ) -> None:
+        self.path = path
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit: every statement is its own short transaction.
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA busy_timeout=30000")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._migrate(conn)
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection) -> None:
+        # Files created before expires_at existed.
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(entries)")}
+        if "expires_at" not in columns:
+            try:
+                conn.execute("ALTER TABLE entries ADD COLUMN expires_at INTEGER")
+            except sqlite3.OperationalError:
+                # Another process added it first.
+                pass
+
+    @staticmethod
+    def _decode(payload: str, cached_at: int, expires_at: Optional[int]) -> Optional[Dict[str, Any]]:
+        try:
+            data = json.loads(payload)
+        except ValueError:
+            return None
+        data["_cached_at"] = cached_at
+        if expires_at is not None:
+            data["_expires_at"] = expires_at
+        return data
+
+    def get(self, key: str, ttl: int) -> Optional[Dict[str, Any]]:
+        now = int(time.time())
+        row = self._conn().execute(
+            "SELECT payload, cached_at, expires_at FROM entries"
+            " WHERE key = ? AND (cached_at >= ? OR expires_at > ?)",
+            (key, now - ttl, now),
+        ).fetchone()
+        if row is None:
+            return None
+        return self._decode(*row)
+
+    def get_many(self, keys: Iterable[str], ttl: int) -> Dict[str, Dict[str, Any]]:
+        """Fresh entries for `keys` (missing/expired keys are absent from the result)."""
+        keys = list(dict.fromkeys(keys))
+        now = int(time.time())
+        out: Dict[str, Dict[str, Any]] = {}
+        conn = self._conn()
+        for i in range(0, len(keys), _BULK_CHUNK):
+            chunk = keys[i:i + _BULK_CHUNK]
+            marks = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT key, payload, cached_at, expires_at FROM entries"
+                f" WHERE key IN ({marks}) AND (cached_at >= ? OR expires_at > ?)",
+                (*chunk, now - ttl, now),
+            )
+            for key, payload, cached_at, expires_at in rows:
+                data = self._decode(payload, cached_at, expires_at)
+                if data is not None:
+                    out[key] = data
+        return out
+
+    def set(self, key: str, payload: Dict[str, Any]) -> None:
+        self.set_many({key: payload})
+
+    def set_many(self, items: Dict[str, Dict[str, Any]]) -> None:
+        now = int(time.time())
+        rows: List[tuple] = []
+        for key, payload in items.items():
+            expires_at = payload.get("_expires_at")
+            payload = {k: v for k, v in payload.items() if k not in ("_cached_at", "_expires_at")}
+            data = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+            rows.append((key, data, now, int(expires_at) if expires_at is not None else None))
+        if not rows:
+            return
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT OR REPLACE INTO entries (key, payload, cached_at, expires_at) VALUES (?, ?, ?, ?)", rows)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        if random.random() < EVICT_PROBABILITY:
+            self.evict()
+
+    def evict(self, max_age: Optional[int] = None, max_entries: Optional[int] = None) -> int:
+        """Drop entries older than `max_age`, then the oldest beyond `max_entries`. Returns rows removed."""
+        max_age = self.max_age if max_age is None else max_age
+        max_entries = self.max_entries if max_entries is None else max_entries
+        conn = self._conn()
+        removed = conn.execute(
+            "DELETE FROM entries WHERE cached_at < ?", (int(time.time()) - max_age,)
+        ).rowcount
+        (count,) = conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+        if count > max_entries:
+            removed += conn.execute(
+                "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY cached_at LIMIT ?)",
+                (count - max_entries,),
+            ).rowcount
+        return removed
+
+
+class MemoryLRU:
+    """Thread-safe in-process LRU of payloads (each carrying "_cached_at", maybe "_expires_at")."""
+
+    def __init__(self, max_entries: int = DEFAULT_MEMORY_ENTRIES) -> None:
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, ttl: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            payload = self._data.get(key)
+            if payload is None:
+                return None
+            now = int(time.time())
+            if now - int(payload.get("_cached_at", 0)) > ttl and int(payload.get("_expires_at") or 0) <= now:
+                return None
+            self._data.move_to_end(key)
+            return payload
+
+    def put(self, key: str, payload: Dict[str, Any]) -> None:
+        with self._lock:
+            self._data[key] = payload
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+
+class TieredCache:
+    """Memory LRU in front of a CacheStore; same get/get_many/set/set_many interface."""
+
+    def __init__(self, store: CacheStore, memory: Optional[MemoryLRU] = None) -> None:
+        self.store = store
+        self.memory = memory or MemoryLRU()
+
+    def get(self, key: str, ttl: int) -> Optional[Dict[str, Any]]:
+        payload = self.memory.get(key, ttl)
+        if payload is None:
+            payload = self.store.get(key, ttl)
+            if payload is not None:
+                self.memory.put(key, payload)
+        return payload
+
+    def get_many(self, keys: Iterable[str], ttl: int) -> Dict[str, Dict[str, Any]]:
+        out: Dict[str, Dict[str, Any]] = {}
+        misses = []
+        for key in keys:
+            payload = self.memory.get(key, ttl)
+            if payload is None:
+                misses.append(key)
+            else:
+                out[key] = payload
+        if misses:
+            found = self.store.get_many(misses, ttl)
+            for key, payload in found.items():
+                self.memory.put(key, payload)
+            out.update(found)
+        return out
+
+    def set(self, key: str, payload: Dict[str, Any]) -> None:
+        self.set_many({key: payload})
+
+    def set_many(self, items: Dict[str, Dict[str, Any]]) -> None:
+        now = int(time.time())
+        for key, payload in items.items():
+            self.memory.put(key, dict(payload, _cached_at=now))
+        self.store.set_many(items)
@@ -0,0 +1,138 @@
+"""
+market_calendar.py
+
+Local trading-calendar table used to decide how long a quote can stay cached.
+
+A quote taken while its exchange is closed cannot change before the next
+session opens, so it stays valid until then instead of for the usual TTL.
+Sessions are looked up by the exchange code Yahoo reports ("NMS", "JNB", ...)
+and, failing that, by the exchange timezone. Anything unknown is treated as
+open, which falls back to the plain TTL.
+
+Only regular sessions are modelled: no lunch breaks or early closes. Both
+mistakes err towards refetching, never towards serving a stale price.
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, Optional
+from zoneinfo import ZoneInfo
+
+# Closing auctions and late prints settle after the bell; keep the normal TTL a bit longer.
+CLOSE_SETTLE_SECONDS = 15 * 60
+# Longest run of closed days we search through (long holiday weekends plus slack).
+_MAX_CLOSED_DAYS = 10
+
+
+def _dates(*isos: str) -> FrozenSet[dt.date]:
+    return frozenset(dt.date.fromisoformat(d) for d in isos)
+
+
+US_HOLIDAYS = _dates(
+    "2026-01-01", "2026-01-19", "2026-02-16", "2026-04-03", "2026-05-25", "2026-06-19",
+    "2026-07-03", "2026-09-07", "2026-11-26", "2026-12-25",
+    "2027-01-01", "2027-01-18", "2027-02-15", "2027-03-26", "2027-05-31", "2027-06-18",
+    "2027-07-05", "2027-09-06", "2027-11-25", "2027-12-24",
+)
+ZA_HOLIDAYS = _dates(
+    "2026-01-01", "2026-03-21", "2026-04-03", "2026-04-06", "2026-04-27", "2026-05-01",
+    "2026-06-16", "2026-08-10", "2026-09-24", "2026-12-16", "2026-12-25", "2026-12-26",
+    "2027-01-01", "2027-03-22", "2027-03-26", "2027-03-29", "2027-04-27", "2027-05-01",
+    "2027-06-16", "2027-08-09", "2027-09-24", "2027-12-16", "2027-12-25", "2027-12-27",
+)
+UK_HOLIDAYS = _dates(
+    "2026-01-01", "2026-04-03", "2026-04-06", "2026-05-04", "2026-05-25", "2026-08-31",
+    "2026-12-25", "2026-12-28",
+    "2027-01-01", "2027-03-26", "2027-03-29", "2027-05-03", "2027-05-31", "2027-08-30",
+    "2027-12-27", "2027-12-28",
+)
+
+
+@dataclass(frozen=True)
+class Session:
+    timezone: str
+    open: dt.time
+    close: dt.time
+    holidays: FrozenSet[dt.date] = field(default_factory=frozenset)
+    weekend: FrozenSet[int] = frozenset({5, 6})  # date.weekday()
+
+    def trades_on(self, day: dt.date) -> bool:
+        return day.weekday() not in self.weekend and day not in self.holidays
+
+
+US = Session("America/New_York", dt.time(9, 30), dt.time(16, 0), US_HOLIDAYS)
+JSE = Session("Africa/Johannesburg", dt.time(9, 0), dt.time(17, 0), ZA_HOLIDAYS)
+LSE = Session("Europe/London", dt.time(8, 0), dt.time(16, 30), UK_HOLIDAYS)
+XETRA = Session("Europe/Berlin", dt.time(9, 0), dt.time(17, 30))
+EURONEXT = Session("Europe/Paris", dt.time(9, 0), dt.time(17, 30))
+TSX = Session("America/Toronto", dt.time(9, 30), dt.time(16, 0))
+TSE = Session("Asia/Tokyo", dt.time(9, 0), dt.time(15, 30))
+HKEX = Session("Asia/Hong_Kong", dt.time(9, 30), dt.time(16, 0))
+ASX = Session("Australia/Sydney", dt.time(10, 0), dt.time(16, 0))
+
+# Yahoo exchange codes (Ticker.fast_info["exchange"], chart meta "exchangeName").
+EXCHANGES: Dict[str, Session] = {
+    **{code: US for code in ("NMS", "NGM", "NCM", "NAS", "NYQ", "NYS", "ASE", "PCX", "BTS")},
+    "JNB": JSE,
+    "LSE": LSE,
+    "GER": XETRA,
+    "FRA": XETRA,
+    "PAR": EURONEXT,
+    "AMS": EURONEXT,
+    "BRU": EURONEXT,
+    "TOR": TSX,
+    "JPX": TSE,
+    "HKG": HKEX,
+    "ASX": ASX,
+}
+SESSIONS = (US, JSE, LSE, XETRA, EURONEXT, TSX, TSE, HKEX, ASX)
+# Fallback when only the exchange timezone is known.
+TIMEZONES: Dict[str, Session] = {s.timezone: s for s in SESSIONS}
+
+
+def session_for(exchange: Optional[str], timezone: Optional[str]) -> Optional[Session]:
+    return EXCHANGES.get(exchange or "") or TIMEZONES.get(timezone or "")
+
+
+def closed_everywhere(day: dt.date) -> bool:
+    """True if no modelled session trades on `day` (in practice: weekends)."""
+    return not any(s.trades_on(day) for s in SESSIONS)
+
+
+def closed_somewhere(day: dt.date) -> bool:
+    """True if at least one modelled session is closed on `day` (weekends and any listed holiday)."""
+    return any(not s.trades_on(day) for s in SESSIONS)
+
+
+def _at(session: Session, day: dt.date, t: dt.time) -> float:
+    return dt.datetime.combine(day, t, tzinfo=ZoneInfo(session.timezone)).timestamp()
+
+
+def is_open(session: Session, now: float, settle: float = CLOSE_SETTLE_SECONDS) -> bool:
+    """True during a regular session, including `settle` seconds after the close."""
+    day = dt.datetime.fromtimestamp(now, ZoneInfo(session.timezone)).date()
+    if not session.trades_on(day):
+        return False
+    return _at(session, day, session.open) <= now < _at(session, day, session.close) + settle
+
+
+def next_open(session: Session, now: float) -> Optional[float]:
+    """Unix time of the next session open strictly after `now`."""
+    day = dt.datetime.fromtimestamp(now, ZoneInfo(session.timezone)).date()
+    for i in range(_MAX_CLOSED_DAYS + 1):
+        d = day + dt.timedelta(days=i)
+        if session.trades_on(d):
+            opens = _at(session, d, session.open)
+            if opens > now:
+                return opens
+    return None
+
+
+def closed_until(exchange: Optional[str], timezone: Optional[str], now: float) -> Optional[float]:
+    """If the market is closed at `now`, when it next opens; None if open or unknown."""
+    session = session_for(exchange, timezone)
+    if session is None or is_open(session, now):
+        return None
+    return next_open(session, now)
@@ -0,0 +1,176 @@
+"""
+market_daemon.py
+
+Long-running quote server behind a local Unix socket, plus the thin client
+market_quote.py uses to reach it.
+
+The server keeps market_quote's providers, yfinance import and in-memory
+cache warm, so a CLI call only pays interpreter startup and one local
+round trip. Wire format: one JSON request line, one JSON response line.
+
+  request:  {"symbols": ["AAPL", "USD/ZAR"], "enrich": null}
+  response: {"results": [<quote row>, ...]}   (rows as in market_quote.quote_results)
+            {"error": "..."}                   (request-level failure)
+
+Start it with `python scripts/market_quote.py serve`. market_quote.py asks
+the daemon (answer()) before importing its cache, providers and calendar, so
+a warm call pays none of that; any failure falls back to fetching in-process.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import signal
+import socket
+import socketserver
+from typing import Any, Dict, List, Optional, Set
+
+SOCKET_PATH = os.path.join(".cache", "market-tracker", "quote.sock")
+# Connecting must fail fast when no daemon is running; answers can take a provider round trip.
+CONNECT_TIMEOUT_SECONDS = 0.2
+DEFAULT_REQUEST_TIMEOUT_SECONDS = 60.0
+_MAX_REQUEST_BYTES = 1 << 20
+
+
+def _recv_line(sock: socket.socket) -> bytes:
+    buf = bytearray()
+    while not buf.endswith(b"\n"):
+        chunk = sock.recv(65536)
+        if not chunk:
+            break
+        buf += chunk
+    return bytes(buf)
+
+
+def request(
+    symbols: List[str],
+    path: str = SOCKET_PATH,
+    timeout: float = DEFAULT_REQUEST_TIMEOUT_SECONDS,
+    enrich: Optional[bool] = None,
+) -> Optional[List[Dict[str, Any]]]:
+    """Quote rows from a running daemon, or None if none is reachable or it failed (caller falls back in-process)."""
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(CONNECT_TIMEOUT_SECONDS)
+        try:
+            sock.connect(path)
+        except OSError:
+            # Stale socket file from a daemon that died.
+            return None
+        sock.settimeout(timeout)
+        sock.sendall(json.dumps({"symbols": symbols, "enrich": enrich}).encode("utf-8") + b"\n")
+        raw = _recv_line(sock)
+    except OSError:
+        return None
+    finally:
+        sock.close()
+
+    try:
+        resp = json.loads(raw)
+    except ValueError:
+        return None
+    if "error" in resp:
+        return None
+    return resp.get("results")
+
+
+def answer(argv: List[str]) -> Optional[int]:
+    """
+    Serve a plain `market_quote.py SYMBOL... [--enrich|--no-enrich]` call from
+    the daemon, printed as market_quote.main prints it. Returns the exit status,
+    or None when the call has other options or no daemon answered.
+    """
+    enrich: Optional[bool] = None
+    symbols: List[str] = []
+    for arg in argv:
+        if arg in ("--enrich", "--no-enrich"):
+            enrich = arg == "--enrich"
+        elif arg.startswith("-"):
+            return None
+        else:
+            symbols.append(arg)
+    if not symbols or symbols[0] in ("serve", "providers"):
+        return None
+    results = request(symbols, enrich=enrich)
+    if not results:
+        return None
+    if len(symbols) == 1:
+        print(json.dumps(results[0], ensure_ascii=False, indent=2))
+        return 1 if "error" in results[0] else 0
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    return 0
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        import market_quote
+
+        line = self.rfile.readline(_MAX_REQUEST_BYTES)
+        try:
+            req = json.loads(line)
+            symbols = [str(s) for s in req.get("symbols") or []]
+            errors: Dict[str, str] = {}
+            cached_errors: Set[str] = set()
+            quotes = market_quote.fetch_quotes(
+                symbols, errors=errors, enrich=req.get("enrich"), cached_errors=cached_errors
+            )
+            resp: Dict[str, Any] = {"results": market_quote.quote_results(symbols, quotes, errors, cached_errors)}
+        except Exception as e:
+            resp = {"error": str(e)}
+        self.wfile.write(json.dumps(resp, ensure_ascii=False).encode("utf-8") + b"\n")
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(
+    path: str = SOCKET_PATH,
+    swr: bool = False,
+    preload_yfinance: bool = True,
+    negative_ttl: Optional[int] = None,
+) -> None:
+    """Serve quote requests on `path` until SIGINT/SIGTERM."""
+    import market_quote
+
+    # Handlers use the importable module (not __main__), so configure that one.
+    market_quote.STALE_WHILE_REVALIDATE = swr or market_quote.STALE_WHILE_REVALIDATE
+    if negative_ttl is not None:
+        market_quote.NEGATIVE_TTL_SECONDS = negative_ttl
+
+    if request([], path=path, timeout=1.0) is not None:
+        raise SystemExit(f"A quote daemon is already listening on {path}")
+    if os.path.exists(path):
+        os.unlink(path)
+
+    import requests  # noqa: F401
+
+    if preload_yfinance:
+        # The expensive import happens once here instead of on the first stock request.
+        try:
+            import yfinance  # noqa: F401
+        except ImportError:
+            pass
+
+    old_umask = os.umask(0o177)  # socket is owner-only
+    try:
+        server = _Server(path, _Handler)
+    finally:
+        os.umask(old_umask)
+
+    def stop(signum: int, frame: Any) -> None:
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, stop)
+    print(json.dumps({"ok": True, "socket": os.path.abspath(path), "pid": os.getpid()}), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.unlink(path)
@@ -0,0 +1,131 @@
+"""
+market_fxhistory.py
+
+Local FX history accumulated from the daily rate books the quote scripts
+already fetch.
+
+The open ExchangeRate-API endpoint only serves the latest snapshot. Every
+freshly fetched book is appended to HISTORY_DIR/<BASE>.jsonl.gz, one gzip
+JSON line per provider update ({"t": time_last_update_unix, "rates": {...}}).
+record() is a deduplicating writer: a book whose update time is already in
+the file is not written again, however often it is fetched. Each line is
+its own gzip member; the reader stops at the first torn or corrupt member,
+and the writer cuts such a tail off before appending, so one interrupted
+write never hides the updates recorded after it.
+
+series() reads those snapshots back as a daily rate series for a pair,
+directly from the base's own file or crossed through any other recorded
+base (the same triangulation market_quote uses), so
+`market_series.py USD/ZAR --days 30` works once the history covers it.
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+import os
+import zlib
+from datetime import date
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple
+
+from market_locks import FileLock
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+HISTORY_DIR = os.path.join(".cache", "market-tracker", "fx")
+
+Snapshot = Tuple[int, Dict[str, float]]
+
+
+def path_for(base: str) -> str:
+    return os.path.join(HISTORY_DIR, f"{base.upper()}.jsonl.gz")
+
+
+def _read(path: str) -> Tuple[List[Snapshot], int]:
+    """Snapshots in the intact leading gzip members of `path`, and the byte length of those members."""
+    try:
+        with open(path, "rb") as f:
+            data = memoryview(f.read())
+    except FileNotFoundError:
+        return [], 0
+    out: List[Snapshot] = []
+    good = 0
+    while good < len(data):
+        member = zlib.decompressobj(wbits=31)
+        try:
+            lines = member.decompress(data[good:]).decode("utf-8").splitlines()
+            parsed = [(int(row["t"]), row["rates"]) for row in map(json.loads, filter(None, lines))]
+        except (zlib.error, ValueError, KeyError, TypeError):
+            break
+        if not member.eof:
+            # Writer killed mid-append: everything before the torn member is intact.
+            break
+        out.extend(parsed)
+        good = len(data) - len(member.unused_data)
+    return out, good
+
+
+def snapshots(base: str) -> Iterator[Snapshot]:
+    """(time_last_update_unix, rates) for every recorded update of `base`, in file order."""
+    yield from _read(path_for(base))[0]
+
+
+def record(book: Dict[str, Any]) -> bool:
+    """Append a parsed rate book (market_quote._parse_fx_book) unless its update is already recorded."""
+    base, t, rates = book.get("base"), book.get("time_last_update_unix"), book.get("rates")
+    if not base or not t or not rates:
+        return False
+    path = path_for(base)
+    os.makedirs(HISTORY_DIR, exist_ok=True)
+    with FileLock(path + ".lock"):
+        recorded, good = _read(path)
+        if int(t) in {r[0] for r in recorded}:
+            return False
+        line = json.dumps({"t": int(t), "rates": rates}, separators=(",", ":")) + "\n"
+        with open(path, "ab") as f:
+            # Cut a torn tail off first: a member appended after it would be unreadable.
+            f.truncate(good)
+            f.write(gzip.compress(line.encode("utf-8")))
+            f.flush()
+            os.fsync(f.fileno())
+    return True
+
+
+def bases() -> List[str]:
+    """Base currencies with recorded history."""
+    if not os.path.isdir(HISTORY_DIR):
+        return []
+    return sorted(n[: -len(".jsonl.gz")] for n in os.listdir(HISTORY_DIR) if n.endswith(".jsonl.gz"))
+
+
+def series(base: str, quote: str, start: Optional[date] = None, end: Optional[date] = None) -> "pd.DataFrame":
+    """
+    Daily base/quote rates for [start, end) indexed by UTC update date, one
+    "close" column; the last update of each day wins. Books of `base` itself
+    are preferred, other recorded bases fill the days they lack.
+    """
+    import pandas as pd
+
+    base, quote = base.upper(), quote.upper()
+    by_day: Dict[date, Tuple[bool, int, float]] = {}
+    for b in bases():
+        direct = b == base
+        for t, rates in snapshots(b):
+            if direct:
+                rate = rates.get(quote)
+            elif rates.get(base) and rates.get(quote):
+                rate = float(rates[quote]) / float(rates[base])
+            else:
+                rate = None
+            if rate is None:
+                continue
+            day = pd.Timestamp(t, unit="s").date()
+            if (start and day < start) or (end and day >= end):
+                continue
+            key = (direct, t, float(rate))
+            if day not in by_day or key[:2] > by_day[day][:2]:
+                by_day[day] = key
+    days = sorted(by_day)
+    index = pd.DatetimeIndex(days, name="date")
+    return pd.DataFrame({"close": [by_day[d][2] for d in days]}, index=index)
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+market_indicators.py
+
+Technical indicators over market_series data, vectorized across symbols.
+
+Indicators (definitions as in memory/knowledge/finance/technical-indicators-python.md):
+  sma:N            simple moving average of close
+  ema:N            exponential moving average (span N, adjust=False)
+  rsi:N            RSI from N-bar simple averages of gains / losses
+  macd:F:S:G       MACD line, signal line and histogram
+  bb:N:K           Bollinger Bands: N-bar mean +/- K sample standard deviations
+  atr:N            average true range, Wilder smoothing (alpha = 1/N)
+
+All symbols are computed together: each symbol's bars become one column of
+a (bars x symbols) matrix, right-aligned so every column ends on its latest
+bar, and each kernel is one NumPy / pandas operation over the matrix.
+
+Results are cached per symbol and indicator set (.cache/market-tracker/
+indicators/) together with the recursive state (EMA values). A later run only computes the bars
+added since: windowed indicators from the last few stored bars, EMAs from
+the saved state. A symbol's cache is rebuilt when its stored history was
+re-adjusted (close at the cached last bar differs).
+EMA-based values depend on where the history starts, so --warmup extra days
+are loaded before the output window.
+
+Usage:
+  python scripts/market_indicators.py AAPL --days 90
+  python scripts/market_indicators.py AAPL MSFT ^GSPC --days 365 --indicators sma:20 sma:50 rsi:14 --layout long
+  python scripts/market_indicators.py AAPL MSFT --days 365 --format parquet --output ind.parquet
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import os
+import sys
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+
+import market_series
+import market_store
+from market_locks import FileLock
+
+CACHE_DIR = os.path.join(".cache", "market-tracker", "indicators")
+DEFAULT_INDICATORS = ["sma:20", "sma:50", "ema:12", "ema:26", "rsi:14", "macd:12:26:9", "bb:20:2", "atr:14"]
+# Calendar days loaded before the output window so EMAs have converged.
+DEFAULT_WARMUP_DAYS = 365
+
+_STATE_KEY = b"market_tracker.indicators"
+# Relative close-price difference that marks the stored history as re-adjusted.
+_CLOSE_TOLERANCE = 1e-9
+
+_ARITY = {"sma": 1, "ema": 1, "rsi": 1, "macd": 3, "bb": 2, "atr": 1}
+
+
+@dataclass(frozen=True)
+class Spec:
+    kind: str
+    params: Tuple[float, ...]
+
+    @property
+    def name(self) -> str:
+        return "_".join([self.kind, *(f"{p:g}" for p in self.params)])
+
+    @property
+    def columns(self) -> List[str]:
+        suffix = self.name[len(self.kind) :]
+        if self.kind == "macd":
+            return [f"macd{suffix}", f"macd_signal{suffix}", f"macd_hist{suffix}"]
+        if self.kind == "bb":
+            return [f"bb_upper{suffix}", f"bb_middle{suffix}", f"bb_lower{suffix}"]
+        return [self.name]
+
+    @property
+    def lookback(self) -> int:
+        """Bars before the first new bar that its windowed part needs (EMAs carry state instead)."""
+        n = int(self.params[0])
+        return {"sma": n - 1, "bb": n - 1, "rsi": n, "atr": 1}.get(self.kind, 0)
+
+
+def parse_spec(text: str) -> Spec:
+    kind, *raw = text.strip().lower().split(":")
+    if kind not in _ARITY or len(raw) != _ARITY[kind]:
+        raise ValueError(f"Bad indicator {text!r}: expected one of {', '.join(DEFAULT_INDICATORS)}")
+    params = tuple(float(p) for p in raw)
+    if any(p <= 0 for p in params) or (kind != "bb" and any(p != int(p) for p in params)):
+        raise ValueError(f"Bad indicator {text!r}: periods must be positive integers")
+    return Spec(kind, params)
+
+
+# --- kernels: 2-D float arrays, rows = bars (oldest first), columns = symbols ---
+
+
+def _rolling(x: np.ndarray, n: int, reduce: Any) -> np.ndarray:
+    out = np.full(x.shape, np.nan)
+    if len(x) >= n:
+        windows = np.lib.stride_tricks.sliding_window_view(x, n, axis=0)
+        out[n - 1 :] = reduce(windows, axis=-1)
+    return out
+
+
+def sma(x: np.ndarray, n: int) -> np.ndarray:
+    return _rolling(x, n, np.mean)
+
+
+def rolling_std(x: np.ndarray, n: int) -> np.ndarray:
+    return _rolling(x, n, lambda w, axis: np.std(w, axis=axis, ddof=1))
+
+
+def ema(x: np.ndarray, alpha: float, init: Optional[np.ndarray] = None) -> np.ndarray:
+    """adjust=False EMA down each column, continuing from `init` (the value before row 0) if given."""
+    if init is not None:
+        x = np.vstack([init[None, :], x])
+    out = pd.DataFrame(x).ewm(alpha=alpha, adjust=False).mean().to_numpy()
+    return out[1:] if init is not None else out
+
+
+def _diff(x: np.ndarray) -> np.ndarray:
+    out = np.full(x.shape, np.nan)
+    out[1:] = x[1:] - x[:-1]
+    return out
+
+
+# --- computation over one block of bars ---
+
+
+def _compute(
+    bars: Dict[str, np.ndarray], specs: List[Spec], new: int, state: Dict[str, np.ndarray]
+) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]:
+    """
+    Indicator values for the last `new` rows of `bars` (earlier rows are
+    lookback only). `state` holds EMA values as of the row before the new
+    ones (empty for a full computation); returns (columns, updated state).
+    """
+    close, high, low = bars["close"], bars["high"], bars["low"]
+    out: Dict[str, np.ndarray] = {}
+    after: Dict[str, np.ndarray] = {}
+
+    def run_ema(key: str, x: np.ndarray, alpha: float) -> np.ndarray:
+        y = ema(x, alpha, state.get(key))
+        after[key] = y[-1]
+        return y
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for spec in specs:
+            n = int(spec.params[0])
+            if spec.kind == "sma":
+                out[spec.name] = sma(close, n)[-new:]
+            elif spec.kind == "ema":
+                out[spec.name] = run_ema(spec.name, close[-new:], 2.0 / (n + 1))
+            elif spec.kind == "rsi":
+                delta = _diff(close)
+                known = ~np.isnan(close)
+                # As in the note: the first bar's missing change counts as 0.
+                gain = np.where(known, np.where(delta > 0, delta, 0.0), np.nan)
+                loss = np.where(known, np.where(delta < 0, -delta, 0.0), np.nan)
+                rs = sma(gain, n) / sma(loss, n)
+                out[spec.name] = (100.0 - 100.0 / (1.0 + rs))[-new:]
+            elif spec.kind == "macd":
+                fast, slow, signal = (int(p) for p in spec.params)
+                line = run_ema(f"{spec.name}:fast", close[-new:], 2.0 / (fast + 1)) - run_ema(
+                    f"{spec.name}:slow", close[-new:], 2.0 / (slow + 1)
+                )
+                sig = run_ema(f"{spec.name}:signal", line, 2.0 / (signal + 1))
+                out.update(zip(spec.columns, (line, sig, line - sig)))
+            elif spec.kind == "bb":
+                mid, sd = sma(close, n)[-new:], rolling_std(close, n)[-new:]
+                k = spec.params[1]
+                out.update(zip(spec.columns, (mid + k * sd, mid, mid - k * sd)))
+            elif spec.kind == "atr":
+                prev = np.full(close.shape, np.nan)
+                prev[1:] = close[:-1]
+                # fmax skips the missing previous close on a symbol's first bar.
+                true_range = np.fmax(high - low, np.fmax(np.abs(high - prev), np.abs(low - prev)))
+                true_range[np.isnan(high - low)] = np.nan
+                out[spec.name] = run_ema(spec.name, true_range[-new:], 1.0 / n)
+    return out, after
+
+
+def _matrix(frames: List[pd.DataFrame], rows: int) -> Dict[str, np.ndarray]:
+    """Last `rows` bars of each frame as right-aligned columns (NaN above shorter histories)."""
+    bars = {}
+    for field in ("close", "high", "low"):
+        m = np.full((rows, len(frames)), np.nan)
+        for j, df in enumerate(frames):
+            values = df[field].to_numpy(dtype=float)[-rows:]
+            if len(values):
+                m[rows - len(values) :, j] = values
+        bars[field] = m
+    return bars
+
+
+def compute(frames: Dict[str, pd.DataFrame], specs: List[Spec]) -> Dict[str, pd.DataFrame]:
+    """Full indicator history for every symbol's bars, all symbols in one pass."""
+    return {sym: df for sym, (df, _) in _compute_from(frames, specs, {}).items()}
+
+
+def _compute_from(
+    frames: Dict[str, pd.DataFrame], specs: List[Spec], start: Dict[str, Tuple[int, Dict[str, Any]]]
+) -> Dict[str, Tuple[pd.DataFrame, Dict[str, Any]]]:
+    """
+    Indicators for each frame's bars from position `start[sym][0]` on (0 =
+    whole history), continuing from EMA state `start[sym][1]`. Symbols with
+    the same number of new bars are computed as one matrix.
+    """
+    lookback = max([s.lookback for s in specs] + [0])
+    groups: Dict[int, List[str]] = {}
+    for sym, df in frames.items():
+        first = start.get(sym, (0, {}))[0]
+        if len(df) > first:
+            groups.setdefault(len(df) - first, []).append(sym)
+
+    results: Dict[str, Tuple[pd.DataFrame, Dict[str, Any]]] = {}
+    for new, syms in groups.items():
+        bars = _matrix([frames[s] for s in syms], new + lookback)
+        state: Dict[str, np.ndarray] = {}
+        keys = {k for s in syms for k in start.get(s, (0, {}))[1]}
+        for key in keys:
+            state[key] = np.array([_nan(start.get(s, (0, {}))[1].get(key)) for s in syms], dtype=float)
+        columns, after = _compute(bars, specs, new, state)
+        for j, sym in enumerate(syms):
+            index = frames[sym].index[-new:]
+            df = pd.DataFrame({c: v[:, j] for c, v in columns.items()}, index=index)
+            results[sym] = (df, {k: _none(v[j]) for k, v in after.items()})
+    return results
+
+
+def _nan(v: Optional[float]) -> float:
+    return np.nan if v is None else v
+
+
+def _none(v: float) -> Optional[float]:
+    return None if np.isnan(v) else float(v)
+
+
+# --- cache ---
+
+
+def _cache_path(symbol: str, names: List[str]) -> str:
+    # One file per indicator set, so runs with different sets do not evict each other.
+    digest = hashlib.sha1(",".join(names).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(CACHE_DIR, quote(symbol.upper(), safe=""), f"1d-{digest}.parquet")
+
+
+def update(frames: Dict[str, pd.DataFrame], specs: List[Spec], use_cache: bool = True) -> Dict[str, pd.DataFrame]:
+    """
+    Indicator history per symbol for `frames` (bars indexed by date), using
+    and extending the per-symbol cache: only bars after the cached last bar
+    are computed.
+    """
+    use_cache = use_cache and market_store.available()
+    names = [s.name for s in specs]
+    lookback = max([s.lookback for s in specs] + [0])
+    cached: Dict[str, pd.DataFrame] = {}
+    start: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+    for sym, df in frames.items():
+        old, meta = market_store.read_parquet(_cache_path(sym, names), _STATE_KEY) if use_cache else (None, None)
+        if old is None or not meta or meta.get("indicators") != names or old.empty:
+            continue
+        last = pd.Timestamp(meta["last_date"])
+        if last not in df.index:
+            continue
+        pos = int(df.index.get_loc(last)) + 1
+        if pos < lookback:
+            continue  # too few bars loaded before the new ones to fill the windows
+        if abs(float(df.at[last, "close"]) - meta["last_close"]) > _CLOSE_TOLERANCE * abs(meta["last_close"]):
+            continue  # history re-adjusted since the cache was written
+        cached[sym] = old[old.index <= last]
+        start[sym] = (pos, meta["state"])
+
+    # Rebuilds start at the first bar of `frames`, cached symbols continue from their state.
+    computed = _compute_from(frames, specs, start)
+    out: Dict[str, pd.DataFrame] = {}
+    for sym, df in frames.items():
+        parts = [p for p in (cached.get(sym), computed.get(sym, (None, None))[0]) if p is not None and len(p)]
+        full = pd.concat(parts) if parts else pd.DataFrame(columns=[c for s in specs for c in s.columns])
+        out[sym] = full
+        if use_cache and sym in computed and len(df):
+            meta = {
+                "indicators": names,
+                "last_date": df.index[-1].isoformat(),
+                "last_close": float(df["close"].iloc[-1]),
+                "state": computed[sym][1],
+            }
+            path = _cache_path(sym, names)
+            with FileLock(path + ".lock"):
+                market_store.write_parquet(path, full, _STATE_KEY, meta)
+    return out
+
+
+def indicators(
+    symbols: List[str], days: int, specs: List[Spec], warmup: int = DEFAULT_WARMUP_DAYS, use_cache: bool = True
+) -> Tuple[Dict[str, pd.DataFrame], Dict[str, str]]:
+    """
+    Close plus indicator columns for the last `days` days per symbol.
+
+    Returns ({symbol: frame indexed by date}, {symbol: error}).
+    """
+    frames, errors = market_series.load_panel(symbols, days + warmup)
+    values = update(frames, specs, use_cache)
+    cutoff = pd.Timestamp(datetime.utcnow().date() - timedelta(days=days))
+    out = {}
+    for sym, df in frames.items():
+        joined = df[["close"]].join(values[sym], how="left")
+        out[sym] = joined[joined.index >= cutoff]
+    return out, errors
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("symbols", nargs="+", metavar="symbol", help="Ticker(s)")
+    ap.add_argument("--days", type=int, default=90, help="Output window in days")
+    ap.add_argument(
+        "--indicators", nargs="+", default=DEFAULT_INDICATORS, metavar="SPEC", help="e.g. sma:20 ema:12 rsi:14 macd:12:26:9 bb:20:2 atr:14"
+    )
+    ap.add_argument("--warmup", type=int, default=DEFAULT_WARMUP_DAYS, help="Extra history (days) loaded before the window")
+    ap.add_argument("--layout", choices=["wide", "long"], help="Several symbols: wide (default) or long")
+    ap.add_argument("--format", choices=market_series.FORMATS, default="csv")
+    ap.add_argument("--output", "-o", metavar="PATH", help="Write to PATH instead of stdout")
+    ap.add_argument("--no-cache", action="store_true", help="Recompute everything; do not read or write the cache")
+    args = ap.parse_args()
+
+    try:
+        specs = [parse_spec(s) for s in args.indicators]
+    except ValueError as e:
+        raise SystemExit(str(e))
+    if args.format in ("parquet", "arrow") and not args.output and sys.stdout.isatty():
+        raise SystemExit(f"Refusing to write {args.format} to a terminal: redirect stdout or use --output")
+
+    frames, errors = indicators(args.symbols, args.days, specs, args.warmup, use_cache=not args.no_cache)
+    for sym, error in errors.items():
+        print(f"{sym}: {error}", file=sys.stderr)
+    if not frames:
+        raise SystemExit(1)
+
+    if args.layout is None and len(args.symbols) == 1:
+        (df,) = frames.values()
+    elif args.layout == "long":
+        df = market_series.long(frames)
+    else:
+        df = market_series.wide(frames)
+    if args.output:
+        with open(args.output, "wb") as f:
+            market_series.write_frame(df, args.format, f)
+    else:
+        market_series.write_frame(df, args.format)
+
+
+if __name__ == "__main__":
+    main()
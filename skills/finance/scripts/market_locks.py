@@ -0,0 +1,109 @@
+"""
+market_locks.py
+
+Advisory file locks used to coordinate market-tracker processes
+(shared rate-limit state, single-flight fetches).
+
+POSIX only (fcntl.flock); elsewhere the lock degrades to a per-process
+threading lock, which still serializes threads but not processes.
+
+FileLock removes its lock file on release, so per-key locks (one per cache
+key) do not pile up on disk. A waiter that then gets the lock on the removed
+file notices the path is gone or points elsewhere and locks the current
+file instead.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from contextlib import contextmanager
+from typing import IO, Dict, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None  # type: ignore[assignment]
+
+_THREAD_LOCKS: Dict[str, threading.Lock] = {}
+_THREAD_LOCKS_GUARD = threading.Lock()
+
+
+def _thread_lock(path: str) -> threading.Lock:
+    # flock is per open file description, so threads of one process need their own lock too.
+    with _THREAD_LOCKS_GUARD:
+        return _THREAD_LOCKS.setdefault(os.path.abspath(path), threading.Lock())
+
+
+@contextmanager
+def locked_file(path: str) -> Iterator[IO[str]]:
+    """Open `path` (created if missing) for read/write and hold an exclusive lock on it."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with _thread_lock(path):
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        with os.fdopen(fd, "r+", encoding="utf-8") as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield f
+            finally:
+                if fcntl is not None:
+                    f.flush()
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _same_file(fd: int, path: str) -> bool:
+    try:
+        return os.path.samestat(os.fstat(fd), os.stat(path))
+    except FileNotFoundError:
+        return False
+
+
+class FileLock:
+    """Exclusive lock on `path`, held across threads and processes; supports non-blocking acquire."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._thread = _thread_lock(path)
+        self._fd: Optional[int] = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        if not self._thread.acquire(blocking):
+            return False
+        if fcntl is None:
+            return True
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        while True:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                self._thread.release()
+                if blocking:
+                    raise
+                return False
+            if _same_file(fd, self.path):
+                self._fd = fd
+                return True
+            # The previous holder removed this file on release; lock the one at `path` now.
+            os.close(fd)
+
+    def release(self) -> None:
+        if self._fd is not None:
+            # Removed while still held, so nobody can lock this file and believe they own `path`.
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._thread.release()
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.release()
@@ -0,0 +1,161 @@
+"""
+market_portfolio.py
+
+Value a holdings file in one reporting currency.
+
+Holdings are a CSV file (default .cache/market-tracker/holdings.csv):
+
+  symbol,quantity,cost_basis,cost_currency
+  AAPL,10,1500,USD
+  NPN.JO,5,1600000,ZAc
+  VOD.L,100,
+
+cost_basis is the total paid for the position (optional); cost_currency
+defaults to the instrument's quote currency. A symbol may appear on several
+rows (lots). Minor-unit currencies Yahoo uses (GBp, ZAc, ILA) are converted
+to their major unit (GBP, ZAR, ILS).
+
+All stock quotes are fetched in one market_quote.fetch_quotes batch, then
+every needed currency -> reporting currency rate in a second one (served
+from one pivot rate book). Values, costs and P&L for all positions are then
+computed in one vectorized pass.
+"""
+
+from __future__ import annotations
+
+import csv
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import market_quote
+
+HOLDINGS_PATH = os.path.join(".cache", "market-tracker", "holdings.csv")
+DEFAULT_CURRENCY = market_quote.FX_PIVOT
+
+# Yahoo quote currencies in minor units -> (major currency, units per major unit).
+MINOR_UNITS: Dict[str, Tuple[str, float]] = {
+    "GBp": ("GBP", 100.0),
+    "GBX": ("GBP", 100.0),
+    "ZAc": ("ZAR", 100.0),
+    "ZAC": ("ZAR", 100.0),
+    "ILA": ("ILS", 100.0),
+}
+
+
+def load_holdings(path: str = HOLDINGS_PATH) -> List[Dict[str, Any]]:
+    """Rows of the holdings CSV as {"symbol", "quantity", "cost_basis", "cost_currency"}."""
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        rows = list(csv.DictReader(f))
+    out = []
+    for n, row in enumerate(rows, start=2):
+        row = {str(k).strip().lower(): (v or "").strip() for k, v in row.items() if k}
+        symbol = row.get("symbol", "")
+        if not symbol or symbol.startswith("#"):
+            continue
+        try:
+            quantity = float(row.get("quantity") or "")
+            cost = float(row["cost_basis"]) if row.get("cost_basis") else None
+        except ValueError:
+            raise ValueError(f"{path}:{n}: quantity and cost_basis must be numbers") from None
+        out.append(
+            {"symbol": symbol, "quantity": quantity, "cost_basis": cost, "cost_currency": row.get("cost_currency") or None}
+        )
+    return out
+
+
+def _major(currency: str) -> Tuple[str, float]:
+    return MINOR_UNITS.get(currency) or MINOR_UNITS.get(currency.upper()) or (currency.upper(), 1.0)
+
+
+def _rates(currencies: List[str], reporting: str, errors: Dict[str, str]) -> Dict[str, float]:
+    """{currency: units of `reporting` per unit}, from one batch of FX quotes."""
+    rates = {reporting: 1.0}
+    pairs = [f"{c}/{reporting}" for c in currencies if c != reporting]
+    if pairs:
+        fx_errors: Dict[str, str] = {}
+        for q in market_quote.fetch_quotes(pairs, fx_errors):
+            rates[q.extra["base"]] = q.price
+        errors.update(fx_errors)
+    return rates
+
+
+def _round(x: float, digits: int = 2) -> Optional[float]:
+    return None if not np.isfinite(x) else round(float(x), digits)
+
+
+def value(holdings: List[Dict[str, Any]], currency: str = DEFAULT_CURRENCY) -> Dict[str, Any]:
+    """Per-position and total value / cost / P&L in `currency`, as a JSON-ready dict."""
+    currency = currency.upper()
+    errors: Dict[str, str] = {}
+    symbols = list(dict.fromkeys(h["symbol"] for h in holdings))
+    stocks = [s for s in symbols if not market_quote._parse_fx_pair(s)]
+    for s in symbols:
+        if s not in stocks:
+            errors[s] = "FX pairs are not positions; hold the instruments instead"
+    # Chart quotes carry their currency; enrich=True fetches it only for quotes that lack it.
+    quotes = {q.symbol: q for q in market_quote.fetch_quotes(stocks, errors, enrich=True)} if stocks else {}
+    for s, q in quotes.items():
+        if not q.currency:
+            errors[s] = "Quote currency unknown (provider and metadata lookup gave none); cannot convert"
+
+    positions = [h for h in holdings if h["symbol"] in quotes and h["symbol"] not in errors]
+    quote_ccy = [_major(quotes[h["symbol"]].currency) for h in positions]
+    cost_ccy = [_major(h["cost_currency"]) if h["cost_currency"] else quote_ccy[i] for i, h in enumerate(positions)]
+    needed = sorted({c for c, _ in quote_ccy} | {c for c, _ in cost_ccy})
+    rates = _rates(needed, currency, errors)
+
+    # One vectorized pass over all positions; a missing rate makes that position's numbers NaN.
+    qty = np.array([h["quantity"] for h in positions], dtype=float)
+    price = np.array([quotes[h["symbol"]].price for h in positions], dtype=float)
+    price_scale = np.array([1.0 / d for _, d in quote_ccy], dtype=float)
+    price_fx = np.array([rates.get(c, np.nan) for c, _ in quote_ccy], dtype=float)
+    cost = np.array([np.nan if h["cost_basis"] is None else h["cost_basis"] for h in positions], dtype=float)
+    cost_scale = np.array([1.0 / d for _, d in cost_ccy], dtype=float)
+    cost_fx = np.array([rates.get(c, np.nan) for c, _ in cost_ccy], dtype=float)
+
+    value_rep = qty * price * price_scale * price_fx
+    cost_rep = cost * cost_scale * cost_fx
+    pnl = value_rep - cost_rep
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pnl_pct = pnl / np.abs(cost_rep) * 100.0
+        total_value = np.nansum(value_rep)
+        weight = value_rep / total_value * 100.0
+    has_cost = np.isfinite(cost_rep) & np.isfinite(value_rep)
+    total_cost = cost_rep[has_cost].sum()
+    total_pnl = pnl[has_cost].sum()
+
+    rows = []
+    for i, h in enumerate(positions):
+        q = quotes[h["symbol"]]
+        rows.append(
+            {
+                "symbol": h["symbol"],
+                "name": q.extra.get("shortName"),
+                "quantity": h["quantity"],
+                "price": q.price,
+                "price_currency": q.currency,
+                "value": _round(value_rep[i]),
+                "cost": _round(cost_rep[i]),
+                "pnl": _round(pnl[i]),
+                "pnl_pct": _round(pnl_pct[i]),
+                "weight_pct": _round(weight[i]),
+                "asof_unix": q.asof_unix,
+            }
+        )
+    return {
+        "currency": currency,
+        "asof_unix": int(time.time()),
+        "positions": rows,
+        "total": {
+            "value": _round(total_value),
+            "cost": _round(total_cost) if has_cost.any() else None,
+            "pnl": _round(total_pnl) if has_cost.any() else None,
+            "pnl_pct": _round(total_pnl / abs(total_cost) * 100.0) if has_cost.any() and total_cost else None,
+            "positions_without_cost": int((~has_cost).sum()),
+        },
+        "fx": {f"{c}/{currency}": _round(r, 6) for c, r in sorted(rates.items()) if c != currency},
+        "errors": errors,
+    }
@@ -0,0 +1,267 @@
+"""
+market_providers.py
+
+Quote provider registry with latency-ranked failover.
+
+Each provider is a named fetch function for one kind of data ("stock":
+symbol -> Quote, "fx": base currency -> rate book). Every call records its
+latency and outcome in a small JSON file shared by all market-tracker
+processes, so even one-shot CLI runs route by recent history:
+
+- providers are tried fastest-first by rolling p50 latency, untried ones
+  after measured ones and unhealthy ones (error rate >= UNHEALTHY_ERROR_RATE)
+  at the back;
+- the per-call timeout follows the provider's p95 instead of a flat 20s, so
+  a provider that has gone slow fails over quickly;
+- the next provider is tried on any error, and a provider that answers "no
+  such symbol" counts as healthy.
+
+MARKET_PROVIDERS="stub" (comma-separated names) restricts and orders the
+candidates, e.g. to force the offline stub from market_stub.py. It applies
+per kind, and only to kinds it names a provider of: MARKET_PROVIDERS=yfinance
+pins stock quotes and leaves FX on its usual providers.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Type
+
+from market_locks import locked_file
+
+STATE_PATH = os.path.join(".cache", "market-tracker", "providers.json")
+
+# Rolling window per provider: the last WINDOW_SIZE calls within WINDOW_SECONDS.
+WINDOW_SIZE = 50
+WINDOW_SECONDS = 60 * 60
+MIN_SAMPLES = 3
+UNHEALTHY_ERROR_RATE = 0.5
+
+# Per-call timeout: TIMEOUT_P95_FACTOR x p95, clamped to [MIN_TIMEOUT_SECONDS, caller's cap].
+TIMEOUT_P95_FACTOR = 4.0
+MIN_TIMEOUT_SECONDS = 2.0
+
+
+@dataclass(frozen=True)
+class Provider:
+    name: str
+    kind: str  # "stock" | "fx"
+    fetch: Callable[[str, float], Any]  # (key, timeout seconds) -> result
+
+    @property
+    def key(self) -> str:
+        # Stats are per kind: one service can be fast for quotes and slow for rate books.
+        return f"{self.kind}/{self.name}"
+
+
+_REGISTRY: Dict[str, List[Provider]] = {}
+
+
+def register(provider: Provider) -> None:
+    """Add (or replace, keeping its position) a provider; registration order breaks ties."""
+    providers = _REGISTRY.setdefault(provider.kind, [])
+    for i, p in enumerate(providers):
+        if p.name == provider.name:
+            providers[i] = provider
+            return
+    providers.append(provider)
+
+
+def providers(kind: str) -> List[Provider]:
+    """Registered providers for `kind`, filtered and ordered by MARKET_PROVIDERS if it names any of them."""
+    registered = _REGISTRY.get(kind, [])
+    by_name = {p.name: p for p in registered}
+    wanted = [n.strip() for n in os.environ.get("MARKET_PROVIDERS", "").split(",") if n.strip() in by_name]
+    if not wanted:
+        return list(registered)
+    return [by_name[n] for n in dict.fromkeys(wanted)]
+
+
+def _none_enabled(kind: str) -> RuntimeError:
+    return RuntimeError(f"No {kind} providers enabled (MARKET_PROVIDERS={os.environ.get('MARKET_PROVIDERS')!r})")
+
+
+def _load(f: Any) -> Dict[str, List[List[float]]]:
+    try:
+        return json.loads(f.read() or "{}")
+    except ValueError:
+        return {}
+
+
+def record(name: str, latency: float, ok: bool) -> None:
+    """Append one call outcome to a provider's rolling window (`name` is Provider.key)."""
+    now = time.time()
+    with locked_file(STATE_PATH) as f:
+        state = _load(f)
+        samples = [s for s in state.get(name, []) if s[0] >= now - WINDOW_SECONDS]
+        samples.append([round(now, 3), round(latency, 4), 1 if ok else 0])
+        state[name] = samples[-WINDOW_SIZE:]
+        f.seek(0)
+        f.truncate()
+        f.write(json.dumps(state))
+
+
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))]
+
+
+def stats() -> Dict[str, Dict[str, Any]]:
+    """Provider.key -> {"samples", "p50", "p95", "error_rate", "healthy"} over the rolling window."""
+    now = time.time()
+    with locked_file(STATE_PATH) as f:
+        state = _load(f)
+    out: Dict[str, Dict[str, Any]] = {}
+    for name, samples in state.items():
+        samples = [s for s in samples if s[0] >= now - WINDOW_SECONDS]
+        # Latency of failures is mostly timeout length; rank on successful calls.
+        ok_latencies = [s[1] for s in samples if s[2]]
+        error_rate = (1.0 - len(ok_latencies) / len(samples)) if samples else 0.0
+        out[name] = {
+            "samples": len(samples),
+            "p50": _percentile(ok_latencies, 50),
+            "p95": _percentile(ok_latencies, 95),
+            "error_rate": round(error_rate, 3),
+            "healthy": len(samples) < MIN_SAMPLES or error_rate < UNHEALTHY_ERROR_RATE,
+        }
+    return out
+
+
+def ranked(kind: str, current: Optional[Dict[str, Dict[str, Any]]] = None) -> List[Provider]:
+    """
+    Candidates for `kind`: healthy before unhealthy, measured (fastest p50
+    first) before untried ones, then registration / MARKET_PROVIDERS order.
+    An untried provider is only reached by failover, so it cannot displace a
+    measured one just for lacking samples.
+    """
+    current = stats() if current is None else current
+    candidates = providers(kind)
+    order = {p.name: i for i, p in enumerate(candidates)}
+
+    def rank(p: Provider) -> Tuple[bool, bool, float, int]:
+        s = current.get(p.key) or {}
+        p50 = s.get("p50") if s.get("samples", 0) >= MIN_SAMPLES else None
+        return (not s.get("healthy", True), p50 is None, p50 or 0.0, order[p.name])
+
+    return sorted(candidates, key=rank)
+
+
+def best(kind: str, current: Optional[Dict[str, Dict[str, Any]]] = None) -> Provider:
+    """The first-ranked provider for `kind`; RuntimeError if there is none."""
+    candidates = ranked(kind, current)
+    if not candidates:
+        raise _none_enabled(kind)
+    return candidates[0]
+
+
+def timeout_for(name: str, cap: float, current: Optional[Dict[str, Dict[str, Any]]] = None) -> float:
+    s = (stats() if current is None else current).get(name) or {}
+    p95 = s.get("p95")
+    if p95 is None or s.get("samples", 0) < MIN_SAMPLES:
+        return cap
+    return max(MIN_TIMEOUT_SECONDS, min(cap, p95 * TIMEOUT_P95_FACTOR))
+
+
+def call(
+    kind: str,
+    key: str,
+    timeout: float,
+    answered: Tuple[Type[BaseException], ...] = (),
+) -> Tuple[Any, str]:
+    """
+    Fetch `key` from the best provider for `kind`, failing over in rank order.
+
+    Returns (result, provider name). Exceptions in `answered` (e.g. unknown
+    symbol) do not count against the provider's health; if every provider
+    tried raises one, the first is re-raised. Any other failure raises that
+    error, or a RuntimeError listing every provider's error.
+    """
+    current = stats()
+    candidates = ranked(kind, current)
+    if not candidates:
+        raise _none_enabled(kind)
+
+    not_found: Optional[BaseException] = None
+    failures: List[str] = []
+    last: Optional[BaseException] = None
+    for p in candidates:
+        if not_found is not None and not (current.get(p.key) or {}).get("healthy", True):
+            # A healthy provider already said the symbol does not exist.
+            break
+        t0 = time.monotonic()
+        try:
+            result = p.fetch(key, timeout_for(p.key, timeout, current))
+        except answered as e:
+            record(p.key, time.monotonic() - t0, True)
+            not_found = not_found or e
+            continue
+        except Exception as e:
+            record(p.key, time.monotonic() - t0, False)
+            failures.append(f"{p.name}: {e}")
+            last = e
+            continue
+        record(p.key, time.monotonic() - t0, True)
+        return result, p.name
+
+    raise _give_up(kind, key, not_found, failures, last)
+
+
+async def call_async(
+    kind: str,
+    key: str,
+    timeout: float,
+    answered: Tuple[Type[BaseException], ...] = (),
+    fetchers: Optional[Dict[str, Callable[[str, float], Awaitable[Any]]]] = None,
+) -> Tuple[Any, str]:
+    """
+    Async counterpart of call(). `fetchers` maps provider names to coroutine
+    functions with the same (key, timeout) signature; other providers run
+    their blocking fetch in a worker thread, as does the stats file I/O.
+    """
+    import asyncio
+
+    fetchers = fetchers or {}
+    current = await asyncio.to_thread(stats)
+    candidates = ranked(kind, current)
+    if not candidates:
+        raise _none_enabled(kind)
+
+    not_found: Optional[BaseException] = None
+    failures: List[str] = []
+    last: Optional[BaseException] = None
+    for p in candidates:
+        if not_found is not None and not (current.get(p.key) or {}).get("healthy", True):
+            break
+        fetch = fetchers.get(p.name)
+        per_call = timeout_for(p.key, timeout, current)
+        t0 = time.monotonic()
+        try:
+            result = await (fetch(key, per_call) if fetch else asyncio.to_thread(p.fetch, key, per_call))
+        except answered as e:
+            await asyncio.to_thread(record, p.key, time.monotonic() - t0, True)
+            not_found = not_found or e
+            continue
+        except Exception as e:
+            await asyncio.to_thread(record, p.key, time.monotonic() - t0, False)
+            failures.append(f"{p.name}: {e}")
+            last = e
+            continue
+        await asyncio.to_thread(record, p.key, time.monotonic() - t0, True)
+        return result, p.name
+    raise _give_up(kind, key, not_found, failures, last)
+
+
+def _give_up(
+    kind: str, key: str, not_found: Optional[BaseException], failures: List[str], last: Optional[BaseException]
+) -> BaseException:
+    """The error to raise once every candidate has been tried."""
+    if not_found is not None and last is None:
+        return not_found
+    if len(failures) == 1 and last is not None:
+        return last
+    return RuntimeError(f"All {kind} providers failed for {key}: " + "; ".join(failures))
@@ -10,6 +10,18 @@ Usage:
   python scripts/market_quote.py AAPL
   python scripts/market_quote.py ^GSPC
   python scripts/market_quote.py USD/ZAR
+  python scripts/market_quote.py AAPL MSFT ^GSPC USD/ZAR EUR/ZAR
+  python scripts/market_quote.py AAPL --swr
+  python scripts/market_quote.py AAPL --enrich   # also fetch missing name/exchange metadata (get_info)
+  python scripts/market_quote.py AAPL MSFT USD/ZAR --async --concurrency 16
+  python scripts/market_quote.py AAPL MSFT USD/ZAR --watch --interval 5   # JSON line per change
+  python scripts/market_quote.py AAPL USD/ZAR --record traffic/   # later: --replay traffic/ (offline)
+  python scripts/market_quote.py serve          # warm daemon; later calls use it automatically
+  python scripts/market_quote.py providers      # provider ranking with rolling p50/p95 and error rate
+
+With several symbols, uncached stocks are resolved from Yahoo's multi-symbol
+chart endpoint, SPARK_CHUNK symbols per request. FX pairs are served from per-base rate books; crosses such
+as EUR/ZAR are triangulated from the USD snapshot without another request.
 """
 
 from __future__ import annotations
@@ -18,19 +30,95 @@ import argparse
 import json
 import os
 import re
+import sqlite3
+import sys
+import threading
 import time
-from dataclasses import dataclass
-from typing import Any, Dict, Optional, Tuple
+from dataclasses import asdict, dataclass, fields
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Set, Tuple
+
+if __name__ == "__main__":
+    # Warm path first: a running daemon answers plain quote calls before the imports below.
+    import market_daemon
+
+    _status = market_daemon.answer(sys.argv[1:])
+    if _status is not None:
+        sys.exit(_status)
 
-import requests
+import market_calendar
+import market_fxhistory
+import market_providers
+import market_ratelimit
+import market_replay
+from market_cache import CacheStore, TieredCache
+from market_locks import FileLock
+
+if TYPE_CHECKING:
+    from concurrent.futures import ThreadPoolExecutor
+
+    import requests
 
 CACHE_DIR = os.path.join(".cache", "market-tracker")
 os.makedirs(CACHE_DIR, exist_ok=True)
+_CACHE = TieredCache(CacheStore(os.path.join(CACHE_DIR, "cache.sqlite3")))
+LOCK_DIR = os.path.join(CACHE_DIR, "locks")
 
-# Conservative defaults to reduce rate-limit pain.
-DEFAULT_TTL_SECONDS_STOCKS = 60
+# Conservative defaults to reduce rate-limit pain (request pacing itself lives in market_ratelimit.py).
+DEFAULT_TTL_SECONDS_STOCKS = 60  # while the market is open; see market_calendar.py
 DEFAULT_TTL_SECONDS_FX = 12 * 60 * 60  # open FX endpoint updates daily
 
+# Stale-while-revalidate (--swr): within this window past the TTL a cached
+# quote is returned immediately and refreshed in the background.
+STALE_WHILE_REVALIDATE = False
+STALE_GRACE_SECONDS_STOCKS = 5 * 60
+STALE_GRACE_SECONDS_FX = 12 * 60 * 60
+
+# Enrichment (name, currency, exchange) comes from yfinance get_info, which is
+# heavy and rate-limit prone, so it is cached apart from prices for much longer.
+# Expired entries are still served for META_STALE_GRACE_SECONDS while they are
+# refreshed in the background. Opt-in (--enrich): without it get_info is never
+# called and only cached metadata is used. Quotes whose provider already
+# supplied name, currency and exchange never need it.
+ENRICH = False
+DEFAULT_TTL_SECONDS_META = 7 * 24 * 60 * 60
+META_STALE_GRACE_SECONDS = 21 * 24 * 60 * 60
+# Concurrent get_info calls when a batch has symbols without any cached metadata.
+META_WORKERS = 8
+# marketState changes intraday; only report it from recently fetched metadata.
+MARKET_STATE_TTL_SECONDS = 5 * 60
+
+# Symbols the provider has no data for are remembered for NEGATIVE_TTL_SECONDS
+# (0 disables), doubling on each repeated failure up to NEGATIVE_TTL_MAX_SECONDS.
+NEGATIVE_TTL_SECONDS = 5 * 60
+NEGATIVE_TTL_MAX_SECONDS = 6 * 60 * 60
+
+# --watch: poll every WATCH_INTERVAL_SECONDS, or every WATCH_CLOSED_INTERVAL_SECONDS
+# while every watched stock's market is closed.
+WATCH_INTERVAL_SECONDS = 5.0
+WATCH_CLOSED_INTERVAL_SECONDS = 5 * 60.0
+
+FX_LATEST_URL = "https://open.er-api.com/v6/latest/{base}"
+# Quote.source of FX quotes, by the provider that served the rate book.
+FX_SOURCES = {
+    "er-api": "ExchangeRate-API Open Access (open.er-api.com)",
+    "stub": "market_stub.py (local test data)",
+}
+YAHOO_CHART_URL = "https://query1.finance.yahoo.com/v8/finance/chart/{symbol}"
+# Multi-symbol chart endpoint used for batch misses: one request per SPARK_CHUNK symbols.
+YAHOO_SPARK_URL = "https://query1.finance.yahoo.com/v7/finance/spark"
+SPARK_CHUNK = 20
+# Yahoo rejects the default python-requests/httpx agents.
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+# Upper bound per provider call; market_providers shortens it for providers with a known p95.
+HTTP_TIMEOUT_SECONDS = 20
+# Concurrent requests for batch misses (spark chunks, then per-symbol fallbacks).
+STOCK_WORKERS = 8
+# Base URL of a market_stub.py server; registers the offline "stub" stock and FX providers.
+STUB_URL = os.environ.get("MARKET_STUB_URL")
+
+# One snapshot of this base serves every cross (EUR/ZAR = USD->ZAR / USD->EUR).
+FX_PIVOT = "USD"
+
 
 @dataclass
 class Quote:
@@ -43,29 +131,137 @@ class Quote:
     extra: Dict[str, Any]
 
 
-def _cache_path(key: str) -> str:
-    safe = re.sub(r"[^A-Za-z0-9_.-]+", "_", key)
-    return os.path.join(CACHE_DIR, f"{safe}.json")
+class SymbolError(RuntimeError):
+    """The provider has no quote for this symbol (unknown ticker/pair), as opposed to a transient failure."""
+
+    def __init__(self, message: str, cached: bool = False) -> None:
+        super().__init__(message)
+        self.cached = cached
 
 
 def _cache_get(key: str, ttl: int) -> Optional[Dict[str, Any]]:
-    path = _cache_path(key)
-    if not os.path.exists(path):
-        return None
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            payload = json.load(f)
-        if int(time.time()) - int(payload.get("_cached_at", 0)) <= ttl:
-            return payload
-    except Exception:
+        return _CACHE.get(key, ttl)
+    except sqlite3.Error:
         return None
-    return None
+
+
+def _cache_get_many(keys: List[str], ttl: int) -> Dict[str, Dict[str, Any]]:
+    try:
+        return _CACHE.get_many(keys, ttl)
+    except sqlite3.Error:
+        return {}
 
 
 def _cache_set(key: str, payload: Dict[str, Any]) -> None:
-    payload["_cached_at"] = int(time.time())
-    with open(_cache_path(key), "w", encoding="utf-8") as f:
-        json.dump(payload, f, ensure_ascii=False, indent=2)
+    try:
+        _CACHE.set(key, payload)
+    except sqlite3.Error:
+        # A cache write failure must not fail the quote itself.
+        pass
+
+
+_REFRESH_LOCK = threading.Lock()
+_REFRESHING: set = set()
+_REFRESH_POOL: Optional["ThreadPoolExecutor"] = None
+
+
+def _revalidate(key: str, refresh: Callable[[], Any]) -> None:
+    """Schedule one background refresh per key; on failure the stale entry simply stays."""
+    global _REFRESH_POOL
+    with _REFRESH_LOCK:
+        if key in _REFRESHING:
+            return
+        _REFRESHING.add(key)
+        if _REFRESH_POOL is None:
+            from concurrent.futures import ThreadPoolExecutor
+
+            # Non-daemon workers: a CLI run prints first, then finishes the refresh before exiting.
+            _REFRESH_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="quote-refresh")
+
+    def run() -> None:
+        try:
+            refresh()
+        except Exception:
+            pass
+        finally:
+            with _REFRESH_LOCK:
+                _REFRESHING.discard(key)
+
+    _REFRESH_POOL.submit(run)
+
+
+def _cache_get_swr(key: str, ttl: int, grace: int, refresh: Callable[[], Any]) -> Optional[Dict[str, Any]]:
+    """Fresh entry, or in SWR mode one at most `grace` past `ttl` with `refresh` scheduled."""
+    cached = _cache_get(key, ttl)
+    if cached or not STALE_WHILE_REVALIDATE:
+        return cached
+    stale = _cache_get(key, ttl + grace)
+    if stale:
+        _revalidate(key, refresh)
+    return stale
+
+
+def _flight_lock(key: str) -> FileLock:
+    """
+    Single-flight lock for one cache key, shared across threads and processes.
+
+    Whoever holds it fetches and writes the entry; everyone else blocks on it
+    and then re-reads the cache instead of calling the provider again.
+    """
+    safe = re.sub(r"[^A-Za-z0-9_.-]+", "_", key)
+    return FileLock(os.path.join(LOCK_DIR, f"{safe}.lock"))
+
+
+def _cache_stock(q: Quote) -> None:
+    """Cache a stock quote; taken while its market is closed, it stays valid until the next open."""
+    payload = asdict(q)
+    exchange, timezone = q.extra.get("exchange"), q.extra.get("timezone")
+    if not (exchange or timezone):
+        # Batch quotes carry no exchange; use whatever metadata is already cached.
+        meta = _cache_get(f"meta_{q.symbol}", DEFAULT_TTL_SECONDS_META + META_STALE_GRACE_SECONDS) or {}
+        exchange, timezone = meta.get("exchange"), meta.get("timezone")
+    reopens = market_calendar.closed_until(exchange, timezone, time.time())
+    if reopens is not None:
+        payload["_expires_at"] = int(reopens)
+    _cache_set(f"stk_{q.symbol}", payload)
+
+
+def _cache_fx_book(base: str, book: Dict[str, Any]) -> None:
+    """Cache a freshly fetched rate book and add it to the local FX history (market_fxhistory.py)."""
+    _cache_set(f"fxbook_{base}", book)
+    try:
+        market_fxhistory.record(book)
+    except OSError:
+        # Like the cache, history is a side effect: never fail the quote over it.
+        pass
+
+
+def _symbol_error(key: str, message: str) -> SymbolError:
+    """Remember that `key` (ticker or BASE/QUOTE) has no quote and return the error to raise."""
+    if NEGATIVE_TTL_SECONDS > 0:
+        previous = _cache_get(f"neg_{key}", NEGATIVE_TTL_MAX_SECONDS) or {}
+        failures = int(previous.get("failures") or 0) + 1
+        ttl = min(NEGATIVE_TTL_MAX_SECONDS, NEGATIVE_TTL_SECONDS * 2 ** (failures - 1))
+        _cache_set(f"neg_{key}", {"error": message, "failures": failures, "_expires_at": int(time.time()) + ttl})
+    return SymbolError(message)
+
+
+def _negative_hits(keys: List[str]) -> Dict[str, str]:
+    """key -> remembered error message, for keys still inside their negative-cache window."""
+    if NEGATIVE_TTL_SECONDS <= 0 or not keys:
+        return {}
+    # TTL 0: only the absolute expiry written by _symbol_error keeps an entry alive.
+    hits = _cache_get_many([f"neg_{k}" for k in keys], 0)
+    return {k: str(hits[f"neg_{k}"].get("error")) for k in keys if f"neg_{k}" in hits}
+
+
+_QUOTE_FIELDS = {f.name for f in fields(Quote)}
+
+
+def _quote_from_payload(payload: Dict[str, Any]) -> Quote:
+    # Cache payloads carry bookkeeping keys (e.g. "_cached_at") that Quote does not accept.
+    return Quote(**{k: v for k, v in payload.items() if k in _QUOTE_FIELDS})
 
 
 def _parse_fx_pair(s: str) -> Optional[Tuple[str, str]]:
@@ -83,95 +279,245 @@ def _parse_fx_pair(s: str) -> Optional[Tuple[str, str]]:
     return None
 
 
-def _fetch_fx(base: str, quote: str) -> Quote:
-    cache_key = f"fx_{base}_{quote}"
-    cached = _cache_get(cache_key, DEFAULT_TTL_SECONDS_FX)
-    if cached:
-        return Quote(**cached)
+_HTTP_LOCAL = threading.local()
+
+
+def _http() -> requests.Session:
+    """Per-thread pooled session, so repeated provider calls reuse keep-alive connections."""
+    session = getattr(_HTTP_LOCAL, "session", None)
+    if session is None:
+        # Imported lazily: it is the bulk of startup time, and daemon-served calls never need it.
+        import requests
+
+        session = market_replay.new_session() if market_replay.active() else requests.Session()
+        _HTTP_LOCAL.session = session
+    return session
+
 
-    url = f"https://open.er-api.com/v6/latest/{base}"
-    r = requests.get(url, timeout=20)
-    r.raise_for_status()
-    data = r.json()
+def _yf_session() -> Dict[str, Any]:
+    return market_replay.yfinance_kwargs()
 
+
+def _http_get(
+    provider: str,
+    url: str,
+    timeout: float = HTTP_TIMEOUT_SECONDS,
+    retries: int = market_ratelimit.DEFAULT_RETRIES,
+    allow_404: bool = False,
+) -> requests.Response:
+    """GET under the provider's shared rate limit, retrying 429s and transient failures."""
+
+    def once() -> requests.Response:
+        r = _http().get(url, timeout=timeout, headers={"User-Agent": USER_AGENT})
+        # Yahoo and ER-API answer unknown symbols/currencies with 404 and a JSON error body.
+        if not (allow_404 and r.status_code == 404):
+            r.raise_for_status()
+        return r
+
+    return market_ratelimit.call(provider, once, retries=retries)
+
+
+def _provider_retries(kind: str) -> int:
+    # With somewhere to fail over to, give up on a provider after one retry.
+    return 1 if len(market_providers.providers(kind)) > 1 else market_ratelimit.DEFAULT_RETRIES
+
+
+def _book_from(url: str, provider: str, base: str, timeout: float) -> Dict[str, Any]:
+    r = _http_get(provider, url.format(base=base), timeout=timeout, retries=_provider_retries("fx"), allow_404=True)
+    return _parse_fx_book(base, r.json(), provider)
+
+
+def _er_api_book(base: str, timeout: float) -> Dict[str, Any]:
+    return _book_from(FX_LATEST_URL, "er-api", base, timeout)
+
+
+def _stub_book(base: str, timeout: float) -> Dict[str, Any]:
+    return _book_from(f"{STUB_URL}/v6/latest/{{base}}", "stub", base, timeout)
+
+
+def _fetch_fx_book(base: str) -> Dict[str, Any]:
+    book, _ = market_providers.call("fx", base, HTTP_TIMEOUT_SECONDS, answered=(SymbolError,))
+    return book
+
+
+def _parse_fx_book(base: str, data: Dict[str, Any], provider: str) -> Dict[str, Any]:
     if data.get("result") != "success":
+        if data.get("error-type") == "unsupported-code":
+            raise SymbolError(f"FX provider error: {data}")
         raise RuntimeError(f"FX provider error: {data}")
 
-    rates = data.get("rates") or {}
+    return {
+        "base": base,
+        "rates": data.get("rates") or {},
+        "time_last_update_unix": data.get("time_last_update_unix"),
+        "time_last_update_utc": data.get("time_last_update_utc"),
+        "time_next_update_utc": data.get("time_next_update_utc"),
+        "provider": data.get("provider"),
+        "documentation": data.get("documentation"),
+        "source": FX_SOURCES.get(provider, provider),
+    }
+
+
+def _refresh_fx_book(base: str) -> Dict[str, Any]:
+    cache_key = f"fxbook_{base}"
+    with _flight_lock(cache_key):
+        cached = _cache_get(cache_key, DEFAULT_TTL_SECONDS_FX)
+        if cached:
+            # Another process fetched it while we waited for the lock.
+            return cached
+        book = _fetch_fx_book(base)
+        _cache_fx_book(base, book)
+        return book
+
+
+def _cached_fx_book(base: str) -> Optional[Dict[str, Any]]:
+    return _cache_get_swr(
+        f"fxbook_{base}", DEFAULT_TTL_SECONDS_FX, STALE_GRACE_SECONDS_FX, lambda: _refresh_fx_book(base)
+    )
+
+
+def _fx_book(base: str) -> Dict[str, Any]:
+    """Full rates table for `base`, cached once per base rather than once per pair."""
+    return _cached_fx_book(base) or _refresh_fx_book(base)
+
+
+def _fx_rate(base: str, quote: str) -> Tuple[float, Dict[str, Any], Optional[str]]:
+    """
+    Resolve base/quote from the rate books: (rate, book, via).
+
+    A cached book for `base` is used directly. Otherwise the pair is
+    triangulated from the FX_PIVOT book (one request serves every cross),
+    falling back to fetching `base` itself if the pivot lacks either leg.
+    """
+    book = _cached_fx_book(base)
+    if book is None and base != FX_PIVOT:
+        pivot = _fx_book(FX_PIVOT)
+        rates = pivot.get("rates") or {}
+        if rates.get(base) and quote in rates:
+            return float(rates[quote]) / float(rates[base]), pivot, FX_PIVOT
+    if book is None:
+        try:
+            book = _fx_book(base)
+        except SymbolError:
+            raise _symbol_error(f"{base}/{quote}", f"FX pair not supported by provider: {base}/{quote}") from None
+
+    rates = book.get("rates") or {}
     if quote not in rates:
-        raise RuntimeError(f"FX pair not supported by provider: {base}/{quote}")
+        raise _symbol_error(f"{base}/{quote}", f"FX pair not supported by provider: {base}/{quote}")
+    return float(rates[quote]), book, None
+
 
-    q = Quote(
+def _fetch_fx(base: str, quote: str) -> Quote:
+    rate, book, via = _fx_rate(base, quote)
+    return Quote(
         symbol=f"{base}/{quote}",
         kind="fx",
-        price=float(rates[quote]),
+        price=rate,
         currency=quote,
-        asof_unix=int(data.get("time_last_update_unix") or time.time()),
-        source="ExchangeRate-API Open Access (open.er-api.com)",
+        asof_unix=int(book.get("time_last_update_unix") or time.time()),
+        # Books cached before the provider was recorded carry no "source".
+        source=book.get("source") or FX_SOURCES["er-api"],
         extra={
             "base": base,
             "quote": quote,
-            "time_last_update_utc": data.get("time_last_update_utc"),
-            "time_next_update_utc": data.get("time_next_update_utc"),
+            "cross_via": via,
+            "time_last_update_utc": book.get("time_last_update_utc"),
+            "time_next_update_utc": book.get("time_next_update_utc"),
             "attribution_required": True,
-            "provider": data.get("provider"),
-            "documentation": data.get("documentation"),
+            "provider": book.get("provider"),
+            "documentation": book.get("documentation"),
         },
     )
 
-    _cache_set(cache_key, q.__dict__)
-    return q
+
+def _fetch_fx_many(pairs: List[Tuple[str, str]], errors: Dict[str, str]) -> Dict[str, Quote]:
+    """Resolve many FX pairs; uncached bases are triangulated from a single pivot snapshot."""
+    out: Dict[str, Quote] = {}
+    books = _cache_get_many([f"fxbook_{base}" for base, _ in pairs], DEFAULT_TTL_SECONDS_FX)
+    if any(f"fxbook_{base}" not in books for base, _ in pairs):
+        try:
+            _fx_book(FX_PIVOT)
+        except Exception as e:
+            # Without the pivot every pair would retry the same failing request.
+            for base, quote in pairs:
+                errors[f"{base}/{quote}"] = str(e)
+            return out
+
+    for base, quote in pairs:
+        try:
+            out[f"{base}/{quote}"] = _fetch_fx(base, quote)
+        except Exception as e:
+            errors[f"{base}/{quote}"] = str(e)
+    return out
 
 
 def _fetch_stock(symbol: str) -> Quote:
-    cache_key = f"stk_{symbol}"
-    cached = _cache_get(cache_key, DEFAULT_TTL_SECONDS_STOCKS)
+    cached = _cache_get_swr(
+        f"stk_{symbol}", DEFAULT_TTL_SECONDS_STOCKS, STALE_GRACE_SECONDS_STOCKS, lambda: _refresh_stock(symbol)
+    )
     if cached:
-        return Quote(**cached)
+        return _quote_from_payload(cached)
+    return _refresh_stock(symbol)
+
+
+def _refresh_stock(symbol: str) -> Quote:
+    cache_key = f"stk_{symbol}"
+    with _flight_lock(cache_key):
+        cached = _cache_get(cache_key, DEFAULT_TTL_SECONDS_STOCKS)
+        if cached:
+            # Another process fetched it while we waited for the lock.
+            return _quote_from_payload(cached)
+        return _fetch_stock_live(symbol)
+
 
+def _fetch_stock_live(symbol: str) -> Quote:
+    """Fetch from the best-ranked stock provider (with failover) and cache the quote."""
+    try:
+        q, _ = market_providers.call("stock", symbol, HTTP_TIMEOUT_SECONDS, answered=(SymbolError,))
+    except SymbolError as e:
+        raise _symbol_error(symbol, str(e)) from None
+    _cache_stock(q)
+    return q
+
+
+def _yfinance_quote(symbol: str, timeout: float) -> Quote:
     # Import inside to keep startup light if user only does FX.
     import yfinance as yf
 
-    t = yf.Ticker(symbol)
+    t = yf.Ticker(symbol, **_yf_session())
     # Fast path: try fast_info first (often less fragile than scraping-heavy calls)
     price = None
     currency = None
     extra: Dict[str, Any] = {}
 
-    try:
+    def read_fast_info() -> None:
+        nonlocal price, currency
         fi = getattr(t, "fast_info", None)
         if fi:
             price = fi.get("lastPrice") or fi.get("last_price")
             currency = fi.get("currency")
             extra["exchange"] = fi.get("exchange")
             extra["timezone"] = fi.get("timezone")
+
+    try:
+        market_ratelimit.call("yahoo", read_fast_info)
     except Exception:
         pass
 
     # Fallback: use 1d history
     if price is None:
         try:
-            hist = t.history(period="1d", interval="1m")
+            # fast_info takes no timeout; the history fallback does.
+            hist = market_ratelimit.call("yahoo", lambda: t.history(period="1d", interval="1m", timeout=timeout))
             if hist is not None and len(hist) > 0:
                 price = float(hist["Close"].iloc[-1])
         except Exception as e:
             raise RuntimeError(f"Yahoo/yfinance fetch failed for {symbol}: {e}")
 
     if price is None:
-        raise RuntimeError(f"Could not resolve price for symbol: {symbol}")
+        raise SymbolError(f"Could not resolve price for symbol: {symbol}")
 
-    # Try to enrich
-    try:
-        info = t.get_info()  # can be heavier / more likely to rate-limit
-        if isinstance(info, dict):
-            currency = currency or info.get("currency")
-            extra["shortName"] = info.get("shortName") or info.get("longName")
-            extra["marketState"] = info.get("marketState")
-    except Exception:
-        # Non-fatal: still return price
-        pass
-
-    q = Quote(
+    return Quote(
         symbol=symbol,
         kind="stock",
         price=float(price),
@@ -181,26 +527,596 @@ def _fetch_stock(symbol: str) -> Quote:
         extra=extra,
     )
 
-    _cache_set(cache_key, q.__dict__)
+
+def quote_from_chart(symbol: str, data: Dict[str, Any]) -> Quote:
+    """Build a Quote from a /v8/finance/chart response."""
+    chart = data.get("chart") or {}
+    results = chart.get("result") or []
+    if not results:
+        err = chart.get("error") or {}
+        raise SymbolError(f"Could not resolve price for symbol: {symbol} ({err.get('description') or 'no result'})")
+    meta = results[0].get("meta") or {}
+    price = meta.get("regularMarketPrice")
+    if price is None:
+        raise SymbolError(f"Could not resolve price for symbol: {symbol}")
+    return Quote(
+        symbol=symbol,
+        kind="stock",
+        price=float(price),
+        currency=meta.get("currency"),
+        asof_unix=int(meta.get("regularMarketTime") or time.time()),
+        source="Yahoo Finance chart API (unofficial; best-effort)",
+        extra={
+            "exchange": meta.get("exchangeName"),
+            "timezone": meta.get("exchangeTimezoneName"),
+            "shortName": meta.get("shortName") or meta.get("longName"),
+        },
+    )
+
+
+def _chart_from(url: str, provider: str, symbol: str, timeout: float) -> Quote:
+    from urllib.parse import quote as urlquote
+
+    r = _http_get(
+        provider,
+        url.format(symbol=urlquote(symbol, safe="")) + "?range=1d&interval=1d",
+        timeout=timeout,
+        retries=_provider_retries("stock"),
+        allow_404=True,
+    )
+    return quote_from_chart(symbol, r.json())
+
+
+def _yahoo_chart_quote(symbol: str, timeout: float) -> Quote:
+    return _chart_from(YAHOO_CHART_URL, "yahoo", symbol, timeout)
+
+
+def _stub_quote(symbol: str, timeout: float) -> Quote:
+    q = _chart_from(f"{STUB_URL}/v8/finance/chart/{{symbol}}", "stub", symbol, timeout)
+    q.source = "market_stub.py (local test data)"
     return q
 
 
-def main() -> None:
-    ap = argparse.ArgumentParser()
-    ap.add_argument("symbol", help="Ticker (AAPL, ^GSPC) or FX pair (USD/ZAR, EURUSD)")
-    args = ap.parse_args()
+def _register_providers() -> None:
+    Provider = market_providers.Provider
+    if STUB_URL:
+        # Offline testing: registered first so it wins ties before any stats exist.
+        market_providers.register(Provider("stub", "stock", _stub_quote))
+        market_providers.register(Provider("stub", "fx", _stub_book))
+    market_providers.register(Provider("yfinance", "stock", _yfinance_quote))
+    market_providers.register(Provider("yahoo-chart", "stock", _yahoo_chart_quote))
+    market_providers.register(Provider("er-api", "fx", _er_api_book))
+
+
+_register_providers()
+
+
+def _spark_endpoint() -> Optional[Tuple[str, str]]:
+    """(spark URL, rate-limit key) for batch misses, or None if no Yahoo-backed stock provider is enabled."""
+    names = {p.name for p in market_providers.providers("stock")}
+    if STUB_URL and names & {"stub", "yfinance", "yahoo-chart"}:
+        # Offline testing: Yahoo requests go to the stub, as yfinance's own do.
+        return f"{STUB_URL}/v7/finance/spark", "stub"
+    if names & {"yfinance", "yahoo-chart"}:
+        return YAHOO_SPARK_URL, "yahoo"
+    return None
+
+
+def _spark_quotes(url: str, provider: str, symbols: List[str]) -> Dict[str, Quote]:
+    """Quotes for up to SPARK_CHUNK symbols from one spark request; unresolved symbols are left out."""
+    from urllib.parse import quote as urlquote
+
+    query = ",".join(urlquote(s, safe="") for s in symbols)
+    r = _http_get(provider, f"{url}?symbols={query}&range=1d&interval=1d", retries=_provider_retries("stock"))
+    return _quotes_from_spark(provider, symbols, r.json())
+
+
+def _quotes_from_spark(provider: str, symbols: List[str], data: Dict[str, Any]) -> Dict[str, Quote]:
+    """Parse (and cache) the quotes in one spark response."""
+    by_upper = {s.upper(): s for s in symbols}
+    out: Dict[str, Quote] = {}
+    for item in (data.get("spark") or {}).get("result") or []:
+        symbol = by_upper.get(str(item.get("symbol") or "").upper())
+        if symbol is None:
+            continue
+        try:
+            q = quote_from_chart(symbol, {"chart": {"result": item.get("response"), "error": None}})
+        except SymbolError:
+            continue
+        if provider == "stub":
+            q.source = "market_stub.py (local test data)"
+        q.extra["batch"] = True
+        _cache_stock(q)
+        out[symbol] = q
+    return out
+
+
+def _run_all(fn: Callable[[Any], None], items: List[Any]) -> None:
+    """fn(item) for every item, up to STOCK_WORKERS at a time."""
+    if len(items) <= 1:
+        for item in items:
+            fn(item)
+        return
+    from concurrent.futures import ThreadPoolExecutor
 
-    s = args.symbol.strip()
+    with ThreadPoolExecutor(max_workers=min(len(items), STOCK_WORKERS), thread_name_prefix="quote-fetch") as pool:
+        list(pool.map(fn, items))
 
+
+def _cached_stocks(symbols: List[str], allow_stale: bool = True) -> Tuple[Dict[str, Quote], List[str]]:
+    """
+    (quotes the cache can serve, misses). With STALE_WHILE_REVALIDATE, stale
+    entries are served too and refreshed together in one background batch.
+    """
+    out: Dict[str, Quote] = {}
+    misses = []
+    cached = _cache_get_many([f"stk_{s}" for s in symbols], DEFAULT_TTL_SECONDS_STOCKS)
+    for symbol in symbols:
+        if f"stk_{symbol}" in cached:
+            out[symbol] = _quote_from_payload(cached[f"stk_{symbol}"])
+        else:
+            misses.append(symbol)
+
+    if misses and allow_stale and STALE_WHILE_REVALIDATE:
+        stale = _cache_get_many([f"stk_{s}" for s in misses], DEFAULT_TTL_SECONDS_STOCKS + STALE_GRACE_SECONDS_STOCKS)
+        stale_symbols = [s for s in misses if f"stk_{s}" in stale]
+        for symbol in stale_symbols:
+            out[symbol] = _quote_from_payload(stale[f"stk_{symbol}"])
+        if stale_symbols:
+            # One background batch refreshes every stale symbol together.
+            _revalidate(
+                "stk_many:" + ",".join(sorted(stale_symbols)),
+                lambda: _fetch_stocks_many(stale_symbols, {}, allow_stale=False),
+            )
+            misses = [s for s in misses if s not in out]
+    return out, misses
+
+
+def _claim_fetches(symbols: List[str]) -> Tuple[Dict[str, FileLock], List[str], Dict[str, Quote]]:
+    """
+    Single-flight for a batch of misses: take the fetch lock of every symbol
+    we can get without waiting. Returns (held locks, symbols another process
+    is already fetching, quotes that landed in the cache before we got the lock).
+    """
+    held: Dict[str, FileLock] = {}
+    waiting: List[str] = []
+    for symbol in symbols:
+        lock = _flight_lock(f"stk_{symbol}")
+        if lock.acquire(blocking=False):
+            held[symbol] = lock
+        else:
+            waiting.append(symbol)
+    landed = _cache_get_many([f"stk_{s}" for s in held], DEFAULT_TTL_SECONDS_STOCKS)
+    return held, waiting, {s: _quote_from_payload(landed[f"stk_{s}"]) for s in held if f"stk_{s}" in landed}
+
+
+def _fetch_stocks_many(symbols: List[str], errors: Dict[str, str], allow_stale: bool = True) -> Dict[str, Quote]:
+    """Resolve many stock symbols; uncached ones are fetched in spark batches."""
+    out, misses = _cached_stocks(symbols, allow_stale)
+    # Misses another process is already fetching are awaited after our own
+    # download and then read back from the cache.
+    held, waiting, landed = _claim_fetches(misses)
+    out.update(landed)
+    try:
+        out.update(_download_stocks([s for s in held if s not in out], errors))
+    finally:
+        for lock in held.values():
+            lock.release()
+
+    for symbol in waiting:
+        try:
+            out[symbol] = _refresh_stock(symbol)
+        except Exception as e:
+            errors[symbol] = str(e)
+    return out
+
+
+def _download_stocks(symbols: List[str], errors: Dict[str, str]) -> Dict[str, Quote]:
+    """
+    Fetch `symbols` (caller holds their flight locks): Yahoo spark requests of
+    SPARK_CHUNK symbols each (one rate-limit token per request), then the
+    ranked providers for whatever they did not resolve.
+    """
+    out: Dict[str, Quote] = {}
+    endpoint = _spark_endpoint() if len(symbols) > 1 else None
+    if endpoint:
+
+        def bulk(chunk: List[str]) -> None:
+            try:
+                out.update(_spark_quotes(*endpoint, chunk))
+            except Exception:
+                pass  # these symbols take the per-symbol path
+
+        _run_all(bulk, [symbols[i : i + SPARK_CHUNK] for i in range(0, len(symbols), SPARK_CHUNK)])
+
+    # Single misses, and symbols the spark requests did not resolve (including
+    # unknown ones, so they get a proper error), go to the ranked providers.
+    def fetch(symbol: str) -> None:
+        try:
+            out[symbol] = _fetch_stock_live(symbol)
+        except Exception as e:
+            errors[symbol] = str(e)
+
+    _run_all(fetch, [s for s in symbols if s not in out])
+    return out
+
+
+def _fetch_meta_live(symbol: str) -> Dict[str, Any]:
+    import yfinance as yf
+
+    # Heavier and more likely to rate-limit than a price. One attempt only: metadata is
+    # optional, and retrying a 429 here would hold up the price it decorates.
+    info = market_ratelimit.call("yahoo", yf.Ticker(symbol, **_yf_session()).get_info, retries=0)
+    if not isinstance(info, dict):
+        info = {}
+    meta = {
+        "shortName": info.get("shortName") or info.get("longName"),
+        "currency": info.get("currency"),
+        "exchange": info.get("exchange"),
+        "timezone": info.get("exchangeTimezoneName"),
+        "marketState": info.get("marketState"),
+    }
+    _cache_set(f"meta_{symbol}", meta)
+    return dict(meta, _cached_at=int(time.time()))
+
+
+def _refresh_meta(symbol: str, ttl: int = DEFAULT_TTL_SECONDS_META) -> Dict[str, Any]:
+    cache_key = f"meta_{symbol}"
+    with _flight_lock(cache_key):
+        cached = _cache_get(cache_key, ttl)
+        if cached:
+            return cached
+        return _fetch_meta_live(symbol)
+
+
+def _stock_meta(symbol: str, fetch: bool) -> Optional[Dict[str, Any]]:
+    """Cached metadata for `symbol`; with `fetch`, missing entries are fetched and expired ones refreshed lazily."""
+    cache_key = f"meta_{symbol}"
+    meta = _cache_get(cache_key, DEFAULT_TTL_SECONDS_META)
+    if meta:
+        return meta
+    meta = _cache_get(cache_key, DEFAULT_TTL_SECONDS_META + META_STALE_GRACE_SECONDS)
+    if meta:
+        # Names rarely change: serve the old entry and refresh it for next time.
+        if fetch:
+            _revalidate(cache_key, lambda: _refresh_meta(symbol))
+        return meta
+    if not fetch:
+        return None
+    try:
+        return _refresh_meta(symbol)
+    except Exception:
+        # Non-fatal: still return price
+        return None
+
+
+def _prefetch_meta(symbols: List[str]) -> Set[str]:
+    """Fetch metadata for the symbols with none cached, concurrently; returns those that failed."""
+    grace = DEFAULT_TTL_SECONDS_META + META_STALE_GRACE_SECONDS
+    missing = [s for s in symbols if not _cache_get(f"meta_{s}", grace)]
+    if not missing:
+        return set()
+    from concurrent.futures import ThreadPoolExecutor
+
+    def fetch(symbol: str) -> Optional[str]:
+        try:
+            _refresh_meta(symbol)
+        except Exception:
+            return symbol
+        return None
+
+    with ThreadPoolExecutor(max_workers=min(len(missing), META_WORKERS), thread_name_prefix="quote-meta") as pool:
+        return {s for s in pool.map(fetch, missing) if s}
+
+
+def _needs_meta(q: Quote) -> bool:
+    return not (q.currency and q.extra.get("shortName") and q.extra.get("exchange"))
+
+
+def _enrich_many(quotes: Dict[str, Quote], fetch: bool) -> Dict[str, Quote]:
+    """_enrich over a batch; cold metadata is fetched for all of it at once, not one get_info per symbol."""
+    no_meta = _prefetch_meta([s for s, q in quotes.items() if _needs_meta(q)]) if fetch else set()
+    return {s: _enrich(q, fetch and s not in no_meta) for s, q in quotes.items()}
+
+
+def _enrich(q: Quote, fetch: bool) -> Quote:
+    """Copy of a stock quote with name/currency/exchange filled in from the metadata cache."""
+    meta = _stock_meta(q.symbol, fetch and _needs_meta(q))
+    if not meta:
+        return q
+    extra = dict(q.extra)
+    for k in ("exchange", "timezone"):
+        if not extra.get(k) and meta.get(k):
+            extra[k] = meta[k]
+    if meta.get("shortName"):
+        extra["shortName"] = meta["shortName"]
+    if meta.get("marketState") and int(time.time()) - int(meta.get("_cached_at", 0)) <= MARKET_STATE_TTL_SECONDS:
+        extra["marketState"] = meta["marketState"]
+    return Quote(**dict(asdict(q), currency=q.currency or meta.get("currency"), extra=extra))
+
+
+def _market_state(symbol: str, fetch: bool) -> Optional[str]:
+    """Yahoo marketState (REGULAR, PRE, POST, CLOSED, ...) if known from recent metadata."""
+    meta = _cache_get(f"meta_{symbol}", MARKET_STATE_TTL_SECONDS)
+    if meta is None and fetch:
+        try:
+            meta = _refresh_meta(symbol, ttl=MARKET_STATE_TTL_SECONDS)
+        except Exception:
+            return None
+    return (meta or {}).get("marketState")
+
+
+def _market_closed(symbol: str, q: Optional[Quote], fetch: bool) -> bool:
+    state = _market_state(symbol, fetch)
+    if state is not None:
+        return state != "REGULAR"
+    extra = q.extra if q else {}
+    return market_calendar.closed_until(extra.get("exchange"), extra.get("timezone"), time.time()) is not None
+
+
+def fetch_quote(symbol: str, enrich: Optional[bool] = None) -> Quote:
+    s = symbol.strip()
     fx = _parse_fx_pair(s)
+    key = "/".join(fx) if fx else s
+    remembered = _negative_hits([key]).get(key)
+    if remembered is not None:
+        raise SymbolError(remembered, cached=True)
     if fx:
         base, quote = fx
-        q = _fetch_fx(base, quote)
-    else:
-        q = _fetch_stock(s)
+        return _fetch_fx(base, quote)
+    return _enrich(_fetch_stock(s), ENRICH if enrich is None else enrich)
+
+
+def fetch_quotes(
+    symbols: List[str],
+    errors: Optional[Dict[str, str]] = None,
+    enrich: Optional[bool] = None,
+    cached_errors: Optional[Set[str]] = None,
+) -> List[Quote]:
+    """
+    Fetch quotes for many symbols, in input order (duplicates dropped).
+
+    Uncached stocks are resolved with one multi-ticker download and FX pairs
+    from the cached rate books (at most one pivot snapshot request). Stock
+    quotes are enriched from the metadata cache; `enrich` (default ENRICH)
+    controls whether metadata the quote lacks may be fetched (concurrently,
+    one attempt per symbol). If `errors` is given,
+    failing symbols are recorded there (symbol -> message) and skipped;
+    otherwise the first failure raises RuntimeError. Symbols answered from
+    the negative cache are skipped without a provider call and, if given,
+    added to `cached_errors`.
+    """
+    order: List[str] = []
+    seen = set()
+    stocks: List[str] = []
+    pairs: Dict[str, Tuple[str, str]] = {}
+    for raw in symbols:
+        s = raw.strip()
+        if not s or s in seen:
+            continue
+        seen.add(s)
+        order.append(s)
+        fx = _parse_fx_pair(s)
+        if fx:
+            pairs[s] = fx
+        else:
+            stocks.append(s)
+
+    failed = _negative_hits(stocks + ["/".join(p) for p in pairs.values()])
+    remembered = set(failed)
+    stocks = [s for s in stocks if s not in remembered]
+    resolved: Dict[str, Quote] = {}
+    if stocks:
+        resolved.update(_enrich_many(_fetch_stocks_many(stocks, failed), ENRICH if enrich is None else enrich))
+    fx_pairs = [p for p in dict.fromkeys(pairs.values()) if "/".join(p) not in remembered]
+    if fx_pairs:
+        resolved.update(_fetch_fx_many(fx_pairs, failed))
+
+    out: List[Quote] = []
+    for s in order:
+        key = "/".join(pairs[s]) if s in pairs else s
+        if key in resolved:
+            out.append(resolved[key])
+        elif key in remembered and errors is None:
+            raise SymbolError(failed[key], cached=True)
+        elif errors is not None:
+            errors[s] = failed.get(key, "No quote returned")
+            if key in remembered and cached_errors is not None:
+                cached_errors.add(s)
+        else:
+            raise RuntimeError(failed.get(key, f"No quote returned for symbol: {s}"))
+    return out
+
+
+def quote_results(
+    symbols: List[str], quotes: List[Quote], errors: Dict[str, str], cached_errors: Optional[Set[str]] = None
+) -> List[Dict[str, Any]]:
+    """
+    JSON-ready rows in input order: quote dicts, or {"symbol", "error",
+    "cached_error"} for failures (cached_error: answered from the negative cache).
+    Every input gets its row, including repeats and spellings of the same pair.
+    """
+    by_symbol = {q.symbol: q for q in quotes}
+    results = []
+    for raw in symbols:
+        s = raw.strip()
+        fx = _parse_fx_pair(s)
+        key = "/".join(fx) if fx else s
+        if s in errors:
+            results.append({"symbol": s, "error": errors[s], "cached_error": s in (cached_errors or ())})
+        elif key in by_symbol:
+            results.append(asdict(by_symbol[key]))
+    return results
+
+
+def watch(
+    symbols: List[str],
+    interval: float = WATCH_INTERVAL_SECONDS,
+    enrich: Optional[bool] = None,
+    emit: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> None:
+    """
+    Poll `symbols` until interrupted, emitting a row (as in quote_results) only
+    when a symbol's price or error changes.
+
+    The polling interval stretches to WATCH_CLOSED_INTERVAL_SECONDS while the
+    marketState of every watched stock (or, without one, the local trading
+    calendar) says its market is not in regular trading.
+    """
+    if emit is None:
+        emit = lambda row: print(json.dumps(row, ensure_ascii=False), flush=True)  # noqa: E731
+    fetch_meta = ENRICH if enrich is None else enrich
+    stocks = [s for s in dict.fromkeys(x.strip() for x in symbols) if s and not _parse_fx_pair(s)]
+    last: Dict[str, Tuple[Any, Any]] = {}
+    while True:
+        started = time.monotonic()
+        errors: Dict[str, str] = {}
+        cached_errors: Set[str] = set()
+        quotes = fetch_quotes(symbols, errors=errors, enrich=enrich, cached_errors=cached_errors)
+        for row in quote_results(symbols, quotes, errors, cached_errors):
+            seen = (row.get("price"), row.get("error"))
+            if last.get(row["symbol"]) != seen:
+                last[row["symbol"]] = seen
+                emit(row)
+
+        by_symbol = {q.symbol: q for q in quotes}
+        closed = bool(stocks) and all(_market_closed(s, by_symbol.get(s), fetch_meta) for s in stocks)
+        wait = max(interval, WATCH_CLOSED_INTERVAL_SECONDS) if closed else interval
+        time.sleep(max(0.0, started + wait - time.monotonic()))
+
+
+def _serve_main(argv: List[str]) -> None:
+    import market_daemon
+
+    ap = argparse.ArgumentParser(prog="market_quote.py serve", description="Run the warm quote daemon")
+    ap.add_argument("--socket", default=market_daemon.SOCKET_PATH, help="Unix socket path")
+    ap.add_argument("--swr", action="store_true", help="Serve stale-while-revalidate for every client")
+    ap.add_argument("--no-preload", action="store_true", help="Do not import yfinance at startup")
+    ap.add_argument("--negative-ttl", type=int, default=None, help="Seconds to remember unknown symbols (0 = off)")
+    args = ap.parse_args(argv)
+    market_daemon.serve(
+        args.socket, swr=args.swr, preload_yfinance=not args.no_preload, negative_ttl=args.negative_ttl
+    )
+
+
+def _providers_main() -> None:
+    current = market_providers.stats()
+    rows = []
+    for kind in ("stock", "fx"):
+        for rank, p in enumerate(market_providers.ranked(kind, current), 1):
+            rows.append({"kind": kind, "rank": rank, "name": p.name, **(current.get(p.key) or {"samples": 0})})
+    print(json.dumps(rows, indent=2))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["serve"]:
+        _serve_main(argv[1:])
+        return
+    if argv[:1] == ["providers"]:
+        _providers_main()
+        return
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("symbols", nargs="+", metavar="symbol", help="Ticker (AAPL, ^GSPC) or FX pair (USD/ZAR, EURUSD)")
+    ap.add_argument(
+        "--swr",
+        action="store_true",
+        help="Serve slightly stale cached quotes immediately and refresh them in the background",
+    )
+    ap.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="Fetch concurrently over one pooled HTTP client (same providers and cache; needs httpx)",
+    )
+    ap.add_argument("--concurrency", type=int, default=8, help="Max in-flight requests with --async")
+    ap.add_argument("--no-daemon", action="store_true", help="Fetch in-process even if a quote daemon is running")
+    ap.add_argument(
+        "--negative-ttl",
+        type=int,
+        default=None,
+        help="Seconds to remember symbols with no quote, doubling on repeats (default 300; 0 = off)",
+    )
+    ap.add_argument("--record", metavar="DIR", help="Archive provider HTTP traffic (incl. yfinance) into DIR")
+    ap.add_argument("--replay", metavar="DIR", help="Answer provider requests from a --record archive, offline")
+    ap.add_argument("--watch", action="store_true", help="Keep polling and print one JSON line per changed quote")
+    ap.add_argument(
+        "--interval", type=float, default=WATCH_INTERVAL_SECONDS, help="Seconds between polls with --watch"
+    )
+    ap.add_argument(
+        "--enrich",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="Fetch name/exchange metadata the quote lacks (off by default: only cached metadata is used)",
+    )
+    args = ap.parse_args(argv)
+
+    if args.swr:
+        global STALE_WHILE_REVALIDATE
+        STALE_WHILE_REVALIDATE = True
+    if args.negative_ttl is not None:
+        global NEGATIVE_TTL_SECONDS
+        NEGATIVE_TTL_SECONDS = args.negative_ttl
+    if args.record or args.replay:
+        market_replay.configure(record=args.record, replay=args.replay)
+        # Replayed answers cost the provider nothing; do not pace them.
+        market_ratelimit.ENABLED = not args.replay
+
+    if args.watch:
+        # Let each poll see a new price instead of replaying the cached one for a full TTL.
+        global DEFAULT_TTL_SECONDS_STOCKS
+        DEFAULT_TTL_SECONDS_STOCKS = min(DEFAULT_TTL_SECONDS_STOCKS, max(1, int(args.interval)))
+        try:
+            watch(args.symbols, interval=args.interval, enrich=args.enrich)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    results: Optional[List[Dict[str, Any]]] = None
+    # The daemon has its own transports, so recording/replaying must fetch in-process.
+    # --swr and --negative-ttl are process-wide settings the daemon was started with
+    # (`serve --swr --negative-ttl N`); asking for them per call also fetches in-process.
+    per_call = args.swr or args.negative_ttl is not None
+    if not (args.no_daemon or args.use_async or per_call or market_replay.active()):
+        import market_daemon
+
+        results = market_daemon.request(args.symbols, enrich=args.enrich)
+
+    if results is None:
+        errors: Dict[str, str] = {}
+        cached_errors: Set[str] = set()
+        if args.use_async:
+            import market_async
+
+            quotes = market_async.fetch_quotes_sync(
+                args.symbols,
+                errors=errors,
+                concurrency=args.concurrency,
+                cached_errors=cached_errors,
+                enrich=args.enrich,
+            )
+        elif len(args.symbols) == 1:
+            try:
+                quotes = [fetch_quote(args.symbols[0], enrich=args.enrich)]
+            except Exception as e:
+                # Reported like a batch (and the daemon) would: as the row's error.
+                quotes = []
+                errors[args.symbols[0].strip()] = str(e)
+                if getattr(e, "cached", False):
+                    cached_errors.add(args.symbols[0].strip())
+        else:
+            quotes = fetch_quotes(args.symbols, errors=errors, enrich=args.enrich, cached_errors=cached_errors)
+        results = quote_results(args.symbols, quotes, errors, cached_errors)
 
-    # Print as JSON so the calling agent can format nicely.
-    print(json.dumps(q.__dict__, ensure_ascii=False, indent=2))
+    if len(args.symbols) == 1 and results:
+        # Print as JSON so the calling agent can format nicely; an error row
+        # (with its cached_error flag) also exits non-zero.
+        print(json.dumps(results[0], ensure_ascii=False, indent=2))
+        if "error" in results[0]:
+            raise SystemExit(1)
+        return
+    print(json.dumps(results, ensure_ascii=False, indent=2))
 
 
 if __name__ == "__main__":
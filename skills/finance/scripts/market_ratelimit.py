@@ -0,0 +1,202 @@
+"""
+market_ratelimit.py
+
+Per-provider token buckets shared by every market-tracker process, plus a
+retry policy for rate-limit and transient errors.
+
+Bucket state lives in one small JSON file that doubles as the lock file, so
+concurrent CLI runs, watchlist summaries and daemons draw from the same
+budget. Requests reserve tokens up front (the bucket may go into debt) and
+sleep off the debt outside the lock, so bulk calls such as a 300-ticker
+yf.download are paced instead of rejected.
+
+Limits can be overridden with MARKET_RATE_LIMITS, e.g. "yahoo=2:5,er-api=1:2"
+(requests per second : burst).
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import random
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+from market_locks import locked_file
+
+T = TypeVar("T")
+
+STATE_PATH = os.path.join(".cache", "market-tracker", "ratelimit.json")
+
+# provider -> (requests per second, burst)
+PROVIDER_LIMITS: Dict[str, Tuple[float, float]] = {
+    "yahoo": (4.0, 10.0),
+    "er-api": (1.0, 3.0),
+    # Local market_stub.py server: effectively unlimited.
+    "stub": (1000.0, 1000.0),
+}
+DEFAULT_LIMIT = (2.0, 5.0)
+
+# Switched off when answers do not come from a provider (replaying recorded traffic).
+ENABLED = True
+
+DEFAULT_RETRIES = 4
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_CAP_SECONDS = 60.0
+
+_RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+def _limits() -> Dict[str, Tuple[float, float]]:
+    limits = dict(PROVIDER_LIMITS)
+    for item in os.environ.get("MARKET_RATE_LIMITS", "").split(","):
+        name, _, spec = item.partition("=")
+        rate, _, burst = spec.partition(":")
+        try:
+            limits[name.strip()] = (float(rate), float(burst or rate))
+        except ValueError:
+            continue
+    return limits
+
+
+def reserve(provider: str, tokens: float = 1.0) -> float:
+    """Take `tokens` from the provider's bucket; returns how long the caller must wait first."""
+    if not ENABLED:
+        return 0.0
+    rate, burst = _limits().get(provider, DEFAULT_LIMIT)
+    now = time.time()
+    with locked_file(STATE_PATH) as f:
+        try:
+            state = json.loads(f.read() or "{}")
+        except ValueError:
+            state = {}
+        b = state.get(provider) or {"tokens": burst, "updated": now, "blocked_until": 0.0}
+        level = min(burst, float(b["tokens"]) + (now - float(b["updated"])) * rate) - tokens
+        blocked_until = float(b.get("blocked_until") or 0.0)
+        state[provider] = {"tokens": level, "updated": now, "blocked_until": blocked_until}
+        f.seek(0)
+        f.truncate()
+        f.write(json.dumps(state))
+    debt_wait = -level / rate if level < 0 else 0.0
+    return max(debt_wait, blocked_until - now, 0.0)
+
+
+def penalize(provider: str, seconds: float) -> None:
+    """Pause the provider for every process (e.g. after a 429 with Retry-After)."""
+    until = time.time() + seconds
+    with locked_file(STATE_PATH) as f:
+        try:
+            state = json.loads(f.read() or "{}")
+        except ValueError:
+            state = {}
+        b = state.get(provider)
+        if b is None:
+            _, burst = _limits().get(provider, DEFAULT_LIMIT)
+            b = {"tokens": burst, "updated": time.time()}
+        b["blocked_until"] = max(float(b.get("blocked_until") or 0.0), until)
+        state[provider] = b
+        f.seek(0)
+        f.truncate()
+        f.write(json.dumps(state))
+
+
+def acquire(provider: str, tokens: float = 1.0) -> None:
+    wait = reserve(provider, tokens)
+    if wait > 0:
+        time.sleep(wait)
+
+
+async def acquire_async(provider: str, tokens: float = 1.0) -> None:
+    import asyncio
+
+    # The bucket update waits on a file lock other processes hold; keep it off the event loop.
+    wait = await asyncio.to_thread(reserve, provider, tokens)
+    if wait > 0:
+        await asyncio.sleep(wait)
+
+
+def _status_code(e: BaseException) -> Optional[int]:
+    # requests.HTTPError and httpx.HTTPStatusError both carry .response.status_code.
+    resp = getattr(e, "response", None)
+    code = getattr(resp, "status_code", None)
+    return int(code) if code is not None else None
+
+
+def is_rate_limited(e: BaseException) -> bool:
+    if _status_code(e) == 429:
+        return True
+    # yfinance raises YFRateLimitError without a response attached.
+    return type(e).__name__ == "YFRateLimitError" or "Too Many Requests" in str(e)
+
+
+def is_retryable(e: BaseException) -> bool:
+    if is_rate_limited(e) or _status_code(e) in _RETRYABLE_STATUS:
+        return True
+    # Connection resets/timeouts from requests or httpx.
+    name = type(e).__name__
+    return name in {"ConnectionError", "ConnectTimeout", "ReadTimeout", "Timeout", "TimeoutException", "ConnectError"}
+
+
+def retry_after(e: BaseException) -> Optional[float]:
+    """Seconds requested by a Retry-After header (delta-seconds or HTTP date), if any."""
+    headers = getattr(getattr(e, "response", None), "headers", None) or {}
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    import email.utils
+
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff."""
+    return random.uniform(0, min(BACKOFF_CAP_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt)))
+
+
+def _delay_for(provider: str, e: BaseException, attempt: int) -> float:
+    hinted = retry_after(e)
+    delay = hinted if hinted is not None else backoff_delay(attempt)
+    if is_rate_limited(e):
+        # Everyone sharing the bucket should back off, not just this caller.
+        penalize(provider, delay)
+    return delay
+
+
+def call(provider: str, fn: Callable[[], T], retries: int = DEFAULT_RETRIES, tokens: float = 1.0) -> T:
+    """Run `fn` under the provider's rate limit, retrying rate-limit and transient failures."""
+    attempt = 0
+    while True:
+        acquire(provider, tokens)
+        try:
+            return fn()
+        except Exception as e:
+            if attempt >= retries or not is_retryable(e):
+                raise
+            time.sleep(_delay_for(provider, e, attempt))
+            attempt += 1
+
+
+async def call_async(
+    provider: str, fn: Callable[[], Awaitable[T]], retries: int = DEFAULT_RETRIES, tokens: float = 1.0
+) -> T:
+    """Async counterpart of call()."""
+    import asyncio
+
+    attempt = 0
+    while True:
+        await acquire_async(provider, tokens)
+        try:
+            return await fn()
+        except Exception as e:
+            if attempt >= retries or not is_retryable(e):
+                raise
+            # _delay_for may write the shared state (penalize), so it runs in a thread too.
+            await asyncio.sleep(await asyncio.to_thread(_delay_for, provider, e, attempt))
+            attempt += 1
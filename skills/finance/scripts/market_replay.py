@@ -0,0 +1,247 @@
+"""
+market_replay.py
+
+Record provider HTTP traffic to a directory and replay it offline.
+
+Recording wraps the transports the scripts already use: the requests
+sessions behind market_quote's HTTP providers, the session handed to
+yfinance (so its chart/quote/crumb calls are captured too) and the httpx
+transport used by market_async. Each process appends gzip-compressed JSON
+lines to DIR/traffic-<pid>-<time>.jsonl.gz; yfinance's own cookie/timezone
+cache is kept in DIR as well, so a replay sees the same cache state.
+
+Replay serves responses from every archive in DIR without touching the
+network. Requests are matched on method + URL with volatile query
+parameters (crumb, period1/period2) ignored; repeats of one request are
+answered in recorded order, then the last answer is reused. A request that
+was never recorded fails like a connection error.
+
+Without an archive but with MARKET_STUB_URL set, yfinance_kwargs() sends
+yfinance's requests to that market_stub.py server instead, so the yfinance
+code paths can be exercised (and benchmarked) offline too.
+"""
+
+from __future__ import annotations
+
+import atexit
+import base64
+import glob
+import gzip
+import json
+import os
+import threading
+import time
+from typing import IO, TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+if TYPE_CHECKING:
+    import httpx
+    import requests
+
+# Change between runs without changing the answer.
+VOLATILE_PARAMS = frozenset({"crumb", "period1", "period2", "_"})
+# Bodies are stored decoded, so these would describe the wrong bytes.
+_DROP_HEADERS = frozenset({"content-encoding", "content-length", "transfer-encoding", "connection"})
+
+_ARCHIVE: Optional["_Archive"] = None
+_YF_SESSION: Optional["requests.Session"] = None
+
+
+def request_key(method: str, url: str) -> str:
+    parts = urlsplit(url)
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k not in VOLATILE_PARAMS)
+    return f"{method.upper()} {parts.scheme}://{parts.netloc}{parts.path}?{urlencode(query)}"
+
+
+class _Archive:
+    def __init__(self, directory: str, replay: bool) -> None:
+        self.directory = directory
+        self.replay = replay
+        self._lock = threading.Lock()
+        self._out: Optional[IO[str]] = None
+        self._entries: Dict[str, List[Dict[str, Any]]] = {}
+        self._served: Dict[str, int] = {}
+        os.makedirs(directory, exist_ok=True)
+        if replay:
+            self._load()
+
+    def _load(self) -> None:
+        paths = sorted(glob.glob(os.path.join(self.directory, "traffic-*.jsonl.gz")))
+        if not paths:
+            raise RuntimeError(f"No recorded traffic in {self.directory}")
+        for path in paths:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                try:
+                    for line in f:
+                        entry = json.loads(line)
+                        self._entries.setdefault(entry["key"], []).append(entry)
+                except (EOFError, ValueError):
+                    # Recorder killed mid-write: keep everything before the torn line.
+                    pass
+
+    def lookup(self, method: str, url: str) -> Optional[Tuple[int, Dict[str, str], bytes]]:
+        key = request_key(method, url)
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                return None
+            i = self._served.get(key, 0)
+            self._served[key] = i + 1
+            entry = entries[min(i, len(entries) - 1)]
+        body = base64.b64decode(entry["body_b64"]) if "body_b64" in entry else entry["body"].encode("utf-8")
+        return entry["status"], entry["headers"], body
+
+    def record(self, method: str, url: str, status: int, headers: Dict[str, str], body: bytes) -> None:
+        entry: Dict[str, Any] = {
+            "key": request_key(method, url),
+            "method": method.upper(),
+            "url": url,
+            "status": status,
+            "headers": {k.lower(): v for k, v in headers.items() if k.lower() not in _DROP_HEADERS},
+            "at": round(time.time(), 3),
+        }
+        try:
+            entry["body"] = body.decode("utf-8")
+        except UnicodeDecodeError:
+            entry["body_b64"] = base64.b64encode(body).decode("ascii")
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self._out is None:
+                name = f"traffic-{os.getpid()}-{int(time.time())}.jsonl.gz"
+                self._out = gzip.open(os.path.join(self.directory, name), "at", encoding="utf-8")
+                atexit.register(self.close)
+            self._out.write(line)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._out is not None:
+                self._out.close()
+                self._out = None
+
+
+def configure(record: Optional[str] = None, replay: Optional[str] = None) -> None:
+    """Start recording to / replaying from a directory (at most one of the two)."""
+    global _ARCHIVE
+    if record and replay:
+        raise ValueError("Use either record or replay, not both")
+    directory = record or replay
+    _ARCHIVE = _Archive(directory, replay=bool(replay)) if directory else None
+
+
+def active() -> bool:
+    return _ARCHIVE is not None
+
+
+def replaying() -> bool:
+    return _ARCHIVE is not None and _ARCHIVE.replay
+
+
+def _adapter() -> Any:
+    from requests.adapters import BaseAdapter, HTTPAdapter
+    from requests.exceptions import ConnectionError as RequestsConnectionError
+    from requests.models import Response
+    from requests.structures import CaseInsensitiveDict
+    from requests.utils import get_encoding_from_headers
+
+    archive = _ARCHIVE
+    assert archive is not None
+
+    class RecordingAdapter(HTTPAdapter):
+        def send(self, request: Any, **kwargs: Any) -> Any:
+            resp = super().send(request, **kwargs)
+            archive.record(request.method, request.url, resp.status_code, dict(resp.headers), resp.content)
+            return resp
+
+    class ReplayAdapter(BaseAdapter):
+        def send(self, request: Any, **kwargs: Any) -> Any:
+            hit = archive.lookup(request.method, request.url)
+            if hit is None:
+                raise RequestsConnectionError(f"Not in replay archive: {request.method} {request.url}", request=request)
+            status, headers, body = hit
+            resp = Response()
+            resp.status_code = status
+            resp.reason = "Replayed"
+            resp.headers = CaseInsensitiveDict(headers)
+            resp.encoding = get_encoding_from_headers(resp.headers)
+            resp._content = body
+            resp.url = request.url
+            resp.request = request
+            return resp
+
+        def close(self) -> None:
+            pass
+
+    return ReplayAdapter() if archive.replay else RecordingAdapter()
+
+
+def new_session() -> "requests.Session":
+    """A requests.Session that records or replays through the configured archive."""
+    import requests
+
+    session = requests.Session()
+    if _ARCHIVE is not None:
+        adapter = _adapter()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+    return session
+
+
+def yfinance_session() -> "requests.Session":
+    """Shared session for yfinance (it keeps one per process), with its cache moved into the archive dir."""
+    global _YF_SESSION
+    if _YF_SESSION is None:
+        import yfinance as yf
+
+        assert _ARCHIVE is not None
+        yf.set_tz_cache_location(os.path.join(_ARCHIVE.directory, "yfinance-cache"))
+        _YF_SESSION = new_session()
+    return _YF_SESSION
+
+
+def yfinance_kwargs() -> Dict[str, Any]:
+    """session= kwargs for yfinance calls: archive session, stub redirect, or yfinance's default."""
+    global _YF_SESSION
+    if _ARCHIVE is not None:
+        return {"session": yfinance_session()}
+    stub = os.environ.get("MARKET_STUB_URL")
+    if stub:
+        if _YF_SESSION is None:
+            import market_stub
+
+            _YF_SESSION = market_stub.redirect_session(stub)
+        return {"session": _YF_SESSION}
+    return {}
+
+
+def httpx_transport(limits: "httpx.Limits") -> "httpx.AsyncBaseTransport":
+    """Async httpx transport that records or replays through the configured archive."""
+    import httpx
+
+    archive = _ARCHIVE
+    assert archive is not None
+
+    class RecordingTransport(httpx.AsyncBaseTransport):
+        def __init__(self) -> None:
+            self._inner = httpx.AsyncHTTPTransport(limits=limits)
+
+        async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+            resp = await self._inner.handle_async_request(request)
+            raw = await resp.aread()
+            await resp.aclose()
+            out = httpx.Response(resp.status_code, headers=resp.headers, content=raw, request=request)
+            body = out.read()  # decoded per Content-Encoding
+            archive.record(request.method, str(request.url), resp.status_code, dict(resp.headers), body)
+            return out
+
+        async def aclose(self) -> None:
+            await self._inner.aclose()
+
+    class ReplayTransport(httpx.AsyncBaseTransport):
+        async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+            hit = archive.lookup(request.method, str(request.url))
+            if hit is None:
+                raise httpx.ConnectError(f"Not in replay archive: {request.method} {request.url}", request=request)
+            status, headers, body = hit
+            return httpx.Response(status, headers=headers, content=body, request=request)
+
+    return ReplayTransport() if archive.replay else RecordingTransport()
@@ -0,0 +1,231 @@
+"""
+market_risk.py
+
+Rolling covariance / correlation and annualized volatility for a set of
+symbols (the watchlist), from the locally stored daily series: stocks via
+market_series.load_panel, FX pairs from the local FX history.
+
+The statistics cover the last `window` daily returns and are kept as running
+sums over that window: per symbol the sum of returns and the number of
+observations, per pair the sum of products (one N x N matrix). A new bar
+is one O(N^2) update (add the new return row, subtract the one leaving the
+window) instead of an O(N^2 * window) recompute. The sums, the window's
+returns and the last bar's closes are cached per symbol set and window in
+.cache/market-tracker/risk/. The cache is rebuilt from the returns when
+the stored history was re-adjusted (closes at the cached last bar differ),
+when it is more than a window behind, and every REBUILD_EVERY updates to
+bound floating-point drift.
+
+Symbols are aligned on the stocks' trading days (on all dates for an FX-only
+list); a day without a bar counts as a zero return but not as an
+observation. Statistics of symbols with fewer than MIN_OBSERVATIONS
+observations in the window are reported as null.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import market_series
+
+CACHE_DIR = os.path.join(".cache", "market-tracker", "risk")
+DEFAULT_WINDOW = 63
+BARS_PER_YEAR = 252
+MIN_OBSERVATIONS = 20
+# Incremental updates before the sums are recomputed from the window's returns.
+REBUILD_EVERY = 252
+# Relative close difference at the cached last bar that marks the history as re-adjusted.
+_CLOSE_TOLERANCE = 1e-9
+
+
+@dataclass
+class Moments:
+    """Running sums over the last `window` return rows (oldest first)."""
+
+    returns: np.ndarray  # (window, N), zero where a symbol had no bar
+    valid: np.ndarray  # (window, N) bool
+    s1: np.ndarray  # (N,) sum of returns
+    s2: np.ndarray  # (N, N) sum of outer products
+    count: np.ndarray  # (N,) observations
+    updates: int = 0
+
+    @classmethod
+    def build(cls, returns: np.ndarray, valid: np.ndarray) -> "Moments":
+        returns = np.ascontiguousarray(returns, dtype=float)
+        return cls(returns, valid.copy(), returns.sum(axis=0), returns.T @ returns, valid.sum(axis=0))
+
+    def push(self, row: np.ndarray, valid: np.ndarray) -> None:
+        """Slide the window one bar: O(N^2) rank-one update instead of a recompute."""
+        old, old_valid = self.returns[0], self.valid[0]
+        self.s1 += row - old
+        self.s2 += np.outer(row, row) - np.outer(old, old)
+        self.count += valid.astype(int) - old_valid.astype(int)
+        self.returns = np.vstack([self.returns[1:], row])
+        self.valid = np.vstack([self.valid[1:], valid])
+        self.updates += 1
+
+    def covariance(self) -> np.ndarray:
+        """Sample covariance of daily returns over the window."""
+        n = len(self.returns)
+        return (self.s2 - np.outer(self.s1, self.s1) / n) / max(n - 1, 1)
+
+
+def _cache_path(symbols: List[str], window: int) -> str:
+    digest = hashlib.sha1("\n".join([str(window), *symbols]).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(CACHE_DIR, f"{digest}.npz")
+
+
+def _load_state(path: str) -> Optional[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            return {k: data[k] for k in data.files}
+    except (OSError, ValueError):
+        return None
+
+
+def _save_state(path: str, symbols: List[str], last_date: pd.Timestamp, last_close: np.ndarray, m: Moments) -> None:
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        np.savez(
+            f,
+            symbols=np.array(symbols),
+            last_date=np.array(last_date.isoformat()),
+            last_close=last_close,
+            returns=m.returns,
+            valid=m.valid,
+            s1=m.s1,
+            s2=m.s2,
+            count=m.count,
+            updates=np.array(m.updates),
+        )
+    os.replace(tmp, path)
+
+
+def closes(items: List[str], days: int) -> Tuple[pd.DataFrame, Dict[str, str]]:
+    """Aligned daily closes (dates x items, NaN where an item has no bar) and per-item errors."""
+    pairs = {s: market_series._parse_fx_pair(s) for s in items}
+    fx = [p for p in pairs.values() if p]
+    stocks = [s for s, p in pairs.items() if not p]
+    frames: Dict[str, pd.DataFrame] = {}
+    errors: Dict[str, str] = {}
+    if stocks:
+        frames, errors = market_series.load_panel(stocks, days)
+    stock_dates = market_series.wide(frames, ["close"]).index if frames else None
+    if fx:
+        fx_frames, fx_errors = market_series.load_fx(fx, days)
+        frames.update(fx_frames)
+        errors.update(fx_errors)
+    order = [f"{p[0]}/{p[1]}" if p else s.strip().upper() for s, p in pairs.items()]
+    frames = {k: frames[k] for k in dict.fromkeys(order) if k in frames}
+    if not frames:
+        return pd.DataFrame(), errors
+    close = market_series.wide(frames, ["close"])
+    close.columns = list(frames)
+    if stock_dates is not None:
+        close = close.loc[close.index.isin(stock_dates)]
+    return close, errors
+
+
+def _returns(close: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Daily returns for rows 1.. of `close` (NaN = no bar): (zero-filled returns, observed mask)."""
+    filled = pd.DataFrame(close).ffill().to_numpy()
+    prev, cur = filled[:-1], close[1:]
+    valid = ~np.isnan(prev) & ~np.isnan(cur)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = np.where(valid, cur / prev - 1.0, 0.0)
+    return returns, valid
+
+
+def update(close: pd.DataFrame, window: int, use_cache: bool = True) -> Tuple[Moments, Dict[str, Any]]:
+    """
+    Moments over the last `window` returns of `close`, continued from the
+    cache when it is current. Returns (moments, {"bars_added", "rebuilt"}).
+    """
+    symbols = list(close.columns)
+    returns, valid = _returns(close.to_numpy(dtype=float))
+    values = close.ffill().to_numpy(dtype=float)
+    window = min(window, len(returns))
+    path = _cache_path(symbols, window)
+    state = _load_state(path) if use_cache else None
+
+    moments: Optional[Moments] = None
+    added = 0
+    if state is not None and list(state["symbols"]) == symbols and len(state["returns"]) == window:
+        last = pd.Timestamp(str(state["last_date"]))
+        if last in close.index:
+            i = close.index.get_loc(last)
+            cached, now = state["last_close"], values[i]
+            same = np.allclose(cached, now, rtol=_CLOSE_TOLERANCE, atol=0.0, equal_nan=True)
+            new = len(values) - 1 - i
+            if same and new <= window and int(state["updates"]) + new < REBUILD_EVERY:
+                moments = Moments(
+                    state["returns"], state["valid"], state["s1"], state["s2"], state["count"], int(state["updates"])
+                )
+                # Return row r is the move into close row r + 1.
+                for r in range(i, len(returns)):
+                    moments.push(returns[r], valid[r])
+                added = new
+    rebuilt = moments is None
+    if moments is None:
+        moments = Moments.build(returns[len(returns) - window :], valid[len(valid) - window :])
+        added = window
+    if use_cache and window:
+        _save_state(path, symbols, close.index[-1], values[-1], moments)
+    return moments, {"bars_added": added, "rebuilt": rebuilt}
+
+
+def _round(x: float, digits: int = 6) -> Optional[float]:
+    return None if not np.isfinite(x) else round(float(x), digits)
+
+
+def risk(
+    items: List[str], window: int = DEFAULT_WINDOW, use_cache: bool = True, covariance: bool = False
+) -> Dict[str, Any]:
+    """Annualized volatility per item and the correlation (optionally covariance) matrix, as a JSON-ready dict."""
+    # Enough calendar days for window + 1 trading days (5 a week, plus holidays).
+    days = (window + 1) * 7 // 5 + 14
+    close, errors = closes(items, days)
+    if close.empty or len(close) < 3:
+        return {"items": items, "symbols": [], "volatility": [], "correlation": [], "errors": errors}
+
+    moments, info = update(close, window, use_cache)
+    cov = moments.covariance()
+    sd = np.sqrt(np.diag(cov))
+    enough = moments.count >= min(MIN_OBSERVATIONS, len(moments.returns))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        corr = cov / np.outer(sd, sd)
+    mask = ~np.outer(enough, enough)
+    corr[mask] = np.nan
+    symbols = list(close.columns)
+    out: Dict[str, Any] = {
+        "items": items,
+        "asof": close.index[-1].strftime(market_series.DATE_FORMAT),
+        "window": len(moments.returns),
+        "symbols": symbols,
+        "volatility": [
+            {
+                "symbol": sym,
+                "annual_volatility": _round(sd[j] * np.sqrt(BARS_PER_YEAR)) if enough[j] else None,
+                "observations": int(moments.count[j]),
+            }
+            for j, sym in enumerate(symbols)
+        ],
+        "correlation": [[_round(x, 4) for x in row] for row in corr],
+    }
+    if covariance:
+        annual = cov * BARS_PER_YEAR
+        annual[mask] = np.nan
+        out["covariance"] = [[_round(x, 8) for x in row] for row in annual]
+    out["incremental"] = info
+    out["errors"] = errors
+    return out
+
@@ -2,28 +2,68 @@
 """
 market_series.py
 
-Fetch historical series and print CSV to stdout.
+Fetch historical series and print them to stdout (CSV by default; also
+JSON lines, Parquet or an Arrow IPC stream, written in chunks).
 
-Stocks/ETFs/indices: yfinance history (daily)
-FX: derived from ExchangeRate-API open endpoint (daily snapshots not provided here),
-    so we return a simple "latest only" line unless you add a historical FX provider.
+Stocks/ETFs/indices: yfinance history (daily, or intraday with --interval),
+kept in the incremental local store of market_store.py: repeat runs download
+only the bars not stored yet. --resample W|M|Q serves weekly / monthly /
+quarterly OHLCV rolled up from the stored bars (and cached next to them).
+Several symbols are fetched in one download and emitted as one panel
+aligned on date (--layout wide|long).
+FX: the open ExchangeRate-API endpoint has no history, so pairs are served
+    from the local history market_fxhistory.py accumulates: one snapshot per
+    provider update, recorded whenever a rate book is fetched (this script
+    fetches today's first). The series starts when recording started.
 
 Usage:
   python scripts/market_series.py AAPL --days 30
   python scripts/market_series.py ^GSPC --days 120
   python scripts/market_series.py USD/ZAR --days 30
+  python scripts/market_series.py AAPL --days 30 --record traffic/   # later: --replay traffic/ (offline)
+  python scripts/market_series.py AAPL --days 30 --no-store            # always download the full window
+  python scripts/market_series.py AAPL MSFT ^GSPC --days 365 --layout wide --fields close
+  python scripts/market_series.py AAPL MSFT --days 365 --layout long
+  python scripts/market_series.py AAPL MSFT --days 3650 --layout long --format arrow | consumer
+  python scripts/market_series.py AAPL --days 3650 --format parquet --output aapl.parquet
+  python scripts/market_series.py AAPL --days 5 --interval 5m
+  python scripts/market_series.py AAPL MSFT --days 3650 --resample M --fields close
 """
 
 from __future__ import annotations
 
 import argparse
+import ast
+import logging
 import sys
 import re
-from datetime import datetime, timedelta
-from typing import Optional, Tuple
+from datetime import date, datetime, timedelta
+from typing import IO, Dict, Iterator, List, Optional, Tuple
 
 import pandas as pd
 
+import market_calendar
+import market_fxhistory
+import market_replay
+import market_store
+
+# Serve and extend the local store (--no-store downloads the whole window every time).
+USE_STORE = True
+
+OHLCV_COLUMNS = ["open", "high", "low", "close", "volume"]
+# yf.download fetches each symbol in its own request; this many in parallel.
+DOWNLOAD_THREADS = 8
+
+# Bar sizes and how far back Yahoo serves them (days; None = no limit).
+INTERVALS = {"1m": 7, "5m": 60, "15m": 60, "30m": 60, "1h": 730, "1d": None}
+RESAMPLE_RULES = list(market_store.RESAMPLE_RULES)
+
+FORMATS = ["csv", "jsonl", "parquet", "arrow"]
+# Rows formatted / converted at a time, so output memory does not grow with the series.
+OUTPUT_CHUNK_ROWS = 50_000
+DATE_FORMAT = "%Y-%m-%d"
+INTRADAY_DATE_FORMAT = "%Y-%m-%d %H:%M"
+
 
 def _parse_fx_pair(s: str) -> Optional[Tuple[str, str]]:
     s = s.strip().upper()
@@ -39,47 +79,304 @@ def _parse_fx_pair(s: str) -> Optional[Tuple[str, str]]:
     return None
 
 
-def _stock_series(symbol: str, days: int) -> pd.DataFrame:
+class _ErrorLog(logging.Handler):
+    """Collects the per-symbol errors yf.download only logs ("['SYM']: message")."""
+
+    def __init__(self) -> None:
+        super().__init__(logging.ERROR)
+        self.errors: Dict[str, str] = {}
+
+    def emit(self, record: logging.LogRecord) -> None:
+        head, sep, message = record.getMessage().partition("]: ")
+        if not sep or not head.startswith("["):
+            return
+        try:
+            symbols: List[str] = ast.literal_eval(head + "]")
+        except (ValueError, SyntaxError):
+            return
+        for sym in symbols:
+            self.errors[str(sym).upper()] = message
+
+
+def _normalize(df: pd.DataFrame, symbol: str) -> pd.DataFrame:
+    """yfinance frame -> bars indexed by "date" with lowercase open/high/low/close/volume columns."""
+    if isinstance(df.columns, pd.MultiIndex):
+        # Columns are (field, ticker) tuples, even for a single ticker.
+        level = df.columns.nlevels - 1
+        tickers = df.columns.get_level_values(level)
+        df = df.xs(symbol, axis=1, level=level) if symbol in tickers else df.droplevel(level, axis=1)
+    df = df.rename(columns=lambda c: str(c).lower().replace(" ", "_"))
+    df = df[[c for c in OHLCV_COLUMNS if c in df.columns] + [c for c in df.columns if c not in OHLCV_COLUMNS]]
+    df = df.dropna(how="all")
+    df.index = pd.DatetimeIndex(df.index).tz_localize(None)
+    df.index.name = "date"
+    df.columns.name = None
+    return df
+
+
+def _download(
+    symbols: List[str], start: date, end: date, interval: str = "1d"
+) -> Tuple[Dict[str, pd.DataFrame], Dict[str, str]]:
+    """
+    Bars for [start, end) for all `symbols` in one yf.download call.
+
+    Returns ({symbol: bars}, {symbol: error}). Yahoo's "no price data found"
+    is only taken as an empty frame when every day of the window is a weekend
+    or holiday somewhere (market_calendar); over trading days it is reported
+    as an error, since Yahoo gives the same answer on network errors and rate
+    limits.
+    """
     import yfinance as yf
 
-    end = datetime.utcnow()
+    log = _ErrorLog()
+    logger = logging.getLogger("yfinance")
+    logger.addHandler(log)
+    try:
+        df = yf.download(
+            symbols,
+            start=start.isoformat(),
+            end=end.isoformat(),
+            progress=False,
+            interval=interval,
+            auto_adjust=True,
+            threads=min(len(symbols), DOWNLOAD_THREADS),
+            **market_replay.yfinance_kwargs(),
+        )
+    finally:
+        logger.removeHandler(log)
+
+    quiet = all(market_calendar.closed_somewhere(start + timedelta(days=i)) for i in range((end - start).days))
+    frames: Dict[str, pd.DataFrame] = {}
+    errors: Dict[str, str] = {}
+    for sym in symbols:
+        error = log.errors.get(sym)
+        if error and not (quiet and "no price data found" in error):
+            errors[sym] = error
+        elif df is None or len(df) == 0:
+            frames[sym] = pd.DataFrame(columns=OHLCV_COLUMNS, index=pd.DatetimeIndex([], name="date"))
+        else:
+            frames[sym] = _normalize(df, sym)
+    return frames, errors
+
+
+def load_panel(
+    symbols: List[str], days: int, interval: str = "1d", resample: Optional[str] = None
+) -> Tuple[Dict[str, pd.DataFrame], Dict[str, str]]:
+    """
+    Bars for the last `days` days per stock symbol, from the local store
+    where possible; symbols missing the same dates share one download.
+
+    Intraday intervals add today's bars so far (fetched every time, never
+    stored). `resample` ("W", "M", "Q") returns rollups of the stored bars
+    instead, from the cached rollup files.
+
+    Returns ({symbol: bars indexed by date}, {symbol: error}).
+    """
+    limit = INTERVALS[interval]
+    if limit is not None and days > limit:
+        print(f"Note: Yahoo serves {interval} bars for the last {limit} days only; using --days {limit}", file=sys.stderr)
+        days = limit
+    # The end is exclusive: today's bar is still forming and never stored.
+    end = datetime.utcnow().date()
     start = end - timedelta(days=days)
+    symbols = list(dict.fromkeys(s.strip().upper() for s in symbols))
+    errors: Dict[str, str] = {}
 
-    df = yf.download(symbol, start=start.date().isoformat(), end=end.date().isoformat(), progress=False)
-    if df is None or len(df) == 0:
-        raise RuntimeError(f"No data returned for symbol: {symbol}")
+    def fetch(syms: List[str], a: date, b: date) -> Dict[str, pd.DataFrame]:
+        frames, failed = _download(syms, a, b, interval)
+        errors.update(failed)
+        return frames
 
+    stored = USE_STORE and market_store.available()
+    if stored:
+        frames = market_store.load_many(symbols, start, end, fetch, interval)
+    else:
+        frames = fetch(symbols, start, end)
+
+    if resample:
+        lo = pd.Timestamp(start)
+        for sym in list(frames):
+            rolled = market_store.rollup(sym, interval, resample) if stored else None
+            if rolled is None:
+                rolled = market_store.resample_bars(frames[sym], resample)
+            # Keep every period that ends inside the window (the first may start before it).
+            frames[sym] = rolled[rolled.index >= lo]
+    elif interval != "1d" and frames:
+        # Nothing yet today (pre-market, a holiday) is not an error.
+        live, _ = _download(list(frames), end, end + timedelta(days=1), interval)
+        for sym, today in live.items():
+            if len(today):
+                frames[sym] = pd.concat([frames[sym], today])
+
+    for sym in symbols:
+        if sym not in errors and len(frames.get(sym, ())) == 0:
+            frames.pop(sym, None)
+            errors[sym] = f"No data returned for symbol: {sym}"
+    return {sym: frames[sym] for sym in symbols if sym in frames}, errors
+
+
+def load_fx(
+    pairs: List[Tuple[str, str]], days: int, resample: Optional[str] = None
+) -> Tuple[Dict[str, pd.DataFrame], Dict[str, str]]:
+    """
+    Daily rates ("close") for the last `days` days per FX pair from the local
+    FX history, after fetching the current rate book (cached) so today's
+    snapshot is in it. Returns ({"BASE/QUOTE": rates by date}, {pair: error}).
+    """
+    import market_quote as mq
+
+    today = datetime.utcnow().date()
+    start = today - timedelta(days=days)
+    frames: Dict[str, pd.DataFrame] = {}
+    errors: Dict[str, str] = {}
+    for base, quote in dict.fromkeys(pairs):
+        label = f"{base}/{quote}"
+        try:
+            mq._fx_rate(base, quote)
+            latest = None
+        except Exception as e:
+            latest = str(e)
+        frame = market_fxhistory.series(base, quote, start, today + timedelta(days=1))
+        if frame.empty:
+            errors[label] = latest or (
+                f"No local FX history for {label} yet: it gains one snapshot per provider update as rates are fetched"
+            )
+            continue
+        if frame.index[0] > pd.Timestamp(start) + timedelta(days=1):
+            print(
+                f"Note: local FX history for {label} starts {frame.index[0]:%Y-%m-%d} ({len(frame)} snapshots)",
+                file=sys.stderr,
+            )
+        frames[label] = market_store.resample_bars(frame, resample) if resample else frame
+    return frames, errors
+
+
+def wide(frames: Dict[str, pd.DataFrame], fields: Optional[List[str]] = None) -> pd.DataFrame:
+    """One row per date (union of all symbols' dates), one "<SYMBOL>_<field>" column per symbol and field."""
+    parts = []
+    for sym, df in frames.items():
+        cols = [c for c in (fields or df.columns) if c in df.columns]
+        parts.append(df[cols].rename(columns=lambda c: f"{sym}_{c}"))
+    return pd.concat(parts, axis=1, join="outer", sort=True) if parts else pd.DataFrame()
+
+
+def long(frames: Dict[str, pd.DataFrame], fields: Optional[List[str]] = None) -> pd.DataFrame:
+    """Tidy table: one row per (date, symbol) bar, indexed by date."""
+    parts = []
+    for sym, df in frames.items():
+        cols = [c for c in (fields or df.columns) if c in df.columns]
+        parts.append(df[cols].assign(symbol=sym)[["symbol", *cols]])
+    if not parts:
+        return pd.DataFrame()
+    out = pd.concat(parts)
+    return out.sort_values("symbol", kind="stable").sort_index(kind="stable")
+
+
+def _text_chunks(df: pd.DataFrame, fmt: str, date_format: str) -> Iterator[str]:
+    for i in range(0, max(len(df), 1), OUTPUT_CHUNK_ROWS):
+        chunk = df.iloc[i : i + OUTPUT_CHUNK_ROWS]
+        if fmt == "csv":
+            yield chunk.to_csv(index=False, header=(i == 0), date_format=date_format)
+        elif len(chunk):
+            chunk = chunk.assign(date=chunk["date"].dt.strftime(date_format))
+            yield chunk.to_json(orient="records", lines=True, force_ascii=False) + "\n"
+
+
+def write_frame(
+    df: pd.DataFrame, fmt: str = "csv", out: Optional[IO[bytes]] = None, date_format: str = DATE_FORMAT
+) -> None:
+    """
+    Write a series frame (date index) as csv / jsonl / parquet / arrow (IPC
+    stream), OUTPUT_CHUNK_ROWS rows at a time. `out` defaults to stdout.
+    """
     df = df.reset_index()
-    # Normalize column names (handle MultiIndex tuples from yfinance)
-    cols = {}
-    for c in df.columns:
-        if isinstance(c, tuple):
-            # Flatten tuple to string (e.g., ('Close', 'AAPL') -> 'close')
-            name = "_".join(str(x) for x in c if x).lower().replace(" ", "_")
-        else:
-            name = str(c).lower().replace(" ", "_")
-        cols[c] = name
-    df = df.rename(columns=cols)
-    return df
+    if out is None:
+        sys.stdout.flush()
+        out = sys.stdout.buffer
+    if fmt in ("csv", "jsonl"):
+        for text in _text_chunks(df, fmt, date_format):
+            out.write(text.encode("utf-8"))
+        out.flush()
+        return
+
+    import pyarrow as pa
+
+    schema = pa.Schema.from_pandas(df.iloc[:0], preserve_index=False)
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        writer = pq.ParquetWriter(out, schema)
+    else:
+        writer = pa.ipc.new_stream(out, schema)
+    with writer:
+        for i in range(0, len(df), OUTPUT_CHUNK_ROWS):
+            batch = pa.RecordBatch.from_pandas(df.iloc[i : i + OUTPUT_CHUNK_ROWS], schema=schema, preserve_index=False)
+            writer.write_batch(batch)
+    out.flush()
 
 
 def main() -> None:
     ap = argparse.ArgumentParser()
-    ap.add_argument("symbol", help="Ticker or FX pair")
+    ap.add_argument("symbols", nargs="+", metavar="symbol", help="Ticker(s) or FX pair")
     ap.add_argument("--days", type=int, default=30)
+    ap.add_argument("--interval", choices=list(INTERVALS), default="1d", help="Bar size")
+    ap.add_argument("--resample", choices=RESAMPLE_RULES, help="Roll bars up into weeks, months or quarters")
+    ap.add_argument(
+        "--layout",
+        choices=["wide", "long"],
+        help="Several symbols: wide = one row per date, <SYMBOL>_<field> columns (default); long = one row per bar",
+    )
+    ap.add_argument("--fields", nargs="+", choices=OHLCV_COLUMNS, help="Only these columns (default: all)")
+    ap.add_argument("--format", choices=FORMATS, default="csv", help="Output format (arrow = Arrow IPC stream)")
+    ap.add_argument("--output", "-o", metavar="PATH", help="Write to PATH instead of stdout")
+    ap.add_argument("--record", metavar="DIR", help="Archive provider HTTP traffic (incl. yfinance) into DIR")
+    ap.add_argument("--replay", metavar="DIR", help="Answer provider requests from a --record archive, offline")
+    ap.add_argument("--no-store", action="store_true", help="Bypass the local series store and download everything")
     args = ap.parse_args()
+    if args.format in ("parquet", "arrow") and not args.output and sys.stdout.isatty():
+        raise SystemExit(f"Refusing to write {args.format} to a terminal: redirect stdout or use --output")
+    global USE_STORE
+    if args.no_store:
+        USE_STORE = False
+    if args.record or args.replay:
+        market_replay.configure(record=args.record, replay=args.replay)
 
-    fx = _parse_fx_pair(args.symbol)
+    pairs = {s: _parse_fx_pair(s) for s in args.symbols}
+    fx = [p for p in pairs.values() if p]
+    stocks = [s for s, p in pairs.items() if not p]
+    if fx and args.interval != "1d":
+        raise SystemExit("FX history is daily (one snapshot per provider update); drop --interval for FX pairs")
+
+    frames: Dict[str, pd.DataFrame] = {}
+    errors: Dict[str, str] = {}
     if fx:
-        # Open access endpoint does not provide true historical in this mode.
-        # We intentionally fail loudly so the agent explains the limitation.
-        raise SystemExit(
-            "FX historical series is not supported with the no-key open endpoint. "
-            "Use latest quotes, or add a historical FX provider (paid or other source)."
-        )
+        frames, errors = load_fx(fx, args.days, args.resample)
+    if stocks:
+        stock_frames, stock_errors = load_panel(stocks, args.days, args.interval, args.resample)
+        frames.update(stock_frames)
+        errors.update(stock_errors)
+    # Output in command-line order.
+    order = [f"{p[0]}/{p[1]}" if p else s.strip().upper() for s, p in pairs.items()]
+    frames = {k: frames[k] for k in dict.fromkeys(order) if k in frames}
+    for sym, error in errors.items():
+        print(f"{sym}: {error}", file=sys.stderr)
+    if not frames:
+        raise SystemExit(1)
 
-    df = _stock_series(args.symbol, args.days)
-    df.to_csv(sys.stdout, index=False)
+    if args.layout is None and len(args.symbols) == 1:
+        (df,) = frames.values()
+        if args.fields:
+            df = df[[c for c in args.fields if c in df.columns]]
+    elif args.layout == "long":
+        df = long(frames, args.fields)
+    else:
+        df = wide(frames, args.fields)
+    date_format = INTRADAY_DATE_FORMAT if args.interval != "1d" and not args.resample else DATE_FORMAT
+    if args.output:
+        with open(args.output, "wb") as f:
+            write_frame(df, args.format, f, date_format)
+    else:
+        write_frame(df, args.format, date_format=date_format)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,295 @@
+"""
+market_store.py
+
+Incremental local OHLCV store backing market_series.py.
+
+One Parquet file per symbol and interval under STORE_DIR/<symbol>/, holding
+every bar fetched so far plus a coverage record (the half-open date ranges
+already downloaded) in the file's schema metadata, so data and coverage are
+replaced together atomically. A download only covers its window up to the
+last bar it returned, plus the days after it on which no modelled market
+trades (market_calendar); an empty answer covers nothing, because Yahoo
+answers network errors and rate limits with the same empty "no price data"
+result as a genuinely quiet window.
+
+load_many() serves a date window from disk and downloads only the parts the
+coverage does not include, normally just the new tail since the last run;
+symbols missing the same window share one download.
+Each download also re-fetches up to REVALIDATE_DAYS of adjacent stored days;
+if those bars changed (split / dividend re-adjustment of the whole history),
+the stored series is discarded and the window is fetched in full.
+
+Resampled views (weekly / monthly / quarterly OHLCV) are rolled up from the
+stored base series and kept next to it as <interval>-<rule>.parquet; when
+the base gains bars only the periods from the last rolled-up one onwards
+are recomputed.
+
+Needs pyarrow; without it available() is False and callers fetch directly.
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import json
+import os
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
+from urllib.parse import quote
+
+import pandas as pd
+
+import market_calendar
+from market_locks import FileLock
+
+STORE_DIR = os.path.join(".cache", "market-tracker", "series")
+
+# Days of already-stored bars re-downloaded next to each gap, to detect re-adjusted history.
+REVALIDATE_DAYS = 5
+# Relative close-price difference above which stored bars count as re-adjusted.
+REVALIDATE_TOLERANCE = 1e-6
+
+_COVERAGE_KEY = b"market_tracker.coverage"
+_ROLLUP_KEY = b"market_tracker.rollup"
+
+# --resample rules -> pandas offsets (periods labelled by their last day; weeks end on Friday).
+RESAMPLE_RULES = {"W": "W-FRI", "M": "ME", "Q": "QE"}
+_AGGREGATES = {"open": "first", "high": "max", "low": "min", "close": "last", "volume": "sum"}
+
+Range = Tuple[dt.date, dt.date]  # [start, end)
+Fetch = Callable[[dt.date, dt.date], pd.DataFrame]
+FetchMany = Callable[[List[str], dt.date, dt.date], Dict[str, pd.DataFrame]]
+
+
+def available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def path_for(symbol: str, interval: str = "1d") -> str:
+    return os.path.join(STORE_DIR, quote(symbol.upper(), safe=""), f"{interval}.parquet")
+
+
+def _merge(ranges: List[Range]) -> List[Range]:
+    out: List[Range] = []
+    for a, b in sorted(r for r in ranges if r[0] < r[1]):
+        if out and a <= out[-1][1]:
+            out[-1] = (out[-1][0], max(out[-1][1], b))
+        else:
+            out.append((a, b))
+    return out
+
+
+def gaps(coverage: List[Range], start: dt.date, end: dt.date) -> List[Range]:
+    """Parts of [start, end) not covered by `coverage` (sorted, merged)."""
+    out: List[Range] = []
+    cursor = start
+    for a, b in coverage:
+        if b <= cursor:
+            continue
+        if a >= end:
+            break
+        if a > cursor:
+            out.append((cursor, min(a, end)))
+        cursor = max(cursor, b)
+    if cursor < end:
+        out.append((cursor, end))
+    return out
+
+
+def read_parquet(path: str, key: bytes) -> Tuple[Optional[pd.DataFrame], Any]:
+    """(frame, JSON value stored under `key` in the schema metadata); (None, None) if missing."""
+    import pyarrow.parquet as pq
+
+    if not os.path.exists(path):
+        return None, None
+    table = pq.read_table(path)
+    raw = (table.schema.metadata or {}).get(key)
+    return table.to_pandas(), json.loads(raw) if raw else None
+
+
+def write_parquet(path: str, frame: pd.DataFrame, key: bytes, value: Any) -> None:
+    """Atomically replace `path` with `frame` (index kept), `value` stored as JSON under `key`."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table = pa.Table.from_pandas(frame, preserve_index=True)
+    meta = dict(table.schema.metadata or {})
+    meta[key] = json.dumps(value).encode("utf-8")
+    tmp = f"{path}.{os.getpid()}.tmp"
+    pq.write_table(table.replace_schema_metadata(meta), tmp)
+    os.replace(tmp, path)
+
+
+def read(symbol: str, interval: str = "1d") -> Tuple[Optional[pd.DataFrame], List[Range]]:
+    """(stored bars indexed by date, coverage); (None, []) if nothing is stored."""
+    frame, raw = read_parquet(path_for(symbol, interval), _COVERAGE_KEY)
+    coverage = [(dt.date.fromisoformat(a), dt.date.fromisoformat(b)) for a, b in raw or []]
+    return frame, coverage
+
+
+def _write(symbol: str, interval: str, frame: pd.DataFrame, coverage: List[Range]) -> None:
+    write_parquet(path_for(symbol, interval), frame, _COVERAGE_KEY, [[a.isoformat(), b.isoformat()] for a, b in coverage])
+
+
+def _combine(old: Optional[pd.DataFrame], new: pd.DataFrame) -> pd.DataFrame:
+    if old is None or old.empty:
+        return new.sort_index()
+    if new.empty:
+        return old
+    both = pd.concat([old, new])
+    return both[~both.index.duplicated(keep="last")].sort_index()
+
+
+def _readjusted(old: Optional[pd.DataFrame], new: pd.DataFrame) -> bool:
+    if old is None or new.empty or "close" not in new.columns:
+        return False
+    common = old.index.intersection(new.index)
+    if common.empty:
+        return False
+    a, b = old.loc[common, "close"].astype(float), new.loc[common, "close"].astype(float)
+    return bool(((a - b).abs() > REVALIDATE_TOLERANCE * b.abs()).any())
+
+
+def _window(coverage: List[Range], gap: Range, overlap: dt.timedelta) -> Range:
+    # Overlap stored bars on the side(s) where the gap touches them.
+    a, b = gap
+    after = any(cb == a for _, cb in coverage)
+    before = any(ca == b for ca, _ in coverage)
+    return (a - overlap if after else a, b + overlap if before else b)
+
+
+def _covered(gap: Range, new: pd.DataFrame) -> List[Range]:
+    """The part of `gap` a download returning `new` vouches for: up to its last bar, then closed days."""
+    a, b = gap
+    end = a
+    if len(new):
+        last = pd.Timestamp(new.index.max()).date()
+        end = min(max(last + dt.timedelta(days=1), a), b)
+    while end < b and market_calendar.closed_everywhere(end):
+        end += dt.timedelta(days=1)
+    return [(a, end)] if a < end else []
+
+
+def _apply(symbol: str, interval: str, new: pd.DataFrame, covered: List[Range], replace: bool = False) -> None:
+    """Merge freshly fetched bars into the stored series (re-read under the lock: other writers may have run)."""
+    with FileLock(path_for(symbol, interval) + ".lock"):
+        frame, coverage = (None, []) if replace else read(symbol, interval)
+        _write(symbol, interval, _combine(frame, new), _merge(coverage + covered))
+
+
+def load_many(
+    symbols: Sequence[str], start: dt.date, end: dt.date, fetch: FetchMany, interval: str = "1d"
+) -> Dict[str, pd.DataFrame]:
+    """
+    Bars for [start, end) per symbol, downloading only what the store does not cover.
+
+    Symbols missing the same window (the usual case: every symbol lacks the
+    bars since the last run) are fetched together in one `fetch(symbols, a,
+    b)` call. It returns {symbol: bars indexed by date} (empty frame if there
+    were none) and leaves out symbols whose download failed. A window is only
+    recorded as covered through the last bar returned for it (see _covered),
+    so an empty answer is asked again next time. Failed symbols are left out
+    of the result.
+    """
+    overlap = dt.timedelta(days=REVALIDATE_DAYS)
+    stored = {sym: read(sym, interval) for sym in dict.fromkeys(symbols)}
+    batches: Dict[Range, List[Tuple[str, Range]]] = {}
+    for sym, (_, coverage) in stored.items():
+        for gap in gaps(coverage, start, end):
+            batches.setdefault(_window(coverage, gap, overlap), []).append((sym, gap))
+
+    touched = {sym for members in batches.values() for sym, _ in members}
+    failed: Set[str] = set()
+    refetch: List[str] = []
+    for (a, b), members in sorted(batches.items()):
+        fetched = fetch([sym for sym, _ in members], a, b)
+        for sym, gap in members:
+            new = fetched.get(sym)
+            if new is None:
+                failed.add(sym)
+            elif _readjusted(stored[sym][0], new):
+                refetch.append(sym)
+            elif sym not in refetch:
+                _apply(sym, interval, new, _covered(gap, new))
+    if refetch:
+        fetched = fetch(refetch, start, end)
+        for sym in refetch:
+            if sym in fetched:
+                _apply(sym, interval, fetched[sym], _covered((start, end), fetched[sym]), replace=True)
+            else:
+                failed.add(sym)
+
+    out: Dict[str, pd.DataFrame] = {}
+    lo, hi = pd.Timestamp(start), pd.Timestamp(end)
+    for sym in stored:
+        if sym in failed:
+            continue
+        frame, _ = read(sym, interval) if sym in touched else stored[sym]
+        assert frame is not None
+        out[sym] = frame[(frame.index >= lo) & (frame.index < hi)]
+    return out
+
+
+def load(symbol: str, start: dt.date, end: dt.date, fetch: Fetch, interval: str = "1d") -> pd.DataFrame:
+    """
+    load_many() for one symbol; `fetch(a, b)` returns its bars for [a, b) and
+    must raise on provider errors.
+    """
+    frames = load_many([symbol], start, end, lambda _syms, a, b: {symbol: fetch(a, b)}, interval)
+    return frames[symbol]
+
+
+def resample_bars(frame: pd.DataFrame, rule: str) -> pd.DataFrame:
+    """OHLCV bars rolled up into `rule` periods (a RESAMPLE_RULES key); periods without bars are dropped."""
+    how = {c: _AGGREGATES.get(c, "last") for c in frame.columns}
+    out = frame.resample(RESAMPLE_RULES[rule]).agg(how)
+    counts = frame["close"].resample(RESAMPLE_RULES[rule]).count() if "close" in frame.columns else None
+    return out[counts > 0] if counts is not None else out.dropna(how="all")
+
+
+def rollup_path(symbol: str, interval: str, rule: str) -> str:
+    return path_for(symbol, interval).replace(".parquet", f"-{rule}.parquet")
+
+
+def rollup(symbol: str, interval: str, rule: str) -> Optional[pd.DataFrame]:
+    """
+    Stored base series of `symbol` rolled up into `rule` periods, from the
+    rollup file when it is current. Only periods from the one holding the last
+    rolled-up bar onwards are recomputed; a changed base (re-adjusted close at
+    that bar, or different first bar) rebuilds it. None if no base is stored.
+    """
+    base, _ = read(symbol, interval)
+    if base is None or base.empty:
+        return None
+    path = rollup_path(symbol, interval, rule)
+    with FileLock(path + ".lock"):
+        old, meta = read_parquet(path, _ROLLUP_KEY)
+        offset = pd.tseries.frequencies.to_offset(RESAMPLE_RULES[rule])
+        current = False
+        if old is not None and meta:
+            last = pd.Timestamp(meta["base_last"])
+            current = (
+                pd.Timestamp(meta["base_first"]) == base.index[0]
+                and last in base.index
+                and abs(float(base.at[last, "close"]) - meta["base_last_close"])
+                <= REVALIDATE_TOLERANCE * abs(meta["base_last_close"])
+            )
+        if current and last == base.index[-1]:
+            return old
+        if current:
+            # The period holding `last` may have been partial: redo it and everything after.
+            period_start = offset.rollforward(last.normalize()) - offset + pd.Timedelta(days=1)
+            fresh = resample_bars(base[base.index >= period_start], rule)
+            frame = pd.concat([old[old.index < fresh.index[0]], fresh]) if len(fresh) else old
+        else:
+            frame = resample_bars(base, rule)
+        meta = {
+            "base_first": base.index[0].isoformat(),
+            "base_last": base.index[-1].isoformat(),
+            "base_last_close": float(base["close"].iloc[-1]),
+        }
+        write_parquet(path, frame, _ROLLUP_KEY, meta)
+    return frame
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+market_stub.py
+
+Local HTTP stand-in for the quote providers, for offline tests and benchmarks.
+
+Serves the two endpoints the scripts use, in the providers' own formats:
+  /v8/finance/chart/<symbol>?range=5d&interval=1d   (Yahoo chart API; also period1/period2)
+  /v7/finance/spark?symbols=A,B&range=1d&interval=1d (Yahoo multi-symbol chart API)
+  /v6/latest/<base>                                 (ExchangeRate-API open access)
+plus the cookie/crumb handshake and quote-info endpoints (/v10/finance/
+quoteSummary, /v7/finance/quote) yfinance uses, so yfinance itself can be
+pointed at the stub (redirect_session(), used when MARKET_STUB_URL is set).
+
+Prices are a deterministic function of symbol and time, so runs are
+repeatable. Symbols starting with "BAD" (or listed via --unknown) answer
+404 like Yahoo does for unknown tickers; --latency and --error-rate
+simulate a slow or flaky provider.
+
+Usage:
+  python scripts/market_stub.py --port 8765 --latency 0.05 --error-rate 0.1
+  MARKET_STUB_URL=http://127.0.0.1:8765 MARKET_PROVIDERS=stub python scripts/market_quote.py AAPL USD/ZAR
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlparse
+
+import market_calendar
+
+# Units per USD; enough currencies to exercise direct, inverse and cross pairs.
+USD_RATES: Dict[str, float] = {
+    "USD": 1.0,
+    "EUR": 0.92,
+    "GBP": 0.79,
+    "ZAR": 18.4,
+    "JPY": 151.0,
+    "CHF": 0.88,
+    "CAD": 1.36,
+    "AUD": 1.52,
+}
+
+_RANGE_SECONDS = {
+    "1d": 86400, "5d": 5 * 86400, "1mo": 31 * 86400, "3mo": 92 * 86400, "6mo": 183 * 86400,
+    "1y": 366 * 86400, "2y": 731 * 86400, "5y": 1827 * 86400, "10y": 3653 * 86400, "max": 3653 * 86400,
+}
+_INTERVAL_SECONDS = {
+    "1m": 60, "2m": 120, "5m": 300, "15m": 900, "30m": 1800, "60m": 3600, "1h": 3600,
+    "1d": 86400, "5d": 5 * 86400, "1wk": 7 * 86400, "1mo": 30 * 86400,
+}
+
+_MAX_BARS = 20_000
+# Regular session in seconds after midnight UTC (09:30-16:00 at the fixed EDT offset the meta reports).
+_GMTOFFSET = -14400
+_SESSION = (9 * 3600 + 1800 - _GMTOFFSET, 16 * 3600 - _GMTOFFSET)
+
+
+def _seed(symbol: str) -> float:
+    return int(hashlib.sha256(symbol.encode("utf-8")).hexdigest()[:8], 16) / 0xFFFFFFFF
+
+
+def price_at(symbol: str, t: float) -> float:
+    """Deterministic price path: per-symbol level, slow weekly wave plus daily wiggle."""
+    h = _seed(symbol)
+    base = 20.0 + 480.0 * h
+    days = t / 86400.0
+    return round(base * (1.0 + 0.05 * math.sin(days / 7.0 + 6.28 * h) + 0.01 * math.sin(days * 6.28 + h)), 4)
+
+
+def chart(
+    symbol: str,
+    range_: str = "1d",
+    interval: str = "1d",
+    now: Optional[float] = None,
+    period: Optional[Tuple[int, int]] = None,
+) -> Dict[str, Any]:
+    """A /v8/finance/chart body with `meta` and OHLCV bars covering `range_` (or `period` = (start, end))."""
+    now = time.time() if now is None else now
+    step = _INTERVAL_SECONDS.get(interval, 86400)
+    if period is not None:
+        first, end = period[0], int(min(period[1], now) // step * step)
+        first = -(-first // step) * step
+    else:
+        end = int(now // step * step)
+        first = end - _RANGE_SECONDS.get(range_, 86400) + step
+    stamps = list(range(first, end + 1, step))[-_MAX_BARS:]
+    if not stamps and period is None:
+        stamps = [end]
+    opens, highs, lows, closes, volumes = [], [], [], [], []
+    for ts in stamps:
+        o, c = price_at(symbol, ts), price_at(symbol, ts + step - 1)
+        opens.append(o)
+        closes.append(c)
+        highs.append(round(max(o, c) * 1.002, 4))
+        lows.append(round(min(o, c) * 0.998, 4))
+        volumes.append(int(1e5 + 9e5 * _seed(f"{symbol}:{ts}")))
+    meta = {
+        "symbol": symbol,
+        "currency": "USD",
+        "exchangeName": "NMS",
+        "instrumentType": "EQUITY",
+        "timezone": "EDT",
+        "gmtoffset": _GMTOFFSET,
+        "exchangeTimezoneName": "America/New_York",
+        "regularMarketPrice": price_at(symbol, now),
+        "regularMarketTime": int(now),
+        "shortName": f"{symbol} (stub)",
+        "priceHint": 2,
+        "dataGranularity": interval,
+        "range": range_,
+        "validRanges": list(_RANGE_SECONDS),
+    }
+    if interval[-1] in "mh" and stamps:
+        # Intraday answers carry the regular session of every day they span; yfinance drops bars outside it.
+        meta["tradingPeriods"] = [
+            [{"timezone": "EDT", "start": day + _SESSION[0], "end": day + _SESSION[1], "gmtoffset": _GMTOFFSET}]
+            for day in range(stamps[0] // 86400 * 86400, stamps[-1] + 1, 86400)
+        ]
+    quote = {"open": opens, "high": highs, "low": lows, "close": closes, "volume": volumes}
+    return {"chart": {"result": [{"meta": meta, "timestamp": stamps, "indicators": {"quote": [quote]}}], "error": None}}
+
+
+def quote_info(symbol: str, now: Optional[float] = None) -> Dict[str, Any]:
+    """The Ticker.info fields market_quote reads, as a /v7/finance/quote result row."""
+    now = time.time() if now is None else now
+    return {
+        "symbol": symbol,
+        "quoteType": "EQUITY",
+        "shortName": f"{symbol} (stub)",
+        "currency": "USD",
+        "exchange": "NMS",
+        "exchangeTimezoneName": "America/New_York",
+        "marketState": "REGULAR" if market_calendar.is_open(market_calendar.US, now, settle=0) else "CLOSED",
+        "regularMarketPrice": price_at(symbol, now),
+        "regularMarketTime": int(now),
+    }
+
+
+def rate_book(base: str, now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    """An ExchangeRate-API /v6/latest body for `base`, or None if the currency is unknown."""
+    if base not in USD_RATES:
+        return None
+    now = time.time() if now is None else now
+    day = int(now // 86400 * 86400)
+    rates = {c: round(r / USD_RATES[base], 6) for c, r in USD_RATES.items()}
+    return {
+        "result": "success",
+        "provider": "market_stub.py",
+        "documentation": "local test data",
+        "base_code": base,
+        "time_last_update_unix": day,
+        "time_last_update_utc": time.strftime("%a, %d %b %Y %H:%M:%S +0000", time.gmtime(day)),
+        "time_next_update_utc": time.strftime("%a, %d %b %Y %H:%M:%S +0000", time.gmtime(day + 86400)),
+        "rates": rates,
+    }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "_Server"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _send(self, status: int, body: Any, content_type: str = "application/json") -> None:
+        data = (json.dumps(body) if content_type == "application/json" else str(body)).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        if not self.path.strip("/"):
+            self.send_header("Set-Cookie", "A3=stub; Path=/")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _unknown(self, symbol: str) -> bool:
+        return symbol.upper().startswith("BAD") or symbol.upper() in self.server.unknown
+
+    def do_GET(self) -> None:
+        srv = self.server
+        srv.count()
+        if srv.latency > 0:
+            time.sleep(random.uniform(0.5, 1.5) * srv.latency)
+        if srv.error_rate > 0 and random.random() < srv.error_rate:
+            self._send(503, {"error": "stub: simulated outage"})
+            return
+
+        url = urlparse(self.path)
+        parts = [unquote(p) for p in url.path.split("/") if p]
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        if parts[:3] == ["v8", "finance", "chart"] and len(parts) == 4:
+            symbol = parts[3]
+            if self._unknown(symbol):
+                err = {"code": "Not Found", "description": "No data found, symbol may be delisted"}
+                self._send(404, {"chart": {"result": None, "error": err}})
+                return
+            period = None
+            if "period1" in params:
+                period = (int(params["period1"]), int(params.get("period2") or time.time()))
+            self._send(200, chart(symbol, params.get("range", "1d"), params.get("interval", "1d"), period=period))
+        elif parts == ["v7", "finance", "spark"]:
+            symbols = [s for s in params.get("symbols", "").split(",") if s and not self._unknown(s)]
+            range_, interval = params.get("range", "1d"), params.get("interval", "1d")
+            rows = [{"symbol": s, "response": chart(s, range_, interval)["chart"]["result"]} for s in symbols]
+            self._send(200, {"spark": {"result": rows, "error": None}})
+        elif parts[:2] == ["v6", "latest"] and len(parts) == 3:
+            book = rate_book(parts[2].upper())
+            if book is None:
+                self._send(404, {"result": "error", "error-type": "unsupported-code"})
+                return
+            self._send(200, book)
+        elif parts[:3] == ["v10", "finance", "quoteSummary"] and len(parts) == 4:
+            if self._unknown(parts[3]):
+                err = {"code": "Not Found", "description": "Quote not found for symbol: " + parts[3]}
+                self._send(404, {"quoteSummary": {"result": None, "error": err}})
+                return
+            # quoteType is the one module every symbol has; the rest of the info comes from /v7/finance/quote.
+            qt = {"quoteType": "EQUITY", "symbol": parts[3], "shortName": f"{parts[3]} (stub)"}
+            self._send(200, {"quoteSummary": {"result": [{"quoteType": qt}], "error": None}})
+        elif parts == ["v7", "finance", "quote"]:
+            symbols = [s for s in params.get("symbols", "").split(",") if s and not self._unknown(s)]
+            self._send(200, {"quoteResponse": {"result": [quote_info(s) for s in symbols], "error": None}})
+        elif parts == ["v1", "test", "getcrumb"]:
+            self._send(200, "stubcrumb", content_type="text/plain")
+        elif not parts:
+            # yfinance's cookie request (fc.yahoo.com); the response sets a cookie.
+            self._send(200, "", content_type="text/plain")
+        else:
+            self._send(404, {"error": "stub: unknown endpoint"})
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self, addr: Tuple[str, int], latency: float, error_rate: float, unknown: FrozenSet[str]
+    ) -> None:
+        super().__init__(addr, _Handler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.unknown = unknown
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def count(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def start(
+    port: int = 0,
+    host: str = "127.0.0.1",
+    latency: float = 0.0,
+    error_rate: float = 0.0,
+    unknown: Optional[List[str]] = None,
+) -> _Server:
+    """Run a stub server on a background thread (port 0 picks a free one); see `.url`, `.requests`."""
+    server = _Server((host, port), latency, error_rate, frozenset(s.upper() for s in unknown or []))
+    threading.Thread(target=server.serve_forever, name="market-stub", daemon=True).start()
+    return server
+
+
+def redirect_session(url: str) -> Any:
+    """requests.Session sending every request (any host, e.g. Yahoo's) to the stub at `url`."""
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    target = urlparse(url)
+
+    class RedirectAdapter(HTTPAdapter):
+        def send(self, request: Any, **kwargs: Any) -> Any:
+            request.url = urlparse(request.url)._replace(scheme=target.scheme, netloc=target.netloc).geturl()
+            return super().send(request, **kwargs)
+
+    session = requests.Session()
+    session.mount("https://", RedirectAdapter())
+    session.mount("http://", RedirectAdapter())
+    return session
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765, help="0 picks a free port")
+    ap.add_argument("--latency", type=float, default=0.0, help="Mean response delay in seconds")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+    ap.add_argument("--unknown", nargs="*", default=[], help="Extra symbols to treat as unknown")
+    args = ap.parse_args()
+
+    server = _Server((args.host, args.port), args.latency, args.error_rate, frozenset(s.upper() for s in args.unknown))
+    print(json.dumps({"ok": True, "url": server.url}), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
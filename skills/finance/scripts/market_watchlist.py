@@ -2,13 +2,20 @@
 """
 market_watchlist.py
 
-Maintain a local watchlist and summarize current quotes.
+Maintain a local watchlist, summarize current quotes, report rolling risk
+(volatility / correlation) from the stored daily series, and value an
+optional holdings file (market_portfolio.py) in one reporting currency.
 
 Usage:
   python scripts/market_watchlist.py add AAPL MSFT USD/ZAR
   python scripts/market_watchlist.py remove MSFT
   python scripts/market_watchlist.py list
   python scripts/market_watchlist.py summary
+  python scripts/market_watchlist.py summary --workers 16 --timeout 20
+  python scripts/market_watchlist.py risk
+  python scripts/market_watchlist.py risk --window 126 --covariance --output risk.json
+  python scripts/market_watchlist.py value --currency ZAR
+  python scripts/market_watchlist.py value --holdings my-holdings.csv
 """
 
 from __future__ import annotations
@@ -16,13 +23,17 @@ from __future__ import annotations
 import argparse
 import json
 import os
-import subprocess
-import sys
-from typing import List
+import threading
+from typing import Any, Dict, List, Optional, Set
 
 WATCHLIST_PATH = os.path.join(".cache", "market-tracker", "watchlist.json")
 os.makedirs(os.path.dirname(WATCHLIST_PATH), exist_ok=True)
 
+DEFAULT_SUMMARY_WORKERS = 8
+DEFAULT_SUMMARY_TIMEOUT_SECONDS = 30.0
+# Trading days in the `risk` rolling window (market_risk.DEFAULT_WINDOW; not imported to keep add/list light).
+DEFAULT_RISK_WINDOW = 63
+
 
 def load_watchlist() -> List[str]:
     if not os.path.exists(WATCHLIST_PATH):
@@ -68,31 +79,87 @@ def cmd_list() -> None:
     print(json.dumps({"items": load_watchlist()}, indent=2))
 
 
-def cmd_summary() -> None:
+def cmd_summary(
+    workers: int = DEFAULT_SUMMARY_WORKERS,
+    timeout: float = DEFAULT_SUMMARY_TIMEOUT_SECONDS,
+    swr: bool = False,
+    enrich: Optional[bool] = None,
+    negative_ttl: Optional[int] = None,
+) -> None:
     items = load_watchlist()
     if not items:
         print(json.dumps({"items": [], "summary": []}, indent=2))
         return
 
-    results = []
-    for sym in items:
-        # Call market_quote.py to keep logic centralized
-        p = subprocess.run(
-            [sys.executable, os.path.join(os.path.dirname(__file__), "market_quote.py"), sym],
-            capture_output=True,
-            text=True,
-        )
-        if p.returncode != 0:
-            results.append({"symbol": sym, "error": p.stderr.strip() or p.stdout.strip()})
-            continue
+    # Import once and quote in-process: keeps logic centralized in market_quote.py
+    # without paying interpreter + requests/yfinance startup per symbol.
+    import market_quote
+
+    if swr:
+        market_quote.STALE_WHILE_REVALIDATE = True
+    if negative_ttl is not None:
+        market_quote.NEGATIVE_TTL_SECONDS = negative_ttl
+    market_quote.STOCK_WORKERS = market_quote.META_WORKERS = max(1, workers)
+
+    # One batch (spark requests, shared FX books, bulk metadata) under one
+    # deadline for the whole summary.
+    errors: Dict[str, str] = {}
+    cached_errors: Set[str] = set()
+    done: Dict[str, Any] = {}
+
+    def run() -> None:
         try:
-            results.append(json.loads(p.stdout))
-        except Exception:
-            results.append({"symbol": sym, "error": "Invalid JSON from market_quote.py", "raw": p.stdout[:500]})
+            done["quotes"] = market_quote.fetch_quotes(items, errors=errors, enrich=enrich, cached_errors=cached_errors)
+        except Exception as e:
+            done["error"] = str(e)
+
+    # Daemon thread: a fetch still running at the deadline does not hold up exit.
+    worker = threading.Thread(target=run, name="watchlist-summary", daemon=True)
+    worker.start()
+    worker.join(timeout)
+
+    if worker.is_alive():
+        results = [{"symbol": s, "error": f"Timed out after {timeout:g}s", "cached_error": False} for s in items]
+    elif "error" in done:
+        results = [{"symbol": s, "error": done["error"], "cached_error": False} for s in items]
+    else:
+        # cached_error: answered from the negative cache without asking the provider.
+        results = market_quote.quote_results(items, done["quotes"], errors, cached_errors)
 
     print(json.dumps({"items": items, "summary": results}, ensure_ascii=False, indent=2))
 
 
+def cmd_risk(window: int, covariance: bool = False, use_cache: bool = True, output: Optional[str] = None) -> None:
+    items = load_watchlist()
+    if not items:
+        print(json.dumps({"items": [], "volatility": [], "correlation": []}, indent=2))
+        return
+
+    # numpy/pandas/yfinance are only needed here, not for add/list/summary.
+    import market_risk
+
+    report = market_risk.risk(items, window, use_cache=use_cache, covariance=covariance)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+def cmd_value(holdings_path: Optional[str], currency: Optional[str]) -> None:
+    import market_portfolio
+
+    path = holdings_path or market_portfolio.HOLDINGS_PATH
+    if not os.path.exists(path):
+        raise SystemExit(f"No holdings file at {path} (CSV with columns symbol,quantity,cost_basis,cost_currency)")
+    try:
+        holdings = market_portfolio.load_holdings(path)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    report = market_portfolio.value(holdings, currency or market_portfolio.DEFAULT_CURRENCY)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
 def main() -> None:
     ap = argparse.ArgumentParser()
     sub = ap.add_subparsers(dest="cmd", required=True)
@@ -104,7 +171,29 @@ def main() -> None:
     sp_rm.add_argument("symbols", nargs="+")
 
     sub.add_parser("list")
-    sub.add_parser("summary")
+    sp_sum = sub.add_parser("summary")
+    sp_sum.add_argument("--workers", type=int, default=DEFAULT_SUMMARY_WORKERS, help="Concurrent provider requests")
+    sp_sum.add_argument("--timeout", type=float, default=DEFAULT_SUMMARY_TIMEOUT_SECONDS, help="Overall timeout (seconds)")
+    sp_sum.add_argument("--swr", action="store_true", help="Serve slightly stale quotes and refresh in the background")
+    sp_sum.add_argument(
+        "--enrich",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="Fetch name/exchange metadata the quote lacks (off by default: only cached metadata is used)",
+    )
+    sp_sum.add_argument(
+        "--negative-ttl", type=int, default=None, help="Seconds to remember symbols with no quote (0 = off)"
+    )
+
+    sp_risk = sub.add_parser("risk")
+    sp_risk.add_argument("--window", type=int, default=DEFAULT_RISK_WINDOW, help="Trading days in the rolling window")
+    sp_risk.add_argument("--covariance", action="store_true", help="Also report the annualized covariance matrix")
+    sp_risk.add_argument("--no-cache", action="store_true", help="Recompute from scratch; do not read or write the cache")
+    sp_risk.add_argument("--output", "-o", metavar="PATH", help="Also write the JSON report to PATH")
+
+    sp_value = sub.add_parser("value")
+    sp_value.add_argument("--holdings", metavar="PATH", help="Holdings CSV (default .cache/market-tracker/holdings.csv)")
+    sp_value.add_argument("--currency", help="Reporting currency (default USD)")
 
     args = ap.parse_args()
 
@@ -115,7 +204,13 @@ def main() -> None:
     elif args.cmd == "list":
         cmd_list()
     elif args.cmd == "summary":
-        cmd_summary()
+        cmd_summary(args.workers, args.timeout, args.swr, args.enrich, args.negative_ttl)
+    elif args.cmd == "risk":
+        if args.window < 2:
+            raise SystemExit("--window must be at least 2")
+        cmd_risk(args.window, args.covariance, not args.no_cache, args.output)
+    elif args.cmd == "value":
+        cmd_value(args.holdings, args.currency)
     else:
         raise SystemExit("Unknown command")
 